@@ -0,0 +1,177 @@
+"""Бенчмарк операций GoogleSheetsService на локальной заглушке таблицы
+
+Запуск:
+    python -m benchmarks.bench_services --sizes 1000,100000,1000000
+    python -m benchmarks.bench_services --sizes 1000 --compare benchmarks/results/<файл>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from benchmarks.fakes import FakeSpreadsheet
+from config import config
+from models.budget import Budget
+from models.transaction import Transaction
+from services.google_sheets import GoogleSheetsService
+from services.partitions import CATALOG_HEADERS, CATALOG_SHEET, LEGACY_SHEET, partition_month, partition_title
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+HEADERS = [
+    "uuid", "date", "type", "category", "subcategory",
+    "amount", "currency", "description", "source", "created_at"
+]
+CATEGORIES = [
+    "маркетинг", "зарплата", "аренда", "продукты", "транспорт",
+    "оборудование", "услуги", "развлечения", "налоги", "прочее"
+]
+DESCRIPTIONS = ["обед в кафе", "такси до офиса", "реклама в соцсетях", "аренда офиса", "подписка на сервис"]
+
+
+def generate_rows(count: int, seed: int = 42, days: int = 730):
+    """Синтетические строки листа Transactions"""
+    rng = random.Random(seed)
+    today = datetime.now()
+    rows = []
+    for _ in range(count):
+        is_income = rng.random() < 0.2
+        date = (today - timedelta(days=rng.randrange(days))).strftime('%Y-%m-%d')
+        rows.append([
+            str(uuid.UUID(int=rng.getrandbits(128))),
+            date,
+            "income" if is_income else "expense",
+            "зарплата" if is_income else rng.choice(CATEGORIES),
+            "",
+            round(rng.uniform(100, 100000 if is_income else 10000), 2),
+            "RUB",
+            rng.choice(DESCRIPTIONS),
+            "telegram",
+            f"{date}T12:00:00"
+        ])
+    return rows
+
+
+def build_spreadsheet(rows, user_id: int, partitioned: bool = True) -> FakeSpreadsheet:
+    """Таблица с транзакциями по месячным партициям (или одним листом Transactions) и бюджетами"""
+    spreadsheet = FakeSpreadsheet()
+    if partitioned:
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(partition_month(row[1]), []).append(row)
+        catalog = spreadsheet.add_worksheet(CATALOG_SHEET)
+        catalog.rows = [list(CATALOG_HEADERS)]
+        for month, month_rows in sorted(by_month.items()):
+            title = partition_title(month)
+            spreadsheet.add_worksheet(title).rows = [list(HEADERS)] + month_rows
+            catalog.rows.append([month, title, datetime.now().isoformat()])
+    else:
+        spreadsheet.add_worksheet(LEGACY_SHEET).rows = [list(HEADERS)] + rows
+    budgets = spreadsheet.add_worksheet("Budgets")
+    budgets.rows = [["user_id", "category", "amount", "period", "created_at", "updated_at"]]
+    for category in CATEGORIES[:5]:
+        budget = Budget(user_id=user_id, category=category, amount=50000, period="monthly")
+        budgets.rows.append([budget.user_id, budget.category, budget.amount, budget.period,
+                             budget.created_at, budget.updated_at])
+    return spreadsheet
+
+
+async def _timeit(func, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await func()
+        timings.append(time.perf_counter() - start)
+    return {"min": min(timings), "median": statistics.median(timings), "repeat": repeat}
+
+
+async def run_size(size: int, repeat: int, user_id: int = 1, partitioned: bool = True):
+    rows = generate_rows(size)
+    target_uuid = rows[-1][0] if rows else ""
+    sheets = GoogleSheetsService(sheet=build_spreadsheet(rows, user_id, partitioned))
+
+    async def add_transaction():
+        transaction = Transaction.create_from_text("расход 1500 обед в кафе", {
+            "type": "expense", "amount": 1500, "category": "развлечения", "description": "обед в кафе"
+        })
+        await sheets.add_transaction(transaction)
+
+    operations = {
+        "add_transaction": add_transaction,
+        "get_financial_stats": lambda: sheets.get_financial_stats("month"),
+        "search_transactions": lambda: sheets.search_transactions("такси", user_id),
+        "get_budget_status": lambda: sheets.get_budget_status(user_id),
+        "edit_transaction": lambda: sheets.edit_transaction(target_uuid, {"description": "исправлено"}),
+    }
+
+    results = {}
+    for name, func in operations.items():
+        results[name] = await _timeit(func, repeat)
+        print(f"  {name:<22} {results[name]['median'] * 1000:10.1f} ms (min {results[name]['min'] * 1000:.1f})")
+    return results
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(current: dict, baseline_path: str):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nСравнение с {baseline_path} ({baseline.get('revision')}):")
+    for size, operations in current["results"].items():
+        for name, timing in operations.items():
+            old = baseline.get("results", {}).get(size, {}).get(name)
+            if not old:
+                continue
+            ratio = timing["median"] / old["median"] if old["median"] else float("inf")
+            print(f"  {size:>8} {name:<22} x{ratio:.2f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк GoogleSheetsService")
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="размеры листа через запятую")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="файл результатов (по умолчанию benchmarks/results/<время>.json)")
+    parser.add_argument("--compare", help="файл предыдущих результатов для сравнения")
+    parser.add_argument("--no-cache", action="store_true", help="отключить кэш чтения (каждый вызов читает лист)")
+    parser.add_argument("--legacy", action="store_true", help="все строки в одном листе Transactions, без партиций")
+    args = parser.parse_args()
+
+    if args.no_cache:
+        config.SHEETS_CACHE_TTL = 0
+
+    report = {
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "created_at": datetime.now().isoformat(),
+        "cache": not args.no_cache,
+        "partitioned": not args.legacy,
+        "results": {}
+    }
+    for size in (int(s) for s in args.sizes.split(",")):
+        print(f"Строк: {size}")
+        report["results"][str(size)] = await run_size(size, args.repeat, partitioned=not args.legacy)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{report['revision']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты сохранены: {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
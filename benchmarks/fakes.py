@@ -0,0 +1,228 @@
+"""Локальные заглушки Google Sheets и OpenRouter для бенчмарков и офлайн-прогонов"""
+import asyncio
+import json
+import time
+
+from gspread.cell import Cell
+from gspread.exceptions import WorksheetNotFound
+from gspread.utils import numericise
+
+
+def _formatted(value) -> str:
+    """Отображение значения ячейки как в FORMATTED_VALUE"""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return "" if value is None else str(value)
+
+
+class FakeWorksheet:
+    """Лист в памяти, совместимый с используемыми методами gspread.Worksheet"""
+
+    def __init__(self, title: str, rows=None, latency: float = 0.0):
+        self.title = title
+        self.rows = [list(r) for r in rows or []]
+        self.latency = latency
+        self.calls = {}
+
+    def _call(self, name: str):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    @property
+    def row_count(self) -> int:
+        return len(self.rows)
+
+    def get_all_values(self, value_render_option=None, **kwargs):
+        self._call("get_all_values")
+        render = getattr(value_render_option, "value", value_render_option)
+        if render in ("UNFORMATTED_VALUE", "FORMULA"):
+            return [list(r) for r in self.rows]
+        return [[_formatted(v) for v in r] for r in self.rows]
+
+    def get_values(self, *args, **kwargs):
+        return self.get_all_values(**kwargs)
+
+    def row_values(self, row: int, **kwargs):
+        self._call("row_values")
+        if row > len(self.rows):
+            return []
+        values = [_formatted(v) for v in self.rows[row - 1]]
+        while values and values[-1] == "":
+            values.pop()
+        return values
+
+    def get_all_records(self, head: int = 1, default_blank="", **kwargs):
+        self._call("get_all_records")
+        if len(self.rows) < head:
+            return []
+        keys = [_formatted(v) for v in self.rows[head - 1]]
+        records = []
+        for row in self.rows[head:]:
+            values = [numericise(_formatted(v), default_blank=default_blank) for v in row]
+            values.extend([default_blank] * (len(keys) - len(values)))
+            records.append(dict(zip(keys, values)))
+        return records
+
+    def append_row(self, values, **kwargs):
+        self._call("append_row")
+        self.rows.append(list(values))
+        return {"updates": {"updatedRows": 1}}
+
+    def append_rows(self, values, **kwargs):
+        self._call("append_rows")
+        self.rows.extend(list(v) for v in values)
+        return {"updates": {"updatedRows": len(values)}}
+
+    def find(self, query, in_row=None, in_column=None, case_sensitive=True):
+        self._call("find")
+        for r, row in enumerate(self.rows, start=1):
+            if in_row is not None and r != in_row:
+                continue
+            for c, value in enumerate(row, start=1):
+                if in_column is not None and c != in_column:
+                    continue
+                if _formatted(value) == query:
+                    return Cell(r, c, _formatted(value))
+        return None
+
+    def update_cell(self, row: int, col: int, value):
+        self._call("update_cell")
+        while len(self.rows) < row:
+            self.rows.append([])
+        target = self.rows[row - 1]
+        target.extend([""] * (col - len(target)))
+        target[col - 1] = value
+        return {"updatedCells": 1}
+
+    def delete_rows(self, start_index: int, end_index: int = None):
+        self._call("delete_rows")
+        end_index = end_index or start_index
+        del self.rows[start_index - 1:end_index]
+        return {}
+
+    def clear(self):
+        self._call("clear")
+        self.rows = []
+        return {}
+
+    def update_title(self, title: str):
+        self._call("update_title")
+        self.title = title
+        return {}
+
+
+class FakeSpreadsheet:
+    """Таблица в памяти, совместимая с используемыми методами gspread.Spreadsheet"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._worksheets = []
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        for worksheet in self._worksheets:
+            if worksheet.title == title:
+                return worksheet
+        raise WorksheetNotFound(title)
+
+    def worksheets(self):
+        return list(self._worksheets)
+
+    def values_batch_get(self, ranges, params=None):
+        """Значения нескольких листов одним вызовом; поддерживаются диапазоны вида 'Лист'"""
+        render = (params or {}).get("valueRenderOption")
+        value_ranges = []
+        for name in ranges:
+            title = name.split("!", 1)[0]
+            if title.startswith("'") and title.endswith("'"):
+                title = title[1:-1].replace("''", "'")
+            values = self.worksheet(title).get_all_values(value_render_option=render)
+            value_range = {"range": name, "majorDimension": "ROWS"}
+            if values:
+                value_range["values"] = values
+            value_ranges.append(value_range)
+        return {"valueRanges": value_ranges}
+
+    def add_worksheet(self, title: str, rows=1000, cols=26, index=None):
+        if any(ws.title == title for ws in self._worksheets):
+            raise ValueError(f"A sheet with the name \"{title}\" already exists")
+        worksheet = FakeWorksheet(title, latency=self.latency)
+        self._worksheets.append(worksheet)
+        return worksheet
+
+    def del_worksheet(self, worksheet):
+        self._worksheets = [ws for ws in self._worksheets if ws is not worksheet]
+
+
+async def _fake_chat_completion(request, latency: float):
+    from aiohttp import web
+
+    payload = await request.json()
+    await asyncio.sleep(latency)
+    prompt = payload["messages"][-1]["content"]
+    if "верни JSON" in prompt or "Верни ТОЛЬКО JSON" in prompt:
+        content = json.dumps({
+            "type": "expense",
+            "amount": 1500,
+            "currency": "RUB",
+            "category": "развлечения",
+            "subcategory": None,
+            "date": time.strftime("%Y-%m-%d"),
+            "description": "обед в кафе"
+        }, ensure_ascii=False)
+    else:
+        content = "📊 Финансы стабильны. 💡 Сократите расходы на развлечения."
+    return web.json_response({
+        "id": "fake",
+        "model": payload.get("model"),
+        "choices": [{"message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4}
+    })
+
+
+async def _fake_keys(request, latency: float):
+    from aiohttp import web
+
+    await asyncio.sleep(latency)
+    if request.method == "POST":
+        key_hash = f"hash-{time.time_ns()}"
+        return web.json_response({"key": f"sk-or-fake-{key_hash}", "hash": key_hash, "data": {"hash": key_hash}})
+    if request.method == "GET" and "hash" in request.match_info:
+        return web.json_response({"data": {"hash": request.match_info["hash"], "usage": 0, "limit": 100, "limit_remaining": 100}})
+    if request.method == "GET":
+        return web.json_response({"data": []})
+    return web.json_response({"data": {}})
+
+
+async def start_fake_openrouter(host: str = "127.0.0.1", port: int = 8089, latency: float = 0.2):
+    """Запускает фейковый OpenRouter; base_url сервиса - http://host:port/api/v1"""
+    from aiohttp import web
+
+    app = web.Application()
+    app.router.add_post("/api/v1/chat/completions", lambda r: _fake_chat_completion(r, latency))
+    app.router.add_route("*", "/api/v1/keys", lambda r: _fake_keys(r, latency))
+    app.router.add_route("*", "/api/v1/keys/{hash}", lambda r: _fake_keys(r, latency))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    return runner
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Фейковый OpenRouter API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.2, help="задержка ответа, секунды")
+    args = parser.parse_args()
+
+    async def serve():
+        await start_fake_openrouter(args.host, args.port, args.latency)
+        print(f"Fake OpenRouter: OPENROUTER_BASE_URL=http://{args.host}:{args.port}/api/v1")
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
@@ -0,0 +1,191 @@
+"""Нагрузочный прогон: синтетические Telegram-апдейты прямо в Dispatcher из main.py
+
+Сервисы работают на локальных заглушках (таблица в памяти и фейковый OpenRouter),
+исходящие сообщения записывает фейковая сессия бота.
+
+Запуск:
+    python -m benchmarks.load --users 50 --scenarios 20 --rows 10000 --llm-latency 0.3
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import statistics
+import time
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetMe
+from aiogram.types import Chat, Message, Update, User
+
+from benchmarks.bench_services import build_spreadsheet, generate_rows
+from benchmarks.fakes import start_fake_openrouter
+from config import config
+from services import registry
+from services.metrics import metrics
+
+BOT_USER = User(id=42, is_bot=True, first_name="FinCopilot", username="fincopilot_bot")
+
+# Сценарии: последовательности сообщений одного пользователя и их веса
+SCENARIOS = {
+    "transaction": (50, [
+        "расход 1500 обед в кафе",
+    ]),
+    "report": (10, [
+        "/report",
+    ]),
+    "search": (15, [
+        "/search",
+        "такси",
+    ]),
+    "budget_status": (10, [
+        "📈 Статус бюджетов",
+    ]),
+    "budget_set": (10, [
+        "📊 Установить бюджет",
+        "продукты",
+        "30000",
+        "📅 Месячный",
+    ]),
+    "top": (5, [
+        "/top",
+    ]),
+}
+
+
+class RecordingSession(BaseSession):
+    """Сессия бота, которая не ходит в сеть, а запоминает исходящие вызовы"""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.sent = []
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot, method, timeout=None):
+        self.sent.append(method)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if isinstance(method, GetMe):
+            return BOT_USER
+        if method.__returning__ is Message:
+            return Message(
+                message_id=next(self._message_ids),
+                date=datetime.now(),
+                chat=Chat(id=getattr(method, "chat_id", 0), type="private"),
+                from_user=BOT_USER,
+                text=getattr(method, "text", None)
+            ).as_(bot)
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def make_update(update_id: int, user_id: int, text: str) -> Update:
+    return Update(
+        update_id=update_id,
+        message=Message(
+            message_id=update_id,
+            date=datetime.now(),
+            chat=Chat(id=user_id, type="private"),
+            from_user=User(id=user_id, is_bot=False, first_name=f"User{user_id}"),
+            text=text
+        )
+    )
+
+
+async def _measure_loop_lag(samples: list, interval: float = 0.01):
+    """Запоминает, насколько позже запланированного просыпается цикл событий"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - expected))
+
+
+def _percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_load(users: int, scenarios_per_user: int, seed: int = 1):
+    from main import build_dispatcher
+
+    dp = build_dispatcher()
+    session = RecordingSession()
+    bot = Bot(token="42:FAKE-LOAD-TOKEN", session=session)
+
+    rng = random.Random(seed)
+    names = list(SCENARIOS)
+    weights = [SCENARIOS[name][0] for name in names]
+    update_ids = itertools.count(1)
+    latencies = []
+    by_scenario = {name: [] for name in names}
+
+    async def virtual_user(user_id: int):
+        for _ in range(scenarios_per_user):
+            scenario = rng.choices(names, weights)[0]
+            for text in SCENARIOS[scenario][1]:
+                start = time.perf_counter()
+                await dp.feed_update(bot, make_update(next(update_ids), user_id, text))
+                elapsed = time.perf_counter() - start
+                latencies.append(elapsed)
+                by_scenario[scenario].append(elapsed)
+
+    lag_samples = []
+    lag_task = asyncio.create_task(_measure_loop_lag(lag_samples))
+    started = time.perf_counter()
+    await asyncio.gather(*(virtual_user(1000 + i) for i in range(users)))
+    duration = time.perf_counter() - started
+    lag_task.cancel()
+
+    print(f"\nОбработано апдейтов: {len(latencies)} за {duration:.2f} с "
+          f"({len(latencies) / duration:.1f} сообщений/с), ответов бота: {len(session.sent)}")
+    print(f"Задержка end-to-end: p50 {_percentile(latencies, 0.5) * 1000:.1f} мс, "
+          f"p95 {_percentile(latencies, 0.95) * 1000:.1f} мс, p99 {_percentile(latencies, 0.99) * 1000:.1f} мс")
+    print(f"Лаг цикла событий: p99 {_percentile(lag_samples, 0.99) * 1000:.1f} мс, "
+          f"max {max(lag_samples, default=0) * 1000:.1f} мс")
+    print("\nПо сценариям (медиана на сообщение):")
+    for name, values in by_scenario.items():
+        if values:
+            print(f"  {name:<14} {len(values):6d}  {statistics.median(values) * 1000:8.1f} мс")
+    print()
+    print(metrics.summary())
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон диспетчера FinCopilot")
+    parser.add_argument("--users", type=int, default=20, help="одновременных пользователей (конкурентность)")
+    parser.add_argument("--scenarios", type=int, default=10, help="сценариев на пользователя")
+    parser.add_argument("--rows", type=int, default=10000, help="строк транзакций (по месячным партициям)")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="задержка фейкового OpenRouter, с")
+    parser.add_argument("--port", type=int, default=8089, help="порт фейкового OpenRouter")
+    args = parser.parse_args()
+
+    runner = await start_fake_openrouter(port=args.port, latency=args.llm_latency)
+    config.OPENROUTER_BASE_URL = f"http://127.0.0.1:{args.port}/api/v1"
+
+    from services.google_sheets import GoogleSheetsService
+    from services.openrouter import OpenRouterService
+
+    registry.override(
+        sheets=GoogleSheetsService(sheet=build_spreadsheet(generate_rows(args.rows), user_id=1000)),
+        openrouter=OpenRouterService()
+    )
+    try:
+        await run_load(args.users, args.scenarios)
+    finally:
+        # HTTP-сессии сервисов (OpenRouter, Provisioning) закрываются до остановки фейкового сервера
+        await registry.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+from aiogram import Router, F
+from aiogram.types import Message
+from aiogram.filters import Command
+
+from config import config
+from services.metrics import metrics
+from services.profiler import profiler
+from services.registry import get_sheets_service, get_user_manager
+from services.startup import startup
+
+router = Router()
+# Команды роутера доступны только администраторам из ADMIN_IDS
+router.message.filter(F.from_user.id.in_(config.ADMIN_IDS))
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message):
+    """Показывает метрики задержек обработчиков и бэкендов"""
+    await message.answer(f"{metrics.summary()}\n🚀 Запуск: {startup.summary()}")
+
+@router.message(Command("prof"))
+async def cmd_profile_window(message: Message):
+    """Сэмплирует работу бота в течение окна: /prof [секунды]"""
+    parts = message.text.split()
+    try:
+        seconds = min(float(parts[1]), 300) if len(parts) > 1 else 30
+    except ValueError:
+        await message.answer("❌ Использование: /prof [секунды]")
+        return
+    
+    if profiler.window_active:
+        await message.answer("⏳ Профилирование уже идет")
+        return
+    
+    await message.answer(f"🔬 Профилирование на {seconds:.0f} с запущено")
+    summary = await profiler.profile_window(seconds)
+    await message.answer(f"✅ Профиль готов:\n{summary}")
+
+@router.message(Command("migrate_partitions"))
+async def cmd_migrate_partitions(message: Message):
+    """Переносит лист Transactions в помесячные партиции"""
+    await message.answer("⏳ Перенос транзакций по месяцам...")
+    try:
+        moved = await get_sheets_service().migrate_legacy_transactions()
+    except Exception as e:
+        await message.answer(f"❌ Ошибка переноса: {str(e)}")
+        return
+    await message.answer(f"✅ Перенесено строк: {moved}")
+
+@router.message(Command("compact"))
+async def cmd_compact(message: Message):
+    """Архивирует закрытые месяцы: /compact [оставить месяцев]"""
+    parts = message.text.split()
+    try:
+        keep_months = int(parts[1]) if len(parts) > 1 else (config.ARCHIVE_AFTER_MONTHS or 3)
+    except ValueError:
+        await message.answer("❌ Использование: /compact [месяцев в таблице]")
+        return
+    
+    await message.answer(f"⏳ Архивирование месяцев старше {keep_months}...")
+    try:
+        archived = await get_sheets_service().compact_transactions(keep_months)
+    except Exception as e:
+        await message.answer(f"❌ Ошибка архивирования: {str(e)}")
+        return
+    if archived:
+        await message.answer(f"✅ В архив перенесены: {', '.join(archived)}")
+    else:
+        await message.answer("✅ Архивировать нечего")
+
+@router.message(Command("keys"))
+async def cmd_keys(message: Message):
+    """Использование личных ключей пользователей (из кэша, без запросов к API)"""
+    await message.answer(get_user_manager().usage.summary())
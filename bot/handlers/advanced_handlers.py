@@ -1,17 +1,28 @@
 from aiogram import Router, F
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+from aiogram.types import FSInputFile, Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from services.google_sheets import GoogleSheetsService
-from services.openrouter import OpenRouterService
+from bot.handlers.reports import send_charts
+from config import config
+from services.registry import get_sheets_service, get_openrouter_service
+from services.anomalies import detector
+from services.charts import categories_chart
+from services.forecast import forecaster
+from services.export import EXPORT_FORMATS, export_transactions
+from services.google_sheets import previous_bounds
 from models.budget import Budget
 from datetime import datetime, timedelta
+import os
 import re
 
 router = Router()
 
+# Периоды выгрузки в днях (None - вся история) и предел размера документа в Bot API
+EXPORT_PERIODS = {"week": 7, "month": 30, "year": 365, "all": None}
+EXPORT_MAX_BYTES = 50 * 1024 * 1024
+
 class BudgetStates(StatesGroup):
     waiting_for_category = State()
     waiting_for_amount = State()
@@ -94,7 +105,7 @@ async def process_budget_period(message: Message, state: FSMContext):
         period=period
     )
     
-    sheets = GoogleSheetsService()
+    sheets = get_sheets_service()
     await sheets.set_budget(budget)
     
     await message.answer(
@@ -108,13 +119,17 @@ async def process_budget_period(message: Message, state: FSMContext):
 
 @router.message(F.text == "📈 Статус бюджетов")
 async def show_budget_status(message: Message):
-    sheets = GoogleSheetsService()
+    sheets = get_sheets_service()
     status = await sheets.get_budget_status(message.from_user.id)
     
     if not status:
         await message.answer("📊 Бюджеты не установлены")
         return
     
+    # Прогноз по модели денежного потока: когда при текущем темпе закончится бюджет
+    exhaustion = await forecaster.exhaustion_dates(sheets, status)
+    forecast = await forecaster.month_end(sheets)
+    
     text = "📊 Статус бюджетов:\n\n"
     overspent_categories = []
     
@@ -123,13 +138,18 @@ async def show_budget_status(message: Message):
         text += f"{emoji} {item['category'].title()}:\n"
         text += f"   Бюджет: {item['budget']:.2f} руб\n"
         text += f"   Потрачено: {item['spent']:.2f} руб\n"
-        text += f"   Остаток: {item['remaining']:.2f} руб\n\n"
+        text += f"   Остаток: {item['remaining']:.2f} руб\n"
+        if exhaustion.get(item['category']):
+            text += f"   ⏳ Закончится примерно {exhaustion[item['category']].strftime('%d.%m.%Y')}\n"
+        text += "\n"
         
         if item['overspent']:
             overspent_categories.append(item['category'])
     
     if overspent_categories:
-        text += f"⚠️ Перерасход в категориях: {', '.join(overspent_categories)}"
+        text += f"⚠️ Перерасход в категориях: {', '.join(overspent_categories)}\n\n"
+    if forecast is not None:
+        text += forecast.text
     
     await message.answer(text)
 
@@ -142,7 +162,7 @@ async def cmd_search(message: Message, state: FSMContext):
 
 @router.message(SearchStates.waiting_for_query)
 async def process_search_query(message: Message, state: FSMContext):
-    sheets = GoogleSheetsService()
+    sheets = get_sheets_service()
     results = await sheets.search_transactions(message.text, message.from_user.id)
     
     if not results:
@@ -186,11 +206,14 @@ async def process_end_date(message: Message, state: FSMContext):
     end_date = message.text
     
     try:
-        sheets = GoogleSheetsService()
-        openrouter = OpenRouterService()
+        sheets = get_sheets_service()
+        openrouter = get_openrouter_service()
         
         stats = await sheets.get_financial_stats("custom", start_date, end_date)
-        report = await openrouter.generate_report(stats, f"период {start_date} - {end_date}")
+        previous = await sheets.get_financial_stats("custom", *previous_bounds(start_date, end_date))
+        report = await openrouter.generate_report(
+            stats, f"период {start_date} - {end_date}", previous, message.from_user.id
+        )
         
         await message.answer(report)
         
@@ -202,13 +225,13 @@ async def process_end_date(message: Message, state: FSMContext):
 @router.message(Command("fix"))
 async def cmd_fix(message: Message):
     """Анализ и исправление финансовых проблем"""
-    sheets = GoogleSheetsService()
-    openrouter = OpenRouterService()
+    sheets = get_sheets_service()
+    openrouter = get_openrouter_service()
     
     try:
-        # Получаем последние транзакции для анализа
-        transactions = await sheets.get_transactions()
         budgets_status = await sheets.get_budget_status(message.from_user.id)
+        # Всплески, крупные новые получатели и дубли находятся локально, за миллисекунды
+        findings = await detector.findings(sheets)
         
         # Анализируем перерасходы
         overspent = [item for item in budgets_status if item['overspent']]
@@ -221,30 +244,69 @@ async def cmd_fix(message: Message):
         else:
             text = "✅ Перерасходов не обнаружено. Финансы в порядке!"
         
-        # Добавляем AI-рекомендации
-        insights = await openrouter.generate_insights(transactions[-20:])
-        text += f"\n\n{insights}"
+        if findings:
+            text += "\n\n🔎 Необычные операции:\n" + "\n".join(finding.text for finding in findings)
         
         await message.answer(text)
         
+        # AI-рекомендации получают только найденные проблемы, а не сырые операции
+        advice = await openrouter.generate_fix_advice(findings, overspent, message.from_user.id)
+        if advice:
+            await message.answer(f"💡 Рекомендации:\n\n{advice}")
+        
     except Exception as e:
         await message.answer(f"❌ Ошибка анализа: {str(e)}")
 
 @router.message(Command("export"))
 async def cmd_export(message: Message):
-    """Экспорт данных (заглушка для PDF)"""
-    await message.answer(
-        "📤 Функция экспорта в PDF находится в разработке.\n\n"
-        "Сейчас вы можете использовать:\n"
-        "• Скриншоты отчетов\n" 
-        "• Копирование данных из поиска\n"
-        "• Ручное сохранение важной информации"
-    )
+    """Экспорт операций в файл: /export [csv|xlsx|pdf] [week|month|year|all|ГГГГ-ММ-ДД ГГГГ-ММ-ДД]"""
+    args = message.text.split()[1:]
+    export_format = "csv"
+    if args and args[0].lower() in EXPORT_FORMATS:
+        export_format = args.pop(0).lower()
+    
+    end_date = datetime.now().strftime('%Y-%m-%d')
+    period = args[0].lower() if args else "month"
+    if len(args) == 2 and all(re.match(r'^\d{4}-\d{2}-\d{2}$', a) for a in args):
+        start_date, end_date = args
+    elif period in EXPORT_PERIODS:
+        days = EXPORT_PERIODS[period]
+        start_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d') if days else None
+        end_date = end_date if days else None
+    else:
+        await message.answer(
+            "❌ Использование: /export [csv|xlsx|pdf] [week|month|year|all]\n"
+            "или /export [формат] ГГГГ-ММ-ДД ГГГГ-ММ-ДД"
+        )
+        return
+    
+    progress = await message.answer(f"⏳ Готовлю выгрузку в {export_format.upper()}...")
+    path = None
+    try:
+        path, count = await export_transactions(get_sheets_service(), export_format, start_date, end_date)
+        if not count:
+            await progress.edit_text("📭 За выбранный период операций нет")
+            return
+        if os.path.getsize(path) > EXPORT_MAX_BYTES:
+            await progress.edit_text("❌ Файл больше 50 МБ - выберите период короче")
+            return
+        
+        period_name = f"{start_date}_{end_date}" if start_date else "all"
+        await message.answer_document(
+            FSInputFile(path, filename=f"fincopilot_{period_name}.{export_format}"),
+            caption=f"📤 Операций: {count}"
+        )
+        await progress.delete()
+    except Exception as e:
+        await progress.edit_text(f"❌ Ошибка экспорта: {str(e)}")
+    finally:
+        if path and os.path.exists(path):
+            os.remove(path)
 
 @router.message(Command("top"))
 async def cmd_top(message: Message):
     """Топ расходов/доходов"""
-    sheets = GoogleSheetsService()
+    sheets = get_sheets_service()
     stats = await sheets.get_financial_stats("month")
     
     # Топ расходов по категориям
@@ -266,10 +328,13 @@ async def cmd_top(message: Message):
             text += f"• {category}: {amount:.2f} руб\n"
     
     await message.answer(text)
+    
+    if config.CHARTS:
+        await send_charts(message, [categories_chart(expenses, "Расходы за месяц по категориям")])
 
 @router.message(F.text == "📋 Список бюджетов")
 async def show_budgets_list(message: Message):
-    sheets = GoogleSheetsService()
+    sheets = get_sheets_service()
     budgets = await sheets.get_budgets(message.from_user.id)
     
     if not budgets:
@@ -284,7 +349,7 @@ async def show_budgets_list(message: Message):
 
 @router.message(F.text == "🗑️ Удалить бюджет")
 async def delete_budget_start(message: Message):
-    sheets = GoogleSheetsService()
+    sheets = get_sheets_service()
     budgets = await sheets.get_budgets(message.from_user.id)
     
     if not budgets:
@@ -47,7 +47,8 @@ async def cmd_help(message: Message):
         "📋 Полный список команд:\n\n"
         "💸 Добавление операций:\n"
         "/add - добавить операцию\n"
-        "Просто напишите: \"доход 50000 зарплата\"\n\n"
+        "Просто напишите: \"доход 50000 зарплата\"\n"
+        "Пришлите CSV-выписку банка файлом - операции импортируются\n\n"
         "📊 Отчеты:\n"
         "/report - полный отчет\n"
         "/profit - прибыль и убытки\n"
@@ -61,7 +62,7 @@ async def cmd_help(message: Message):
         "🔍 Поиск и анализ:\n"
         "/search - поиск операций\n"
         "/insights - AI-аналитика\n"
-        "/export - экспорт данных\n\n"
+        "/export [csv|xlsx|pdf] [week|month|year|all] - экспорт данных\n\n"
         "⚙️ Профиль:\n"
         "/profile - профиль\n"
         "/status - статус системы"
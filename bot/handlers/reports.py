@@ -1,11 +1,32 @@
+import logging
+
 from aiogram import Router, F
-from aiogram.types import Message
+from aiogram.types import BufferedInputFile, InputMediaPhoto, Message
 from aiogram.filters import Command
 
-from services.google_sheets import GoogleSheetsService
-from services.openrouter import OpenRouterService
+from config import config
+from services.charts import burndown_chart, cash_flow_chart, categories_chart, renderer
+from services.forecast import forecaster
+from services.registry import get_sheets_service, get_openrouter_service
+from services.profiler import profiler
+from services.scheduler import scheduler
 
 router = Router()
+logger = logging.getLogger(__name__)
+
+async def send_charts(message: Message, charts: list):
+    """Отправляет графики отдельным сообщением после текста; ошибки не мешают уже отправленному ответу"""
+    try:
+        images = await renderer.render_all(charts)
+        if len(images) == 1:
+            await message.answer_photo(BufferedInputFile(images[0], filename="chart.png"))
+        elif images:
+            await message.answer_media_group([
+                InputMediaPhoto(media=BufferedInputFile(image, filename=f"chart{i}.png"))
+                for i, image in enumerate(images)
+            ])
+    except Exception as e:
+        logger.error(f"Sending charts failed: {e}")
 
 @router.message(Command("report"))
 @router.message(F.text.lower().contains("отчет"))
@@ -13,19 +34,20 @@ async def generate_report(message: Message):
     """Генерирует финансовый отчет"""
     
     try:
-        sheets = GoogleSheetsService()
-        openrouter = OpenRouterService()
-        
-        # Получаем данные за последний месяц
-        stats = await sheets.get_financial_stats("month")
-        
-        # Генерируем отчет с помощью LLM
-        report = await openrouter.generate_report(stats, "последний месяц")
-        
-        await message.answer(report)
+        # Отчет за последний месяц обычно уже посчитан в фоне
+        report = await scheduler.report("month", message.from_user.id)
+        await message.answer(report.text)
         
     except Exception as e:
         await message.answer(f"❌ Ошибка генерации отчета: {str(e)}")
+        return
+    
+    if config.CHARTS:
+        model = await forecaster.model(get_sheets_service())
+        await send_charts(message, [
+            categories_chart(report.stats.get('expense_by_category', {}), "Расходы за месяц"),
+            cash_flow_chart(model),
+        ])
 
 @router.message(Command("profit"))
 @router.message(F.text.lower().contains("прибыль"))
@@ -33,7 +55,7 @@ async def show_profit(message: Message):
     """Показывает прибыль за период"""
     
     try:
-        sheets = GoogleSheetsService()
+        sheets = get_sheets_service()
         stats = await sheets.get_financial_stats("month")
         
         profit = stats['profit']
@@ -54,28 +76,25 @@ async def show_profit(message: Message):
 async def monthly_report(message: Message):
     """Отчет за текущий месяц"""
     try:
-        sheets = GoogleSheetsService()
-        openrouter = OpenRouterService()
-        
-        stats = await sheets.get_financial_stats("month")
-        report = await openrouter.generate_report(stats, "текущий месяц")
-        
-        await message.answer(report)
+        report = await scheduler.report("month", message.from_user.id)
+        await message.answer(report.text)
         
     except Exception as e:
         await message.answer(f"❌ Ошибка: {str(e)}")
+        return
+    
+    if config.CHARTS:
+        sheets = get_sheets_service()
+        model = await forecaster.model(sheets)
+        status = await sheets.get_budget_status(message.from_user.id)
+        await send_charts(message, [cash_flow_chart(model), burndown_chart(model, status)])
 
 @router.message(Command("week"))
 async def weekly_report(message: Message):
     """Отчет за неделю"""
     try:
-        sheets = GoogleSheetsService()
-        openrouter = OpenRouterService()
-        
-        stats = await sheets.get_financial_stats("week")
-        report = await openrouter.generate_report(stats, "последнюю неделю")
-        
-        await message.answer(report)
+        report = await scheduler.report("week", message.from_user.id)
+        await message.answer(report.text)
         
     except Exception as e:
         await message.answer(f"❌ Ошибка: {str(e)}")
@@ -85,8 +104,14 @@ async def weekly_report(message: Message):
 async def debug_sheet(message: Message):
     """Отладочная информация о структуре данных"""
     try:
-        sheets = GoogleSheetsService()
-        worksheet = sheets.sheet.worksheet("Transactions")
+        sheets = get_sheets_service()
+        partitions = await sheets.get_partitions()
+        if not partitions:
+            await message.answer("📋 Партиций транзакций пока нет")
+            return
+        months = list(partitions)
+        title = partitions[months[-1]]
+        worksheet = sheets._worksheet(title)
         
         # Получаем заголовки
         headers = worksheet.row_values(1)
@@ -96,6 +121,8 @@ async def debug_sheet(message: Message):
         
         debug_info = (
             f"📋 Отладочная информация:\n\n"
+            f"• Партиций: {len(partitions)} ({months[0]} — {months[-1]})\n"
+            f"• Лист: {title}\n"
             f"• Заголовки: {headers}\n"
             f"• Всего строк: {len(data)}\n"
             f"• Первые 3 записи:\n"
@@ -104,6 +131,10 @@ async def debug_sheet(message: Message):
         for i, row in enumerate(data[1:4], 1):
             debug_info += f"  {i}. {row}\n"
         
+        debug_info += f"\n{profiler.summary()}"
+        debug_info += f"🗓 Отчеты: {scheduler.summary()}\n"
+        debug_info += f"🧠 Модели: {get_openrouter_service().router.summary()}\n"
+        
         await message.answer(debug_info)
         
     except Exception as e:
@@ -114,14 +145,11 @@ async def debug_sheet(message: Message):
 async def cmd_insights(message: Message):
     """Показывает аналитические инсайты"""
     try:
-        from services.google_sheets import GoogleSheetsService
-        from services.openrouter import OpenRouterService
-        
-        sheets = GoogleSheetsService()
-        openrouter = OpenRouterService()
+        sheets = get_sheets_service()
+        openrouter = get_openrouter_service()
         
-        transactions = await sheets.get_transactions()
-        insights = await openrouter.generate_insights(transactions)
+        history = await sheets.get_monthly_stats()
+        insights = await openrouter.generate_insights(history, message.from_user.id)
         
         await message.answer(f"💡 Финансовые инсайты:\n\n{insights}")
         
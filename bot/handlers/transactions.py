@@ -3,30 +3,45 @@ from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from services.openrouter import OpenRouterService
-from services.google_sheets import GoogleSheetsService
+from services.registry import get_openrouter_service, get_sheets_service
+from services.importer import StatementImporter
+from services.parser import categorizer
 from models.transaction import Transaction
+import os
+import tempfile
 
 router = Router()
 
+# Bot API отдает боту файлы до 20 МБ
+IMPORT_MAX_BYTES = 20 * 1024 * 1024
+
 class AddTransaction(StatesGroup):
     waiting_for_text = State()
 
+def learn_category(message: Message, parsed_data: dict, transaction: Transaction):
+    """Категория от LLM дообучает категоризатор: похожие сообщения дальше разбираются локально
+    
+    Категории, выбранные самим категоризатором (есть category_confidence), не учитываются.
+    """
+    if 'category_confidence' not in parsed_data:
+        categorizer.learn(message.text, transaction.category, message.from_user.id)
+
 @router.message(F.text.lower().startswith(('доход', 'расход', 'приход', 'трата', 'затрата')))
 async def handle_transaction_message(message: Message):
     """Обрабатывает сообщения о транзакциях в свободной форме"""
     
     try:
         # Парсим текст с помощью OpenRouter
-        openrouter = OpenRouterService()
-        parsed_data = await openrouter.parse_transaction(message.text)
+        openrouter = get_openrouter_service()
+        parsed_data = await openrouter.parse_transaction(message.text, message.from_user.id)
         
         # Создаем транзакцию
         transaction = Transaction.create_from_text(message.text, parsed_data)
         
         # Сохраняем в Google Sheets
-        sheets = GoogleSheetsService()
+        sheets = get_sheets_service()
         await sheets.add_transaction(transaction)
+        learn_category(message, parsed_data, transaction)
         
         await message.answer(
             f"✅ Запись добавлена!\n"
@@ -43,12 +58,13 @@ async def handle_transaction_message(message: Message):
 async def process_transaction_text(message: Message, state: FSMContext):
     """Обрабатывает текст транзакции из состояния"""
     try:
-        openrouter = OpenRouterService()
-        parsed_data = await openrouter.parse_transaction(message.text)
+        openrouter = get_openrouter_service()
+        parsed_data = await openrouter.parse_transaction(message.text, message.from_user.id)
         
         transaction = Transaction.create_from_text(message.text, parsed_data)
-        sheets = GoogleSheetsService()
+        sheets = get_sheets_service()
         await sheets.add_transaction(transaction)
+        learn_category(message, parsed_data, transaction)
         
         await message.answer(
             f"✅ Запись добавлена!\n"
@@ -60,4 +76,35 @@ async def process_transaction_text(message: Message, state: FSMContext):
     except Exception as e:
         await message.answer(f"❌ Ошибка: {str(e)}")
     finally:
-        await state.clear()
\ No newline at end of file
+        await state.clear()
+
+@router.message(F.document.file_name.lower().endswith(".csv"))
+async def import_statement(message: Message):
+    """Импортирует CSV-выписку банка, присланную документом"""
+    if message.document.file_size and message.document.file_size > IMPORT_MAX_BYTES:
+        await message.answer("❌ Файл больше 20 МБ - разбейте выписку на части")
+        return
+    
+    progress = await message.answer("⏳ Загружаю выписку...")
+    fd, path = tempfile.mkstemp(prefix="fincopilot-import-", suffix=".csv")
+    os.close(fd)
+    try:
+        await message.bot.download(message.document, destination=path)
+        
+        async def report(result):
+            await progress.edit_text(
+                f"⏳ Обработано строк: {result.rows}, добавлено: {result.added}, дублей: {result.duplicates}"
+            )
+        
+        result = await StatementImporter(get_sheets_service()).run(path, report)
+        await progress.edit_text(
+            f"✅ Импорт завершен!\n"
+            f"• Строк в выписке: {result.rows}\n"
+            f"• Добавлено операций: {result.added}\n"
+            f"• Пропущено дублей: {result.duplicates}\n"
+            f"• Некорректных строк: {result.invalid}"
+        )
+    except Exception as e:
+        await progress.edit_text(f"❌ Ошибка импорта: {str(e)}")
+    finally:
+        os.remove(path)
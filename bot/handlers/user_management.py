@@ -1,16 +1,27 @@
 from aiogram import Router, F
 from aiogram.types import Message
 from aiogram.filters import Command
-from services.user_manager import UserManager
+from services.registry import get_user_manager
 
 router = Router()
 
 @router.message(Command("usage"))
 async def show_usage(message: Message):
     """Показывает использование API пользователем"""
-    user_manager = UserManager()
+    user_manager = get_user_manager()
     
     try:
+        usage = await user_manager.get_user_usage(message.from_user.id)
+        if "error" not in usage:
+            await message.answer(
+                "📊 Использование вашего API ключа:\n\n"
+                f"• 📅 Сегодня: ${usage.get('usage_daily') or 0:.4f}\n"
+                f"• 🗓 За неделю: ${usage.get('usage_weekly') or 0:.4f}\n"
+                f"• 📆 За месяц: ${usage.get('usage_monthly') or 0:.4f}\n"
+                f"• 💰 Осталось: ${usage.get('limit_remaining') or 0:.2f} из ${usage.get('limit') or 0:.2f}"
+            )
+            return
+        
         # Для бесплатной версии показываем общую информацию
         await message.answer(
             "📊 Вы используете бесплатную версию FinCopilot\n\n"
@@ -26,7 +37,7 @@ async def show_usage(message: Message):
 @router.message(Command("profile"))
 async def show_profile(message: Message):
     """Показывает профиль пользователя"""
-    user_manager = UserManager()
+    user_manager = get_user_manager()
     
     try:
         user = await user_manager.get_or_create_user(
@@ -0,0 +1,21 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from services.scheduler import scheduler
+
+
+class ActivityMiddleware(BaseMiddleware):
+    """Отмечает активных пользователей: для них в фоне готовятся отчеты"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is not None and not user.is_bot:
+            scheduler.touch(user.id)
+        return await handler(event, data)
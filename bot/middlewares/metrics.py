@@ -0,0 +1,36 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from services.metrics import metrics
+
+
+def get_handler_name(data: Dict[str, Any]) -> str:
+    """Имя обработчика вида "модуль.функция" """
+    callback = getattr(data.get("handler"), "callback", None)
+    if callback is None:
+        return "unknown"
+    return f"{callback.__module__.rsplit('.', 1)[-1]}.{callback.__name__}"
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Замеряет время выполнения каждого обработчика роутера"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        name = get_handler_name(data)
+        start = time.perf_counter()
+        error = False
+        try:
+            return await handler(event, data)
+        except Exception:
+            error = True
+            raise
+        finally:
+            metrics.observe_handler(name, time.perf_counter() - start, error)
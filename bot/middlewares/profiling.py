@@ -0,0 +1,22 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from bot.middlewares.metrics import get_handler_name
+from services.profiler import profiler
+
+
+class HandlerProfilingMiddleware(BaseMiddleware):
+    """Профилирует обработчики, перечисленные в PROFILE_HANDLERS"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        name = get_handler_name(data)
+        if not profiler.should_profile(name):
+            return await handler(event, data)
+        return await profiler.profile_handler(name, lambda: handler(event, data))
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import queue
+from typing import List
+
+from aiogram import Bot
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.types import Update
+
+from config import config
+from services.cluster import shard_for
+
+logger = logging.getLogger(__name__)
+
+# Апдейтов в очереди воркера: при переполнении супервизор ждет, а не теряет апдейты
+QUEUE_SIZE = 1000
+POLL_TIMEOUT = 30
+
+
+def chat_of(update: Update) -> int:
+    """Чат апдейта (или пользователь, если чата нет) - по нему выбирается воркер"""
+    context = UserContextMiddleware.resolve_event_context(event=update)
+    if context.chat is not None:
+        return context.chat.id
+    if context.user is not None:
+        return context.user.id
+    return 0
+
+
+def worker_main(index: int, workers: int, updates):
+    """Точка входа процесса-воркера"""
+    logging.basicConfig(level=logging.INFO, format=f"[worker {index}] %(levelname)s:%(name)s:%(message)s")
+    asyncio.run(_worker(index, workers, updates))
+
+
+async def _worker(index: int, workers: int, updates):
+    # Импорт здесь: процессы запускаются через spawn и собирают диспетчер заново
+    from main import build_dispatcher, start_services
+    from services.parser import categorizer
+
+    # Дообучение общей модели категорий воркер пишет в свой файл
+    categorizer.worker = index
+    bot = Bot(token=config.BOT_TOKEN)
+    dp = build_dispatcher()
+    metrics_port = config.METRICS_PORT + index if config.METRICS_PORT else 0
+    stop = await start_services(bot, primary=index == 0, metrics_port=metrics_port)
+    logger.info(f"Worker {index}/{workers} ready")
+
+    loop = asyncio.get_running_loop()
+    tasks = set()
+    try:
+        while True:
+            data = await loop.run_in_executor(None, updates.get)
+            if data is None:
+                break
+            # Апдейты разных чатов обрабатываются параллельно, как при start_polling
+            task = asyncio.create_task(dp.feed_raw_update(bot, json.loads(data)))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks, timeout=POLL_TIMEOUT)
+    finally:
+        await stop()
+
+
+class Supervisor:
+    """Получает апдейты Telegram и раздает их процессам-воркерам по чатам
+
+    getUpdates допускает одного получателя, поэтому опрашивает только супервизор.
+    Чат всегда попадает в один и тот же воркер (shard_for), так что состояния FSM,
+    кэши отчетов и лимиты кредитов остаются в памяти одного процесса. Запись в таблицу
+    воркеры согласуют через блокировки services.cluster. Упавший воркер перезапускается.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._context = multiprocessing.get_context("spawn")
+        self._queues = [self._context.Queue(QUEUE_SIZE) for _ in range(workers)]
+        self._processes: List[multiprocessing.Process] = [None] * workers
+
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=worker_main, args=(index, self.workers, self._queues[index]), name=f"worker-{index}"
+        )
+        process.start()
+        self._processes[index] = process
+        logger.info(f"Started worker {index} (pid {process.pid})")
+
+    def _check_workers(self):
+        for index, process in enumerate(self._processes):
+            if not process.is_alive():
+                logger.error(f"Worker {index} exited with code {process.exitcode}, restarting")
+                self._spawn(index)
+
+    async def _dispatch(self, update: Update):
+        data = update.model_dump_json(exclude_unset=True, by_alias=True)
+        target = self._queues[shard_for(chat_of(update), self.workers)]
+        try:
+            target.put_nowait(data)
+        except queue.Full:
+            # Воркер не успевает: ждем места в его очереди, остальные чаты подождут вместе с ним
+            await asyncio.get_running_loop().run_in_executor(None, target.put, data)
+
+    async def run(self):
+        from main import build_dispatcher
+
+        for index in range(self.workers):
+            self._spawn(index)
+        bot = Bot(token=config.BOT_TOKEN)
+        allowed_updates = build_dispatcher().resolve_used_update_types()
+        offset = None
+        try:
+            while True:
+                self._check_workers()
+                try:
+                    updates = await bot.get_updates(
+                        offset=offset, timeout=POLL_TIMEOUT, allowed_updates=allowed_updates
+                    )
+                except Exception as e:
+                    logger.error(f"getUpdates failed: {e}")
+                    await asyncio.sleep(1)
+                    continue
+                for update in updates:
+                    await self._dispatch(update)
+                    offset = update.update_id + 1
+        finally:
+            for updates in self._queues:
+                updates.put(None)
+            for process in self._processes:
+                process.join(timeout=POLL_TIMEOUT)
+                if process.is_alive():
+                    process.terminate()
+            await bot.session.close()
@@ -9,19 +9,107 @@ class Config:
     # Основные настройки
     BOT_TOKEN: str = os.getenv("BOT_TOKEN")
     OPENROUTER_API_KEY: str = os.getenv("OPENROUTER_API_KEY")
+    OPENROUTER_PROVISIONING_KEY: str = os.getenv("OPENROUTER_PROVISIONING_KEY")
     GOOGLE_SHEETS_CREDENTIALS: str = os.getenv("GOOGLE_SHEETS_CREDENTIALS")
     SPREADSHEET_ID: str = os.getenv("SPREADSHEET_ID")
     
     # Настройки OpenRouter
+    OPENROUTER_BASE_URL: str = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
     OPENROUTER_MODEL: str = os.getenv("OPENROUTER_MODEL", "mistralai/mistral-7b-instruct:free")
     OPENROUTER_REFERER: str = os.getenv("OPENROUTER_REFERER", "https://github.com/fincopilot-bot")
     OPENROUTER_TITLE: str = os.getenv("OPENROUTER_TITLE", "FinCopilot")
+    # Цепочки моделей по задачам через запятую: быстрая для разбора сообщений, сильная для отчетов.
+    # OPENROUTER_MODEL замыкает каждую цепочку
+    PARSE_MODELS: tuple = tuple(x.strip() for x in os.getenv(
+        "PARSE_MODELS", "meta-llama/llama-3.2-3b-instruct:free"
+    ).split(",") if x.strip())
+    REPORT_MODELS: tuple = tuple(x.strip() for x in os.getenv(
+        "REPORT_MODELS", "meta-llama/llama-3.3-70b-instruct:free,google/gemma-2-9b-it:free"
+    ).split(",") if x.strip())
+    # Дублирование разбора сообщений другой модели, если ответ дольше ее p90, и доля лишних запросов
+    LLM_HEDGE: bool = os.getenv("LLM_HEDGE", "false").lower() == "true"
+    LLM_HEDGE_BUDGET: float = float(os.getenv("LLM_HEDGE_BUDGET", "0.2"))
+    # Бюджет промптов отчетов и инсайтов (приблизительные токены) и сколько категорий показывать
+    PROMPT_TOKEN_BUDGET: int = int(os.getenv("PROMPT_TOKEN_BUDGET", "600"))
+    PROMPT_TOP_K: int = int(os.getenv("PROMPT_TOP_K", "8"))
     
     # Настройки пользователей
     DEFAULT_CREDIT_LIMIT: float = float(os.getenv("DEFAULT_CREDIT_LIMIT", "100"))
     PREMIUM_CREDIT_LIMIT: float = float(os.getenv("PREMIUM_CREDIT_LIMIT", "1000"))
+    # Локальные лимиты LLM на пользователя: запросов в минуту, запас ведра и оценка цены 1000 токенов ($)
+    LLM_USER_RATE: float = float(os.getenv("LLM_USER_RATE", "10"))
+    LLM_USER_BURST: float = float(os.getenv("LLM_USER_BURST", "5"))
+    LLM_PRICE_PER_1K_TOKENS: float = float(os.getenv("LLM_PRICE_PER_1K_TOKENS", "0.0002"))
+    # Использование личных ключей: период обхода list_user_keys и предельный возраст данных, секунды
+    USAGE_REFRESH_INTERVAL: float = float(os.getenv("USAGE_REFRESH_INTERVAL", "300"))
+    USAGE_MAX_AGE: float = float(os.getenv("USAGE_MAX_AGE", "900"))
+    
+    # Валюты: отчеты считаются в базовой валюте по локальной таблице курсов
+    BASE_CURRENCY: str = os.getenv("BASE_CURRENCY", "RUB")
+    RATES_FILE: str = os.getenv("RATES_FILE", "data/rates.csv")
+    
+    # Предрассчитанные отчеты: фоновый пересчет, срок жизни (с) и час рассылки недельного отчета по понедельникам (-1 - не рассылать)
+    REPORTS_PRECOMPUTE: bool = os.getenv("REPORTS_PRECOMPUTE", "true").lower() == "true"
+    REPORTS_MAX_AGE: float = float(os.getenv("REPORTS_MAX_AGE", "3600"))
+    REPORTS_PUSH_HOUR: int = int(os.getenv("REPORTS_PUSH_HOUR", "-1"))
+    
+    # Аномалии для /fix: дней истории в дневных рядах и сколько последних дней проверяется
+    ANOMALY_HISTORY_DAYS: int = int(os.getenv("ANOMALY_HISTORY_DAYS", "120"))
+    ANOMALY_RECENT_DAYS: int = int(os.getenv("ANOMALY_RECENT_DAYS", "7"))
+    
+    # Прогноз денежного потока: дней истории для подгонки модели и горизонт прогноза бюджетов
+    FORECAST_HISTORY_DAYS: int = int(os.getenv("FORECAST_HISTORY_DAYS", "180"))
+    FORECAST_HORIZON_DAYS: int = int(os.getenv("FORECAST_HORIZON_DAYS", "31"))
+    
+    # Категоризатор: каталог моделей и уверенность, с которой сообщение разбирается без LLM
+    CATEGORIZER_DIR: str = os.getenv("CATEGORIZER_DIR", "data/categorizer")
+    CATEGORIZER_CONFIDENCE: float = float(os.getenv("CATEGORIZER_CONFIDENCE", "0.95"))
+    
+    # Графики к /report, /month и /top: процессов отрисовки, размер кэша PNG и предел отрисовки (с)
+    CHARTS: bool = os.getenv("CHARTS", "false").lower() == "true"
+    CHART_WORKERS: int = int(os.getenv("CHART_WORKERS", "2"))
+    CHART_CACHE_SIZE: int = int(os.getenv("CHART_CACHE_SIZE", "64"))
+    CHART_TIMEOUT: float = float(os.getenv("CHART_TIMEOUT", "10"))
+    
+    # Импорт выписок: строк в пачке разбора и записи (append_rows)
+    IMPORT_CHUNK_ROWS: int = int(os.getenv("IMPORT_CHUNK_ROWS", "5000"))
+    
+    # TTF-шрифт с кириллицей для выгрузки в PDF
+    EXPORT_FONT: str = os.getenv("EXPORT_FONT", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf")
+    
+    # Квоты Google Sheets API (запросов в минуту на сервисный аккаунт) и повторы после 429/5xx
+    SHEETS_READS_PER_MINUTE: float = float(os.getenv("SHEETS_READS_PER_MINUTE", "60"))
+    SHEETS_WRITES_PER_MINUTE: float = float(os.getenv("SHEETS_WRITES_PER_MINUTE", "60"))
+    SHEETS_MAX_RETRIES: int = int(os.getenv("SHEETS_MAX_RETRIES", "6"))
+    SHEETS_BACKOFF_BASE: float = float(os.getenv("SHEETS_BACKOFF_BASE", "1"))
+    SHEETS_BACKOFF_MAX: float = float(os.getenv("SHEETS_BACKOFF_MAX", "64"))
+    
+    # Время жизни кэша разобранных транзакций, секунды
+    SHEETS_CACHE_TTL: float = float(os.getenv("SHEETS_CACHE_TTL", "60"))
+    
+    # Архив закрытых месяцев: каталог файлов и через сколько месяцев партиция архивируется (0 - вручную)
+    ARCHIVE_DIR: str = os.getenv("ARCHIVE_DIR", "data/archive")
+    ARCHIVE_AFTER_MONTHS: int = int(os.getenv("ARCHIVE_AFTER_MONTHS", "0"))
     
     # Флаг для AI
     ENABLE_AI: bool = os.getenv("ENABLE_AI", "true").lower() == "true"
+    
+    # Администраторы бота (Telegram ID через запятую)
+    ADMIN_IDS: tuple = tuple(int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip())
+    
+    # Процессов-воркеров (больше 1 - супервизор делит чаты между ними) и файл общих блокировок записи
+    WORKERS: int = int(os.getenv("WORKERS", "1"))
+    CLUSTER_DB: str = os.getenv("CLUSTER_DB", "data/cluster.sqlite")
+    
+    # Эндпоинт метрик Prometheus (0 - отключен)
+    METRICS_HOST: str = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", "0"))
+    
+    # Профилирование: обработчики вида "reports.generate_report" и каталог для профилей
+    PROFILE_HANDLERS: tuple = tuple(x.strip() for x in os.getenv("PROFILE_HANDLERS", "").split(",") if x.strip())
+    PROFILE_DIR: str = os.getenv("PROFILE_DIR", "profiles")
+    
+    # Прогрев сервисов (таблица, кэши, HTTP-соединения) до начала polling
+    WARMUP_ON_START: bool = os.getenv("WARMUP_ON_START", "true").lower() == "true"
 
 config = Config()
\ No newline at end of file
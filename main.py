@@ -1,15 +1,26 @@
+from services.startup import startup  # первым: замер времени импортов
+
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
 
 from config import config
-from bot.handlers import base, transactions, reports, user_management, advanced_handlers
+from bot.handlers import base, transactions, reports, user_management, advanced_handlers, admin
+from bot.middlewares.activity import ActivityMiddleware
+from bot.middlewares.metrics import HandlerMetricsMiddleware
+from bot.middlewares.profiling import HandlerProfilingMiddleware
+from services import registry
+from services.charts import renderer
+from services.metrics import start_metrics_server
+from services.parser import categorizer
+from services.profiler import profiler
+from services.scheduler import scheduler
 
-async def main():
-    logging.basicConfig(level=logging.INFO)
-    
-    bot = Bot(token=config.BOT_TOKEN)
+startup.mark("imports")
+
+def build_dispatcher() -> Dispatcher:
+    """Собирает диспетчер со всеми роутерами и middleware"""
     storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
     
@@ -19,6 +30,90 @@ async def main():
     dp.include_router(reports.router)
     dp.include_router(user_management.router)
     dp.include_router(advanced_handlers.router)  # Новый роутер с расширенной функциональностью
+    dp.include_router(admin.router)
+    
+    # Активные пользователи для фоновых отчетов
+    dp.message.outer_middleware(ActivityMiddleware())
+    
+    # Замеряем задержку обработчиков всех роутеров
+    metrics_middleware = HandlerMetricsMiddleware()
+    profiling_middleware = HandlerProfilingMiddleware() if config.PROFILE_HANDLERS else None
+    for router in (base.router, transactions.router, reports.router,
+                   user_management.router, advanced_handlers.router, admin.router):
+        router.message.middleware(metrics_middleware)
+        router.callback_query.middleware(metrics_middleware)
+        if profiling_middleware:
+            router.message.middleware(profiling_middleware)
+            router.callback_query.middleware(profiling_middleware)
+    
+    return dp
+
+async def start_services(bot: Bot, primary: bool = True, metrics_port: int = None):
+    """Запускает метрики, прогрев и фоновые задачи процесса; возвращает корутину остановки
+    
+    primary - процесс, который ведет общие для всех воркеров задачи (архивация, обход ключей).
+    """
+    profiler.loop_lag.start()
+    
+    # Эндпоинт поднимается до прогрева, чтобы /ready отвечал 503 во время запуска
+    metrics_runner = None
+    metrics_port = config.METRICS_PORT if metrics_port is None else metrics_port
+    if metrics_port:
+        metrics_runner = await start_metrics_server(config.METRICS_HOST, metrics_port)
+    
+    # Прогрев: таблица, листы и HTTP-соединения открываются до первого апдейта
+    if config.WARMUP_ON_START:
+        await registry.warm_up()
+        if config.CHARTS:
+            await renderer.warm_up()
+    startup.mark_ready()
+    
+    # Фоновый пересчет отчетов (у каждого воркера - для активных пользователей его чатов)
+    if config.REPORTS_PRECOMPUTE:
+        scheduler.start(bot)
+    
+    # Ежедневная архивация закрытых месяцев
+    compaction = None
+    if primary and config.ARCHIVE_AFTER_MONTHS:
+        from services.archive import compaction_loop
+        compaction = asyncio.create_task(compaction_loop())
+    
+    # Обход использования личных ключей (одним списком вместо запроса на каждого пользователя)
+    usage_refresh = None
+    if primary and config.OPENROUTER_PROVISIONING_KEY:
+        from services.usage import usage_refresh_loop
+        usage_refresh = asyncio.create_task(usage_refresh_loop())
+    
+    async def stop():
+        profiler.loop_lag.stop()
+        scheduler.stop()
+        renderer.close()
+        await categorizer.flush()
+        if compaction:
+            compaction.cancel()
+        if usage_refresh:
+            usage_refresh.cancel()
+        await registry.close()
+        await bot.session.close()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+    
+    return stop
+
+async def main():
+    logging.basicConfig(level=logging.INFO)
+    
+    if config.WORKERS > 1:
+        # Несколько процессов: апдейты получает супервизор и раздает воркерам по чатам
+        from bot.supervisor import Supervisor
+        await Supervisor(config.WORKERS).run()
+        return
+    
+    bot = Bot(token=config.BOT_TOKEN)
+    dp = build_dispatcher()
+    startup.mark("dispatcher")
+    
+    stop = await start_services(bot)
     
     # Инициализируем структуру таблицы при старте
     # try:
@@ -32,7 +127,7 @@ async def main():
     try:
         await dp.start_polling(bot)
     finally:
-        await bot.session.close()
+        await stop()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
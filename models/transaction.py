@@ -1,6 +1,8 @@
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 from typing import Optional
+import sys
 import uuid
 
 @dataclass
@@ -15,6 +17,7 @@ class Transaction:
     description: str
     source: str
     created_at: str
+    amount_base: Optional[float] = None  # сумма в базовой валюте, считается при записи
     
     @classmethod
     def create_from_text(cls, text: str, parsed_data: dict):
@@ -30,4 +33,156 @@ class Transaction:
             description=parsed_data.get('description', ''),
             source=parsed_data.get('source', 'telegram'),
             created_at=datetime.now().isoformat()
-        )
\ No newline at end of file
+        )
+
+# Поля строки листа Transactions в порядке колонок
+TRANSACTION_FIELDS = (
+    "uuid", "date", "type", "category", "subcategory",
+    "amount", "currency", "description", "source", "created_at", "amount_base"
+)
+
+
+INCOME_WORDS = ('income', 'доход', 'приход')
+EXPENSE_WORDS = ('expense', 'расход', 'трата', 'затрата')
+
+# Нулевой день серийных дат Google Sheets
+SHEETS_EPOCH = date(1899, 12, 30)
+
+
+@lru_cache(maxsize=1024)
+def normalize_type(value: str) -> str:
+    """Тип операции из свободного текста: 'income', 'expense' или '' если не распознан"""
+    value = str(value).strip().lower()
+    if any(word in value for word in INCOME_WORDS):
+        return 'income'
+    if any(word in value for word in EXPENSE_WORDS):
+        return 'expense'
+    return ''
+
+
+def decode_date(value) -> str:
+    """Дата ячейки в виде YYYY-MM-DD (серийные номера дат Sheets переводятся в ISO)"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (SHEETS_EPOCH + timedelta(days=int(value))).isoformat()
+    return str(value)
+
+
+def to_minor_units(amount) -> Optional[int]:
+    """Сумма в копейках/центах (int) из числа или строки; None если сумма некорректна"""
+    if isinstance(amount, int):
+        return amount * 100
+    if not isinstance(amount, float):
+        amount = str(amount).strip().replace(',', '.').replace(' ', '')
+    try:
+        # round() снимает ошибку представления двоичного float (0.29 * 100 = 28.999...)
+        return int(round(float(amount) * 100))
+    except (ValueError, OverflowError):
+        return None
+
+
+def from_minor_units(amount_minor: int) -> float:
+    return amount_minor / 100
+
+
+class TransactionRecord:
+    """Компактная прочитанная транзакция: сумма в минорных единицах, повторяющиеся строки интернированы
+    
+    Значения разбираются один раз при чтении листа: type нормализован до 'income'/'expense'
+    ('' если не распознан), date приведена к YYYY-MM-DD.
+    """
+    
+    __slots__ = (
+        "uuid", "date", "type", "category", "subcategory",
+        "amount_minor", "currency", "description", "source", "created_at", "amount_base_minor"
+    )
+    
+    def __init__(self, uuid, date, type, category, subcategory, amount_minor,
+                 currency, description, source, created_at, amount_base_minor=None):
+        self.uuid = uuid
+        self.date = date
+        self.type = normalize_type(type)
+        self.category = sys.intern(category)
+        self.subcategory = subcategory
+        self.amount_minor = amount_minor
+        self.currency = sys.intern(currency)
+        self.description = description
+        self.source = sys.intern(source)
+        self.created_at = created_at
+        self.amount_base_minor = amount_base_minor
+    
+    @classmethod
+    def from_row(cls, row: list, columns: dict, convert=None):
+        """Создает запись из строки листа; columns - индекс колонки по названию поля"""
+        return cls.row_decoder(columns, convert)(row)
+    
+    @classmethod
+    def row_decoder(cls, columns: dict, convert=None):
+        """Функция разбора строк листа с заранее вычисленными индексами колонок
+        
+        convert(amount_minor, currency, date) пересчитывает сумму в базовую валюту
+        для строк, записанных без колонки amount_base.
+        """
+        indexes = [columns.get(field) for field in TRANSACTION_FIELDS]
+        width = max((i for i in indexes if i is not None), default=-1) + 1
+        (uuid_i, date_i, type_i, category_i, subcategory_i,
+         amount_i, currency_i, description_i, source_i, created_i, base_i) = [
+            width if i is None else i for i in indexes
+        ]
+        intern = sys.intern
+        padding = [''] * (width + 1)
+        
+        def decode(row):
+            if len(row) <= width:
+                row = list(row) + padding[:width + 1 - len(row)]
+            record = cls.__new__(cls)
+            record.uuid = str(row[uuid_i])
+            record.date = decode_date(row[date_i])
+            record.type = normalize_type(row[type_i])
+            record.category = intern(str(row[category_i]) or 'прочее')
+            record.subcategory = str(row[subcategory_i]) or None
+            # Пустая сумма - некорректная строка, а не нулевая операция
+            record.amount_minor = to_minor_units(row[amount_i])
+            record.currency = intern(str(row[currency_i]) or 'RUB')
+            record.description = str(row[description_i])
+            record.source = intern(str(row[source_i]))
+            record.created_at = str(row[created_i])
+            base = row[base_i]
+            if record.amount_minor is None:
+                record.amount_base_minor = None
+            elif base != '':
+                record.amount_base_minor = to_minor_units(base)
+            elif convert is not None:
+                record.amount_base_minor = convert(record.amount_minor, record.currency, record.date)
+            else:
+                record.amount_base_minor = None
+            return record
+        
+        return decode
+    
+    @property
+    def is_valid(self) -> bool:
+        return self.amount_base_minor is not None and self.type != ''
+    
+    @property
+    def amount_base(self) -> Optional[float]:
+        return None if self.amount_base_minor is None else from_minor_units(self.amount_base_minor)
+    
+    @property
+    def amount(self) -> Optional[float]:
+        return None if self.amount_minor is None else from_minor_units(self.amount_minor)
+    
+    def get(self, key: str, default=None):
+        """Доступ в стиле dict для совместимости с кодом, работавшим со строками листа"""
+        value = getattr(self, key, None) if key in TRANSACTION_FIELDS else None
+        return default if value is None else value
+    
+    def __getitem__(self, key: str):
+        if key not in TRANSACTION_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in TRANSACTION_FIELDS}
+    
+    def __repr__(self):
+        return f"TransactionRecord({self.uuid!r}, {self.date!r}, {self.type!r}, {self.category!r}, {self.amount!r})"
@@ -0,0 +1,232 @@
+import logging
+import re
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import config
+from models.transaction import from_minor_units
+
+logger = logging.getLogger(__name__)
+
+# Пороговые значения: z-оценка EWMA, робастная оценка по медиане (Iglewicz-Hoaglin),
+# во сколько раз крупная операция больше медианной операции категории
+EWMA_ALPHA = 0.1
+EWMA_THRESHOLD = 3.0
+ROBUST_THRESHOLD = 3.5
+LARGE_FACTOR = 5.0
+# Дублем считаются одинаковые операции с разницей в датах не больше стольких дней
+DUPLICATE_DAYS = 1
+_DIGITS = re.compile(r"\d+")
+_SPACES = re.compile(r"\s+")
+
+
+@dataclass
+class Finding:
+    kind: str  # "spike", "large" или "duplicate"
+    date: str
+    category: str
+    amount: float
+    score: float
+    details: str
+
+    @property
+    def text(self) -> str:
+        icons = {"spike": "📈", "large": "🆕", "duplicate": "♊"}
+        return f"{icons.get(self.kind, '•')} {self.date} {self.category}: {self.details}"
+
+
+def _merchant(description: str) -> str:
+    """Описание без чисел и регистра - чтобы "Такси 12.05" и "такси 13.05" совпадали"""
+    return _SPACES.sub(" ", _DIGITS.sub("", description.lower())).strip()
+
+
+def ewma_zscores(series: np.ndarray, alpha: float = EWMA_ALPHA) -> np.ndarray:
+    """z-оценки каждого дня относительно EWMA среднего и дисперсии предыдущих дней
+
+    series - матрица [категории, дни]; цикл идет по дням, категории считаются векторно.
+    """
+    scores = np.zeros_like(series)
+    mean = series[:, 0].copy()
+    var = np.zeros(series.shape[0])
+    for day in range(1, series.shape[1]):
+        values = series[:, day]
+        deviation = values - mean
+        scores[:, day] = deviation / np.sqrt(var + 1.0)
+        mean += alpha * deviation
+        var = (1 - alpha) * (var + alpha * deviation ** 2)
+    return scores
+
+
+def robust_zscores(history: np.ndarray, recent: np.ndarray) -> np.ndarray:
+    """Робастные z-оценки последних дней по медиане и MAD истории категории
+
+    Если MAD нулевой (в категории мало дней с расходами), берется среднее абсолютное отклонение.
+    """
+    median = np.median(history, axis=1, keepdims=True)
+    deviations = np.abs(history - median)
+    mad = np.median(deviations, axis=1, keepdims=True)
+    mean_ad = deviations.mean(axis=1, keepdims=True)
+    scale = np.where(mad > 0, mad / 0.6745, mean_ad * 1.2533)
+    return (recent - median) / np.where(scale > 0, scale, 1.0)
+
+
+class AnomalyDetector:
+    """Поиск аномалий в расходах без LLM: всплески по категориям, крупные новые получатели, дубли
+
+    Дневные ряды расходов по категориям строятся из хранилища транзакций за
+    ANOMALY_HISTORY_DAYS дней; последние ANOMALY_RECENT_DAYS проверяются против истории.
+    Результат кэшируется и пересчитывается только после записи транзакций (или по TTL кэша листов).
+    """
+
+    def __init__(self, history_days: int = None, recent_days: int = None):
+        self.history_days = history_days or config.ANOMALY_HISTORY_DAYS
+        self.recent_days = recent_days or config.ANOMALY_RECENT_DAYS
+        self._findings: Optional[List[Finding]] = None
+        self._computed_at = 0.0
+        self._subscribed = None
+
+    def invalidate(self):
+        self._findings = None
+
+    def _subscribe(self, sheets):
+        if self._subscribed is not sheets:
+            sheets.listeners.append(self.invalidate)
+            self._subscribed = sheets
+
+    async def findings(self, sheets) -> List[Finding]:
+        """Найденные аномалии, от самых значимых"""
+        self._subscribe(sheets)
+        if self._findings is not None and time.monotonic() - self._computed_at < config.SHEETS_CACHE_TTL:
+            return self._findings
+        today = datetime.now().date()
+        start = today - timedelta(days=self.history_days - 1)
+        records = await sheets.get_transactions(start.isoformat(), today.isoformat())
+        started = time.perf_counter()
+        self._findings = self.detect(records, start, today)
+        self._computed_at = time.monotonic()
+        logger.info(f"Anomalies: {len(self._findings)} in {len(records)} rows, "
+                    f"{(time.perf_counter() - started) * 1000:.1f} ms")
+        return self._findings
+
+    def detect(self, records, start, end, limit: int = 10) -> List[Finding]:
+        days = [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+        day_index = {day: i for i, day in enumerate(days)}
+        expenses = [
+            r for r in records
+            if r.is_valid and r.type == 'expense' and r.date in day_index and r.amount_base_minor > 0
+        ]
+        if not expenses:
+            return []
+        recent_from = days[-self.recent_days]
+
+        found = self._spikes(expenses, days, day_index) + self._large(expenses, recent_from)
+        found += self._duplicates(expenses, recent_from)
+        found.sort(key=lambda f: f.score, reverse=True)
+        return found[:limit]
+
+    def _spikes(self, expenses, days, day_index) -> List[Finding]:
+        categories = sorted({r.category for r in expenses})
+        category_index = {category: i for i, category in enumerate(categories)}
+        series = np.zeros((len(categories), len(days)))
+        np.add.at(
+            series,
+            (np.fromiter((category_index[r.category] for r in expenses), dtype=np.int64, count=len(expenses)),
+             np.fromiter((day_index[r.date] for r in expenses), dtype=np.int64, count=len(expenses))),
+            np.fromiter((r.amount_base_minor for r in expenses), dtype=np.float64, count=len(expenses)) / 100
+        )
+        split = len(days) - self.recent_days
+        if split < self.recent_days:
+            return []
+        ewma = ewma_zscores(series)[:, split:]
+        robust = robust_zscores(series[:, :split], series[:, split:])
+        # Всплеск - только если оба метода согласны: EWMA ловит рост к недавнему уровню,
+        # медиана не дает одному старому выбросу размыть базу
+        flagged = np.argwhere((ewma > EWMA_THRESHOLD) & (robust > ROBUST_THRESHOLD))
+        typical = np.median(series[:, :split], axis=1)
+        return [
+            Finding(
+                kind="spike",
+                date=days[split + d],
+                category=categories[c],
+                amount=float(series[c, split + d]),
+                score=float(min(ewma[c, d], robust[c, d])),
+                details=f"расход за день {series[c, split + d]:.0f} руб при обычных {typical[c]:.0f}"
+            )
+            for c, d in flagged
+        ]
+
+    def _large(self, expenses, recent_from: str) -> List[Finding]:
+        """Крупные операции у получателей, которых раньше не было"""
+        amounts: Dict[str, list] = defaultdict(list)
+        merchants = set()
+        for r in expenses:
+            if r.date < recent_from:
+                amounts[r.category].append(r.amount_base_minor)
+                merchants.add(_merchant(r.description))
+        medians = {category: float(np.median(values)) for category, values in amounts.items()}
+
+        # По одному (самому крупному) результату на нового получателя
+        found: Dict[tuple, Finding] = {}
+        for r in expenses:
+            median = medians.get(r.category)
+            merchant = _merchant(r.description)
+            if r.date < recent_from or not median or merchant in merchants:
+                continue
+            ratio = r.amount_base_minor / median
+            key = (r.category, merchant)
+            if ratio >= LARGE_FACTOR and (key not in found or found[key].score < ratio):
+                found[key] = Finding(
+                    kind="large",
+                    date=r.date,
+                    category=r.category,
+                    amount=from_minor_units(r.amount_base_minor),
+                    score=ratio,
+                    details=f"новый получатель \"{r.description[:30]}\" на {r.amount_base:.0f} руб "
+                            f"(в {ratio:.0f} раз больше обычной операции)"
+                )
+        return list(found.values())
+
+    def _duplicates(self, expenses, recent_from: str) -> List[Finding]:
+        """Одинаковые сумма, категория и описание в соседние дни
+
+        Регулярные платежи (такие же операции встречались в истории) дублями не считаются.
+        """
+        groups: Dict[tuple, list] = defaultdict(list)
+        habitual = set()
+        for r in expenses:
+            key = (r.amount_base_minor, r.category, _merchant(r.description))
+            if r.date >= recent_from:
+                groups[key].append(r.date)
+            else:
+                habitual.add(key)
+
+        found = []
+        for key, dates in groups.items():
+            if len(dates) < 2 or key in habitual:
+                continue
+            amount_minor, category, _ = key
+            dates.sort()
+            close = sum(
+                1 for a, b in zip(dates, dates[1:])
+                if (datetime.strptime(b, '%Y-%m-%d') - datetime.strptime(a, '%Y-%m-%d')).days <= DUPLICATE_DAYS
+            )
+            if close:
+                found.append(Finding(
+                    kind="duplicate",
+                    date=dates[-1],
+                    category=category,
+                    amount=from_minor_units(amount_minor),
+                    # Дубль важнее обычного всплеска: его легко исправить
+                    score=EWMA_THRESHOLD + close,
+                    details=f"одинаковых операций: {close + 1} по {from_minor_units(amount_minor):.0f} руб "
+                            f"с {dates[0]} по {dates[-1]} - возможен дубль"
+                ))
+        return found
+
+
+detector = AnomalyDetector()
@@ -0,0 +1,69 @@
+import asyncio
+import csv
+import gzip
+import logging
+import os
+from typing import List
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class TransactionArchive:
+    """Локальный архив закрытых месяцев: по сжатому CSV-файлу на партицию
+
+    Файлы неизменяемы после записи, поэтому прочитанные таблицы можно кэшировать без срока жизни.
+    """
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or config.ARCHIVE_DIR
+
+    def path(self, title: str) -> str:
+        return os.path.join(self.directory, f"{title}.csv.gz")
+
+    def exists(self, title: str) -> bool:
+        return os.path.exists(self.path(title))
+
+    def write(self, title: str, rows: List[list]):
+        """Записывает строки (первая - заголовки) атомарно: через временный файл и os.replace"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(title)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8", newline="") as f:
+            csv.writer(f).writerows(rows)
+        os.replace(tmp_path, path)
+
+    def read(self, title: str) -> List[list]:
+        return self.read_file(self.path(title))
+
+    @staticmethod
+    def is_archive_file(key: str) -> bool:
+        return key.endswith(".csv.gz")
+
+    def read_file(self, path: str) -> List[list]:
+        if not os.path.exists(path):
+            # Архив локальный: на другом хосте или после потери диска его нет
+            logger.warning(f"Archive file {path} not found")
+            return []
+        with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+            return list(csv.reader(f))
+
+    def size(self, title: str) -> int:
+        return os.path.getsize(self.path(title)) if self.exists(title) else 0
+
+
+async def compaction_loop(interval: float = 24 * 3600):
+    """Раз в interval секунд архивирует месяцы старше ARCHIVE_AFTER_MONTHS"""
+    from services.quota import background
+    from services.registry import get_sheets_service
+
+    background()
+    while True:
+        try:
+            archived = await get_sheets_service().compact_transactions(config.ARCHIVE_AFTER_MONTHS)
+            if archived:
+                logger.info(f"Compaction archived partitions: {', '.join(archived)}")
+        except Exception as e:
+            logger.error(f"Compaction failed: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,279 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import threading
+import zlib
+from typing import Dict, Iterable, Optional, Tuple
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Признаки хэшируются в 2^18 корзин: словарь не хранится, размер модели ограничен
+HASH_BUCKETS = 1 << 18
+SMOOTHING = 0.1
+# Больше предсказаний общей модели в кэше не держится (описания в выписках повторяются)
+CACHE_SIZE = 65536
+FORMAT_VERSION = 1
+# Личная модель отвечает, только когда различает хотя бы две категории на нескольких примерах
+PERSONAL_MIN_CLASSES = 2
+PERSONAL_MIN_EXAMPLES = 5
+# Обученные модели пишутся на диск не чаще раза в столько секунд
+SAVE_DELAY = 5.0
+_WORDS = re.compile(r"[^\W\d_]+")
+# Файлы дообучения общей модели: у каждого воркера свой, при загрузке они складываются
+_SHARED_PART = re.compile(r"shared_(\d+)\.nb")
+
+
+def features(text: str) -> Dict[int, int]:
+    """Хэшированные признаки текста: слова, пары соседних слов и символьные триграммы слов
+
+    Числа отбрасываются - "такси 350" и "такси 1200" дают одни и те же признаки.
+    """
+    words = _WORDS.findall(text.lower())
+    tokens = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"<{word}>"
+        tokens.extend(f"#{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    result: Dict[int, int] = {}
+    for token in tokens:
+        bucket = zlib.crc32(token.encode()) & (HASH_BUCKETS - 1)
+        result[bucket] = result.get(bucket, 0) + 1
+    return result
+
+
+class NaiveBayes:
+    """Мультиномиальный наивный Байес на хэшированных признаках с инкрементальным обучением"""
+
+    def __init__(self):
+        self.docs: Dict[str, int] = {}
+        self.totals: Dict[str, int] = {}
+        self.counts: Dict[str, Dict[int, int]] = {}
+        self.vocabulary = set()
+
+    @property
+    def examples(self) -> int:
+        return sum(self.docs.values())
+
+    def learn(self, text: str, category: str, weight: int = 1):
+        counts = self.counts.setdefault(category, {})
+        self.docs[category] = self.docs.get(category, 0) + weight
+        for bucket, count in features(text).items():
+            counts[bucket] = counts.get(bucket, 0) + count * weight
+            self.totals[category] = self.totals.get(category, 0) + count * weight
+            self.vocabulary.add(bucket)
+
+    def merge(self, other: "NaiveBayes"):
+        """Добавляет счетчики другой модели (обученной на других примерах)"""
+        for category, counts in other.counts.items():
+            own = self.counts.setdefault(category, {})
+            for bucket, count in counts.items():
+                own[bucket] = own.get(bucket, 0) + count
+            self.docs[category] = self.docs.get(category, 0) + other.docs.get(category, 0)
+            self.totals[category] = self.totals.get(category, 0) + other.totals.get(category, 0)
+        self.vocabulary.update(other.vocabulary)
+
+    def predict(self, text: str) -> Tuple[Optional[str], float]:
+        """Категория и ее апостериорная вероятность; (None, 0.0), если модель пуста
+        или ни одного признака текста она не видела
+
+        Признаки, которых модель не видела ни в одной категории, не влияют на ответ.
+        """
+        if not self.docs:
+            return None, 0.0
+        observed = [(bucket, count) for bucket, count in features(text).items() if bucket in self.vocabulary]
+        if not observed:
+            return None, 0.0
+        total_docs = self.examples
+        vocabulary = len(self.vocabulary) * SMOOTHING
+        scores = {}
+        for category, docs in self.docs.items():
+            counts = self.counts[category]
+            denominator = math.log(self.totals.get(category, 0) + vocabulary)
+            score = math.log(docs / total_docs)
+            for bucket, count in observed:
+                score += count * (math.log(counts.get(bucket, 0) + SMOOTHING) - denominator)
+            scores[category] = score
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        return best, 1.0 / sum(math.exp(score - top) for score in scores.values())
+
+    def dumps(self) -> bytes:
+        """Компактное представление: номера корзин по возрастанию дельтами, сжатое zlib"""
+        classes = []
+        for category, counts in self.counts.items():
+            buckets = sorted(counts)
+            deltas = [b - a for a, b in zip([0] + buckets, buckets)]
+            classes.append([category, self.docs[category], deltas, [counts[b] for b in buckets]])
+        payload = {"v": FORMAT_VERSION, "classes": classes}
+        return zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode())
+
+    @classmethod
+    def loads(cls, data: bytes) -> "NaiveBayes":
+        payload = json.loads(zlib.decompress(data))
+        if payload.get("v") != FORMAT_VERSION:
+            raise ValueError(f"unsupported categorizer model version {payload.get('v')}")
+        model = cls()
+        for category, docs, deltas, values in payload["classes"]:
+            bucket, counts = 0, {}
+            for delta, count in zip(deltas, values):
+                bucket += delta
+                counts[bucket] = count
+            model.docs[category] = docs
+            model.counts[category] = counts
+            model.totals[category] = sum(values)
+            model.vocabulary.update(counts)
+        return model
+
+
+class Categorizer:
+    """Категории операций по личным моделям пользователей и общей модели
+
+    Общая модель засеяна ключевыми словами категорий и дообучается на операциях всех
+    пользователей; личная модель учится только на операциях своего пользователя и
+    отвечает первой, если уверена. Модели хранятся в CATEGORIZER_DIR по файлу на пользователя.
+    Дообучение общей модели каждый воркер (worker - его номер) пишет в свой файл shared_<worker>,
+    а загружает сумму всех файлов: воркеры не перезаписывают примеры друг друга.
+    """
+
+    def __init__(self, seed: Dict[str, Iterable[str]] = None, directory: str = None, worker: int = 0):
+        self.seed = seed or {}
+        self.directory = directory or config.CATEGORIZER_DIR
+        self.worker = worker
+        self._shared: Optional[NaiveBayes] = None
+        # Примеры общей модели, выученные этим воркером (только они пишутся в его файл)
+        self._own: Optional[NaiveBayes] = None
+        self._users: Dict[int, NaiveBayes] = {}
+        self._cache: Dict[str, Tuple[Optional[str], float]] = {}
+        # predict вызывается и из рабочего потока импорта выписок, learn - из цикла событий
+        self._lock = threading.RLock()
+        # Модели, измененные после последней записи на диск: {имя файла: модель}
+        self._dirty: Dict[str, NaiveBayes] = {}
+        self._save_task: Optional[asyncio.Task] = None
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.nb")
+
+    def _load(self, name: str) -> Optional[NaiveBayes]:
+        path = self._path(name)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                return NaiveBayes.loads(f.read())
+        except Exception as e:
+            logger.warning(f"Categorizer model {path} unreadable, starting over: {e}")
+            return None
+
+    def _save(self, name: str, data: bytes):
+        """Атомарная запись: через временный файл и os.replace"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(name)
+            with open(f"{path}.tmp", "wb") as f:
+                f.write(data)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logger.error(f"Categorizer model {name} not saved: {e}")
+
+    def _write_dirty(self):
+        """Сериализует измененные модели под блокировкой и пишет файлы (вызывается в рабочем потоке)"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            payloads = {name: model.dumps() for name, model in dirty.items()}
+        for name, data in payloads.items():
+            self._save(name, data)
+
+    async def _save_later(self):
+        while self._dirty:
+            await asyncio.sleep(SAVE_DELAY)
+            await asyncio.to_thread(self._write_dirty)
+
+    def _schedule_save(self):
+        if self._save_task is not None and not self._save_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вне цикла событий (скрипты) - сразу
+            self._write_dirty()
+            return
+        self._save_task = loop.create_task(self._save_later())
+
+    async def flush(self):
+        """Записывает несохраненные модели (при остановке бота)"""
+        if self._save_task is not None:
+            self._save_task.cancel()
+            self._save_task = None
+        await asyncio.to_thread(self._write_dirty)
+
+    def _shared_parts(self) -> Iterable[int]:
+        """Номера воркеров, у которых есть файл дообучения общей модели"""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return sorted(int(match.group(1)) for match in map(_SHARED_PART.fullmatch, names) if match)
+
+    @property
+    def shared(self) -> NaiveBayes:
+        if self._shared is None:
+            # shared.nb - общая модель до разделения по воркерам, дальше только читается
+            model = self._load("shared")
+            if model is None:
+                model = NaiveBayes()
+                for category, keywords in self.seed.items():
+                    for keyword in keywords:
+                        model.learn(keyword, category)
+            own = None
+            for worker in self._shared_parts():
+                part = self._load(f"shared_{worker}")
+                if part is None:
+                    continue
+                model.merge(part)
+                if worker == self.worker:
+                    own = part
+            self._own = own or NaiveBayes()
+            self._shared = model
+        return self._shared
+
+    def user(self, user_id: int) -> NaiveBayes:
+        model = self._users.get(user_id)
+        if model is None:
+            model = self._users[user_id] = self._load(f"user_{user_id}") or NaiveBayes()
+        return model
+
+    def predict(self, text: str, user_id: int = None) -> Tuple[Optional[str], float]:
+        """Категория и уверенность: личная модель, если она уверена, иначе общая"""
+        with self._lock:
+            if user_id is not None:
+                model = self.user(user_id)
+                # Модель из одной категории уверена всегда - такой ответ ничего не значит
+                if len(model.docs) >= PERSONAL_MIN_CLASSES and model.examples >= PERSONAL_MIN_EXAMPLES:
+                    category, confidence = model.predict(text)
+                    if category is not None and confidence >= config.CATEGORIZER_CONFIDENCE:
+                        return category, confidence
+            cached = self._cache.get(text)
+            if cached is None:
+                if len(self._cache) >= CACHE_SIZE:
+                    self._cache.clear()
+                cached = self._cache[text] = self.shared.predict(text)
+            return cached
+
+    def learn(self, text: str, category: str, user_id: int = None):
+        """Учитывает подтвержденную категорию операции; модели сохраняются на диск с задержкой SAVE_DELAY"""
+        if not category:
+            return
+        with self._lock:
+            self.shared.learn(text, category)
+            self._own.learn(text, category)
+            self._cache.clear()
+            self._dirty[f"shared_{self.worker}"] = self._own
+            if user_id is not None:
+                model = self.user(user_id)
+                model.learn(text, category)
+                self._dirty[f"user_{user_id}"] = model
+        self._schedule_save()
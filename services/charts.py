@@ -0,0 +1,242 @@
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from typing import List, Optional
+
+from config import config
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Сколько категорий показывается на диаграмме, остальные сводятся в "прочие"
+TOP_CATEGORIES = 8
+# Сколько бюджетов помещается на графике расходования
+MAX_BUDGETS = 6
+
+
+def _png(fig) -> bytes:
+    import matplotlib.pyplot as plt
+
+    buffer = io.BytesIO()
+    fig.tight_layout()
+    fig.savefig(buffer, format="png", dpi=100)
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def _pyplot():
+    """matplotlib импортируется только в процессах пула и только при первой отрисовке"""
+    try:
+        import matplotlib
+    except ImportError:
+        raise RuntimeError("Графики недоступны: установите пакет matplotlib")
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _warm_up():
+    _pyplot()
+
+
+def _rubles(axis):
+    """Подписи оси суммами с пробелами между разрядами вместо множителя 1e6"""
+    from matplotlib.ticker import FuncFormatter
+
+    axis.set_major_formatter(FuncFormatter(lambda value, _: f"{value:,.0f}".replace(",", " ")))
+
+
+def render_categories(data: dict) -> bytes:
+    """Горизонтальная диаграмма расходов по категориям"""
+    plt = _pyplot()
+    labels, values = data["labels"], data["values"]
+    fig, ax = plt.subplots(figsize=(7, 0.5 * len(labels) + 1.5))
+    ax.barh(labels[::-1], values[::-1], color="#e07a5f")
+    for y, value in enumerate(values[::-1]):
+        ax.text(value, y, f" {value:,.0f}".replace(",", " "), va="center", fontsize=8)
+    ax.set_title(data["title"])
+    ax.set_xlabel("руб")
+    _rubles(ax.xaxis)
+    ax.margins(x=0.15)
+    return _png(fig)
+
+
+def render_cash_flow(data: dict) -> bytes:
+    """Дневные доходы и расходы столбцами и накопленный баланс линией"""
+    plt = _pyplot()
+    days, income, expense = data["days"], data["income"], data["expense"]
+    fig, ax = plt.subplots(figsize=(8, 4))
+    positions = range(len(days))
+    ax.bar(positions, income, color="#81b29a", label="доходы")
+    ax.bar(positions, [-value for value in expense], color="#e07a5f", label="расходы")
+    balance, running = [], 0.0
+    for value_in, value_out in zip(income, expense):
+        running += value_in - value_out
+        balance.append(running)
+    ax.plot(positions, balance, color="#3d405b", label="баланс")
+    ax.axhline(0, color="grey", linewidth=0.5)
+    _rubles(ax.yaxis)
+    step = max(1, len(days) // 8)
+    ax.set_xticks(list(positions)[::step], days[::step], rotation=45, fontsize=8)
+    ax.set_title(data["title"])
+    ax.legend(fontsize=8)
+    return _png(fig)
+
+
+def render_burndown(data: dict) -> bytes:
+    """Остаток бюджетов по дням: факт сплошной линией, прогноз до конца месяца - пунктиром"""
+    plt = _pyplot()
+    fig, ax = plt.subplots(figsize=(8, 4))
+    actual_days = len(data["days"])
+    for item in data["budgets"]:
+        line, = ax.plot(range(actual_days), item["remaining"], label=item["category"])
+        if item["projected"]:
+            ax.plot(range(actual_days - 1, actual_days + len(item["projected"])),
+                    [item["remaining"][-1]] + item["projected"], linestyle="--", color=line.get_color())
+    ax.axhline(0, color="grey", linewidth=0.5)
+    labels = data["days"] + data["future"]
+    step = max(1, len(labels) // 8)
+    ax.set_xticks(list(range(len(labels)))[::step], labels[::step], rotation=45, fontsize=8)
+    ax.set_title("Остаток бюджетов")
+    ax.set_ylabel("руб")
+    _rubles(ax.yaxis)
+    ax.legend(fontsize=8)
+    return _png(fig)
+
+
+RENDERERS = {
+    "categories": render_categories,
+    "cash_flow": render_cash_flow,
+    "burndown": render_burndown,
+}
+
+
+def categories_chart(amounts: dict, title: str) -> Optional[tuple]:
+    items = sorted(amounts.items(), key=lambda x: x[1], reverse=True)
+    if not items:
+        return None
+    top, rest = items[:TOP_CATEGORIES], items[TOP_CATEGORIES:]
+    if rest:
+        top.append((f"прочие ({len(rest)})", sum(amount for _, amount in rest)))
+    return "categories", {
+        "title": title, "labels": [c for c, _ in top], "values": [round(a, 2) for _, a in top]
+    }
+
+
+def cash_flow_chart(model, days: int = 30) -> tuple:
+    """Данные графика денежного потока из модели прогноза (services.forecast)"""
+    dates = [(model.end - timedelta(days=i)).strftime('%d.%m') for i in range(days - 1, -1, -1)]
+    return "cash_flow", {
+        "title": f"Денежный поток за {days} дней",
+        "days": dates,
+        "income": [round(float(v), 2) for v in model.daily("income", days=days)],
+        "expense": [round(float(v), 2) for v in model.daily("expense", days=days)],
+    }
+
+
+def burndown_chart(model, status: list) -> Optional[tuple]:
+    """Данные графика расходования бюджетов из get_budget_status и модели прогноза"""
+    from services.forecast import BUDGET_WINDOW_DAYS
+
+    month_end = model.month_end()
+    window = BUDGET_WINDOW_DAYS
+    budgets = []
+    for item in status[:MAX_BUDGETS]:
+        spent = model.daily("expense", item['category'], days=window).cumsum()
+        projected = spent[-1] + model.projected("expense", item['category'], days=month_end.days_left).cumsum()
+        budgets.append({
+            "category": item['category'],
+            "remaining": [round(item['budget'] - float(v), 2) for v in spent],
+            "projected": [round(item['budget'] - float(v), 2) for v in projected],
+        })
+    if not budgets:
+        return None
+    return "burndown", {
+        "days": [(model.end - timedelta(days=i)).strftime('%d.%m') for i in range(window - 1, -1, -1)],
+        "future": [(model.end + timedelta(days=i + 1)).strftime('%d.%m') for i in range(month_end.days_left)],
+        "budgets": budgets,
+    }
+
+
+class ChartRenderer:
+    """Отрисовка графиков в ограниченном пуле процессов с кэшем PNG
+
+    matplotlib занимает процессор на десятки миллисекунд, поэтому рисует пул из
+    CHART_WORKERS процессов, а не цикл aiogram. В очереди не больше двух графиков
+    на процесс: при перегрузке график пропускается, а не задерживает ответы.
+    Готовые изображения кэшируются по хэшу данных: повторный запрос по тем же
+    данным отдается без отрисовки.
+    """
+
+    def __init__(self, workers: int = None, cache_size: int = None):
+        self.workers = workers or config.CHART_WORKERS
+        self.cache_size = cache_size or config.CHART_CACHE_SIZE
+        self._cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots = asyncio.Semaphore(self.workers * 2)
+
+    @staticmethod
+    def key(kind: str, data: dict) -> str:
+        payload = json.dumps([kind, data], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: дочерние процессы не наследуют потоки и сокеты цикла событий
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def warm_up(self):
+        """Запускает процессы пула и импортирует в них matplotlib до первого запроса"""
+        loop = asyncio.get_running_loop()
+        executor = self._executor()
+        try:
+            await asyncio.gather(*(loop.run_in_executor(executor, _warm_up) for _ in range(self.workers)))
+        except Exception as e:
+            logger.warning(f"Chart pool warm-up failed: {e}")
+
+    async def render(self, kind: str, data: dict) -> Optional[bytes]:
+        """PNG графика или None, если пул перегружен или отрисовка не удалась"""
+        key = self.key(kind, data)
+        image = self._cache.get(key)
+        if image is not None:
+            self._cache.move_to_end(key)
+            metrics.increment("charts_cached")
+            return image
+        if self._slots.locked():
+            metrics.increment("charts_skipped")
+            return None
+        async with self._slots:
+            try:
+                loop = asyncio.get_running_loop()
+                image = await asyncio.wait_for(
+                    loop.run_in_executor(self._executor(), RENDERERS[kind], data), timeout=config.CHART_TIMEOUT
+                )
+            except Exception as e:
+                logger.error(f"Chart '{kind}' failed: {e!r}")
+                metrics.increment("charts_failed")
+                return None
+        metrics.increment("charts_rendered")
+        self._cache[key] = image
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return image
+
+    async def render_all(self, charts: List[Optional[tuple]]) -> List[bytes]:
+        """Рисует графики (kind, data) параллельно; None, пропущенные и неудачные не возвращаются"""
+        images = await asyncio.gather(*(self.render(*chart) for chart in charts if chart))
+        return [image for image in images if image]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+renderer = ChartRenderer()
@@ -0,0 +1,132 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from typing import Dict, Optional
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Аренда блокировки (с): держатель продлевает ее, пока пишет; упавший процесс не держит таблицу вечно
+LOCK_LEASE = 30.0
+LOCK_POLL = 0.02
+
+# Блокировки, уже взятые текущей задачей: вложенные методы записи не ждут сами себя
+_held: contextvars.ContextVar = contextvars.ContextVar("cluster_locks_held", default=frozenset())
+
+
+def shard_for(chat_id: int, workers: int) -> int:
+    """Номер воркера для чата: стабилен между перезапусками (crc32, а не hash())"""
+    return zlib.crc32(str(chat_id).encode()) % workers
+
+
+def enabled() -> bool:
+    return config.WORKERS > 1
+
+
+class ClusterStore:
+    """Общее состояние процессов одной машины в SQLite: блокировки записи и поколения данных
+
+    Таблица locks - аренды с владельцем и сроком, generations - счетчики изменений:
+    процесс, записавший транзакции, увеличивает поколение, остальные по нему сбрасывают кэши.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or config.CLUSTER_DB
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS locks (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS generations (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._conn = conn
+        return self._conn
+
+    def try_lock(self, name: str, owner: str, lease: float = LOCK_LEASE) -> bool:
+        """Берет или продлевает аренду; чужая аренда перехватывается только после истечения"""
+        now = time.time()
+        cursor = self._db().execute(
+            "INSERT INTO locks (name, owner, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+            "WHERE locks.expires < ? OR locks.owner = excluded.owner",
+            (name, owner, now + lease, now)
+        )
+        return cursor.rowcount == 1
+
+    def unlock(self, name: str, owner: str):
+        self._db().execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner))
+
+    def bump(self, name: str) -> int:
+        """Увеличивает поколение и возвращает новое значение"""
+        return self._db().execute(
+            "INSERT INTO generations (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1 RETURNING value",
+            (name,)
+        ).fetchone()[0]
+
+    def generation(self, name: str) -> int:
+        row = self._db().execute("SELECT value FROM generations WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+store = ClusterStore()
+_local_locks: Dict[str, asyncio.Lock] = {}
+
+
+async def _renew(name: str, owner: str):
+    while True:
+        await asyncio.sleep(LOCK_LEASE / 3)
+        if not store.try_lock(name, owner):
+            logger.error(f"Write lock '{name}' lease lost")
+            return
+
+
+@contextlib.asynccontextmanager
+async def write_lock(name: str):
+    """Блокировка записи name, общая для процессов (в режиме одного процесса ничего не делает)"""
+    held = _held.get()
+    if not enabled() or name in held:
+        yield
+        return
+    # Сначала очередь внутри процесса, затем аренда между процессами
+    async with _local_locks.setdefault(name, asyncio.Lock()):
+        owner = f"{os.getpid()}"
+        started = time.perf_counter()
+        while not store.try_lock(name, owner):
+            await asyncio.sleep(LOCK_POLL)
+        waited = time.perf_counter() - started
+        if waited > 1:
+            logger.warning(f"Waited {waited:.1f}s for write lock '{name}'")
+        token = _held.set(held | {name})
+        renew = asyncio.create_task(_renew(name, owner))
+        try:
+            yield
+        finally:
+            renew.cancel()
+            _held.reset(token)
+            store.unlock(name, owner)
+
+
+def serialized(name: str):
+    """Декоратор async-метода записи: выполняется под общей блокировкой name"""
+    def decorator(method):
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            async with write_lock(name):
+                return await method(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from config import config
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Причины отказа в вызове LLM
+LIMIT_RATE = "rate"
+LIMIT_CREDITS = "credits"
+# Учетная запись фонового пересчета отчетов: свое ведро запросов и месячный лимит
+BACKGROUND_ACCOUNT = 0
+
+
+class UserCredits:
+    """Ведро запросов и оценка расхода кредитов одного пользователя за месяц"""
+
+    __slots__ = ("tokens", "updated_at", "spent", "reconciled", "month")
+
+    def __init__(self, burst: float):
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        # Расход за месяц: подтвержденный Provisioning API и накопленный локально после сверки
+        self.reconciled = 0.0
+        self.spent = 0.0
+        self.month = datetime.now().strftime('%Y-%m')
+
+
+class CreditLedger:
+    """Локальный учет кредитов и частоты запросов к LLM по пользователям
+
+    Перед вызовом модели проверяются ведро запросов (LLM_USER_RATE в минуту, запас
+    LLM_USER_BURST) и месячный лимит DEFAULT_CREDIT_LIMIT/PREMIUM_CREDIT_LIMIT по оценке
+    расхода из токенов ответов. Оценка периодически сверяется с usage_monthly ключей
+    из кэша использования, лимит ключа сбрасывается помесячно, как и в OpenRouter.
+    Статусы премиум читаются из листа Users при первой проверке и раз в USAGE_REFRESH_INTERVAL.
+    """
+
+    def __init__(self, rate_per_minute: float = None, burst: float = None, price_per_1k: float = None):
+        self.rate = (rate_per_minute or config.LLM_USER_RATE) / 60
+        self.burst = burst or config.LLM_USER_BURST
+        self.price_per_1k = config.LLM_PRICE_PER_1K_TOKENS if price_per_1k is None else price_per_1k
+        self.users: Dict[int, UserCredits] = {}
+        self._premium: Dict[int, bool] = {}
+        self._premium_loaded_at: Optional[float] = None
+        self._premium_lock = asyncio.Lock()
+
+    def _user(self, user_id: int) -> UserCredits:
+        state = self.users.get(user_id)
+        if state is None:
+            state = self.users[user_id] = UserCredits(self.burst)
+        month = datetime.now().strftime('%Y-%m')
+        if state.month != month:
+            state.month, state.spent, state.reconciled = month, 0.0, 0.0
+        return state
+
+    def limit(self, user_id: int) -> float:
+        return config.PREMIUM_CREDIT_LIMIT if self._premium.get(user_id) else config.DEFAULT_CREDIT_LIMIT
+
+    def set_premium(self, user_id: int, premium: bool):
+        self._premium[user_id] = premium
+
+    def _premium_fresh(self) -> bool:
+        return (self._premium_loaded_at is not None
+                and time.monotonic() - self._premium_loaded_at < config.USAGE_REFRESH_INTERVAL)
+
+    async def _load_premium(self):
+        """Статусы премиум всех пользователей одним чтением листа Users"""
+        if self._premium_fresh():
+            return
+        async with self._premium_lock:
+            if self._premium_fresh():
+                return
+            from services.registry import get_user_manager
+
+            try:
+                self._premium.update(await get_user_manager().premium_statuses())
+            except Exception as e:
+                # Следующая попытка - через USAGE_REFRESH_INTERVAL, до нее действует известный статус
+                logger.warning(f"Premium statuses not loaded: {e}")
+            self._premium_loaded_at = time.monotonic()
+
+    def spent(self, user_id: int) -> float:
+        state = self._user(user_id)
+        return state.reconciled + state.spent
+
+    async def check(self, user_id: Optional[int]) -> Optional[str]:
+        """Причина отказа (LIMIT_RATE, LIMIT_CREDITS) или None, не расходуя запрос из ведра"""
+        if user_id is None:
+            return None
+        await self._load_premium()
+        state = self._user(user_id)
+        if state.reconciled + state.spent >= self.limit(user_id):
+            return LIMIT_CREDITS
+        now = time.monotonic()
+        state.tokens = min(self.burst, state.tokens + (now - state.updated_at) * self.rate)
+        state.updated_at = now
+        if state.tokens < 1:
+            return LIMIT_RATE
+        return None
+
+    async def acquire(self, user_id: Optional[int]) -> Optional[str]:
+        """Разрешение на вызов LLM: None или причина отказа (LIMIT_RATE, LIMIT_CREDITS)
+
+        Вызовы без пользователя не ограничиваются; фоновые отчеты идут от BACKGROUND_ACCOUNT.
+        """
+        refused = await self.check(user_id)
+        if refused:
+            metrics.increment(f"llm_refused_{refused}")
+            return refused
+        if user_id is not None:
+            self._user(user_id).tokens -= 1
+        return None
+
+    def charge(self, user_id: Optional[int], prompt_tokens: int, completion_tokens: int):
+        """Учитывает оценку стоимости выполненного вызова"""
+        if user_id is None:
+            return
+        self._user(user_id).spent += (prompt_tokens + completion_tokens) / 1000 * self.price_per_1k
+
+    def reconcile(self, usage_by_user: Dict[int, dict]):
+        """Сверка с фактическим месячным расходом личных ключей
+
+        Запросы идут не только через личный ключ (общий ключ его расход не увеличивает),
+        поэтому расход берется как максимум из локальной оценки и usage_monthly ключа.
+        """
+        for user_id, usage in usage_by_user.items():
+            actual = usage.get("usage_monthly")
+            if actual is None:
+                continue
+            state = self._user(user_id)
+            state.reconciled, state.spent = max(state.reconciled + state.spent, float(actual)), 0.0
+        logger.info(f"Credits reconciled for {len(usage_by_user)} users")
+
+
+credits = CreditLedger()
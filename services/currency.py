@@ -0,0 +1,77 @@
+import csv
+import logging
+import os
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class RateTable:
+    """Локальная таблица курсов к базовой валюте, индексированная по дате
+    
+    Файл CSV с колонками date,currency,rate, где rate - сколько единиц базовой валюты
+    стоит одна единица currency. Для даты берется последний курс не позже нее
+    (для дат раньше первой записи - самый ранний курс).
+    """
+    
+    def __init__(self, base_currency: str, rates: Dict[str, Tuple[List[str], List[float]]] = None):
+        self.base_currency = base_currency
+        self.rates = rates or {}
+        self._warned = set()
+    
+    @classmethod
+    def from_file(cls, path: str, base_currency: str) -> "RateTable":
+        series: Dict[str, List[Tuple[str, float]]] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    try:
+                        series.setdefault(row["currency"].strip().upper(), []).append(
+                            (row["date"].strip(), float(row["rate"]))
+                        )
+                    except (KeyError, ValueError):
+                        continue
+        else:
+            logger.warning(f"Rates file not found: {path}; only {base_currency} amounts will be converted")
+        
+        rates = {}
+        for currency, points in series.items():
+            points.sort()
+            rates[currency] = ([d for d, _ in points], [r for _, r in points])
+        return cls(base_currency, rates)
+    
+    def rate(self, currency: str, date: str) -> Optional[float]:
+        currency = (currency or self.base_currency).upper()
+        if currency == self.base_currency:
+            return 1.0
+        series = self.rates.get(currency)
+        if series is None:
+            if currency not in self._warned:
+                self._warned.add(currency)
+                logger.warning(f"No exchange rate for {currency}")
+            return None
+        dates, values = series
+        return values[max(bisect_right(dates, date) - 1, 0)]
+    
+    def convert_minor(self, amount_minor: Optional[int], currency: str, date: str) -> Optional[int]:
+        """Сумма в минорных единицах базовой валюты; None если курс неизвестен"""
+        if amount_minor is None:
+            return None
+        rate = self.rate(currency, date)
+        if rate is None:
+            return None
+        return int(round(amount_minor * rate))
+
+
+_rate_table: Optional[RateTable] = None
+
+
+def get_rate_table() -> RateTable:
+    """Таблица курсов процесса (загружается из RATES_FILE один раз)"""
+    global _rate_table
+    if _rate_table is None:
+        _rate_table = RateTable.from_file(config.RATES_FILE, config.BASE_CURRENCY)
+    return _rate_table
@@ -0,0 +1,158 @@
+import asyncio
+import csv
+import logging
+import os
+import tempfile
+from typing import List
+
+from config import config
+from models.transaction import TransactionRecord
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("csv", "xlsx", "pdf")
+
+# Колонки выгрузки: поле записи и заголовок
+EXPORT_COLUMNS = [
+    ("date", "Дата"),
+    ("type", "Тип"),
+    ("category", "Категория"),
+    ("subcategory", "Подкатегория"),
+    ("amount", "Сумма"),
+    ("currency", "Валюта"),
+    ("amount_base", f"Сумма, {config.BASE_CURRENCY}"),
+    ("description", "Описание"),
+    ("source", "Источник"),
+    ("uuid", "ID"),
+]
+
+
+def _row(record: TransactionRecord) -> list:
+    values = [getattr(record, field) for field, _ in EXPORT_COLUMNS]
+    return ["" if value is None else value for value in values]
+
+
+class CsvExportWriter:
+    """CSV в UTF-8 с BOM, чтобы Excel правильно открывал кириллицу"""
+
+    def open(self, path: str):
+        self._file = open(path, "w", encoding="utf-8-sig", newline="")
+        self._writer = csv.writer(self._file, delimiter=";")
+        self._writer.writerow([title for _, title in EXPORT_COLUMNS])
+
+    def write(self, records: List[TransactionRecord]):
+        self._writer.writerows(_row(r) for r in records)
+
+    def close(self):
+        self._file.close()
+
+
+class XlsxExportWriter:
+    """XLSX в потоковом режиме openpyxl: строки сразу уходят во временный XML, а не копятся в памяти"""
+
+    def open(self, path: str):
+        try:
+            from openpyxl import Workbook
+        except ImportError:
+            raise RuntimeError("Экспорт в XLSX недоступен: установите пакет openpyxl")
+        self._path = path
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet("Transactions")
+        self._sheet.append([title for _, title in EXPORT_COLUMNS])
+
+    def write(self, records: List[TransactionRecord]):
+        for record in records:
+            self._sheet.append(_row(record))
+
+    def close(self):
+        self._workbook.save(self._path)
+
+
+class PdfExportWriter:
+    """PDF-таблица на reportlab, страница за страницей
+    
+    reportlab держит документ до save(), поэтому страницы сжимаются - память
+    пропорциональна размеру итогового файла, а не числу объектов записей.
+    """
+
+    FONT_SIZE = 7
+    LINE_HEIGHT = 10
+    # Доли ширины страницы под колонки
+    WIDTHS = (0.08, 0.06, 0.11, 0.09, 0.08, 0.05, 0.09, 0.27, 0.07, 0.10)
+
+    def open(self, path: str):
+        try:
+            from reportlab.lib.pagesizes import A4, landscape
+            from reportlab.pdfgen import canvas
+        except ImportError:
+            raise RuntimeError("Экспорт в PDF недоступен: установите пакет reportlab")
+        self._font = self._register_font()
+        self._page_width, self._page_height = landscape(A4)
+        self._canvas = canvas.Canvas(path, pagesize=landscape(A4), pageCompression=1)
+        self._new_page()
+
+    def _register_font(self) -> str:
+        """Шрифт с кириллицей из EXPORT_FONT; без него кириллица в PDF не отображается"""
+        if config.EXPORT_FONT and os.path.exists(config.EXPORT_FONT):
+            from reportlab.pdfbase import pdfmetrics
+            from reportlab.pdfbase.ttfonts import TTFont
+
+            pdfmetrics.registerFont(TTFont("ExportFont", config.EXPORT_FONT))
+            return "ExportFont"
+        logger.warning(f"Export font {config.EXPORT_FONT!r} not found, Cyrillic will not render in PDF")
+        return "Helvetica"
+
+    def _new_page(self):
+        self._y = self._page_height - 40
+        self._line([title for _, title in EXPORT_COLUMNS])
+        self._y -= 4
+
+    def _line(self, values: list):
+        self._canvas.setFont(self._font, self.FONT_SIZE)
+        x = 30
+        usable = self._page_width - 60
+        for value, share in zip(values, self.WIDTHS):
+            width = usable * share
+            text = str(value)
+            # Грубая обрезка по средней ширине символа, чтобы колонки не наезжали друг на друга
+            limit = max(int(width / (self.FONT_SIZE * 0.55)), 1)
+            self._canvas.drawString(x, self._y, text if len(text) <= limit else text[:limit - 1] + "…")
+            x += width
+        self._y -= self.LINE_HEIGHT
+
+    def write(self, records: List[TransactionRecord]):
+        for record in records:
+            if self._y < 30:
+                self._canvas.showPage()
+                self._new_page()
+            self._line(_row(record))
+
+    def close(self):
+        self._canvas.save()
+
+
+WRITERS = {"csv": CsvExportWriter, "xlsx": XlsxExportWriter, "pdf": PdfExportWriter}
+
+
+async def export_transactions(sheets, export_format: str, start_date: str = None, end_date: str = None):
+    """Пишет транзакции периода во временный файл и возвращает (путь, число строк)
+
+    Транзакции читаются пачками по месяцам (iter_transactions), а каждая пачка пишется
+    в файл в рабочем потоке - память ограничена одной пачкой, цикл событий не блокируется.
+    Удалить файл после отправки должен вызывающий код.
+    """
+    writer = WRITERS[export_format]()
+    fd, path = tempfile.mkstemp(prefix="fincopilot-export-", suffix=f".{export_format}")
+    os.close(fd)
+    count = 0
+    try:
+        await asyncio.to_thread(writer.open, path)
+        async for chunk in sheets.iter_transactions(start_date, end_date):
+            await asyncio.to_thread(writer.write, chunk)
+            count += len(chunk)
+        await asyncio.to_thread(writer.close)
+    except Exception:
+        os.remove(path)
+        raise
+    logger.info(f"Exported {count} transactions to {export_format} ({os.path.getsize(path)} bytes)")
+    return path, count
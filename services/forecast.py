@@ -0,0 +1,235 @@
+import calendar
+import logging
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Признаки дня: константа, линейный тренд, 6 индикаторов дня недели, фаза месяца (sin, cos)
+FEATURES = 10
+# Гребневая регуляризация: в редких категориях тренд и сезонность не раскачиваются
+RIDGE = 1.0
+# Окно, по которому get_budget_status считает расход бюджета (последние 30 дней и сегодня)
+BUDGET_WINDOW_DAYS = 31
+
+
+def design_matrix(days: List[date], origin: date, scale: int) -> np.ndarray:
+    """Матрица признаков [дни, FEATURES] для линейной модели дневных сумм"""
+    trend = np.array([(day - origin).days for day in days], dtype=np.float64) / scale
+    weekday = np.array([day.weekday() for day in days])
+    phase = np.array([
+        2 * np.pi * (day.day - 1) / calendar.monthrange(day.year, day.month)[1] for day in days
+    ])
+    matrix = np.empty((len(days), FEATURES))
+    matrix[:, 0] = 1.0
+    matrix[:, 1] = trend
+    matrix[:, 2:8] = weekday[:, None] == np.arange(6)[None, :]
+    matrix[:, 8] = np.sin(phase)
+    matrix[:, 9] = np.cos(phase)
+    return matrix
+
+
+@dataclass
+class MonthForecast:
+    month: str
+    income: float  # фактические доходы с начала месяца
+    expense: float
+    projected_income: float  # прогноз на оставшиеся дни
+    projected_expense: float
+    days_left: int
+
+    @property
+    def balance(self) -> float:
+        """Прогноз баланса месяца: доходы минус расходы к концу месяца"""
+        return self.income + self.projected_income - self.expense - self.projected_expense
+
+    @property
+    def text(self) -> str:
+        emoji = "📈" if self.balance > 0 else "📉" if self.balance < 0 else "➡️"
+        return (
+            f"🔮 Прогноз на конец месяца ({self.days_left} дн. осталось):\n"
+            f"• Доходы: {self.income + self.projected_income:.2f} руб\n"
+            f"• Расходы: {self.expense + self.projected_expense:.2f} руб\n"
+            f"• {emoji} Баланс: {self.balance:.2f} руб"
+        )
+
+
+class CashFlowModel:
+    """Линейные модели дневных доходов и расходов всех категорий за окно истории
+
+    Все категории решаются одним МНК: X общая для всех рядов, поэтому хранятся
+    нормальные уравнения X^T X и X^T Y. Новая транзакция добавляет строку признаков
+    своего дня в X^T Y, коэффициенты пересчитываются решением системы FEATURES x FEATURES.
+    """
+
+    def __init__(self, records, end: date, history_days: int):
+        self.end = end
+        self.start = end - timedelta(days=history_days - 1)
+        self.days = [self.start + timedelta(days=i) for i in range(history_days)]
+        self.day_index = {day.isoformat(): i for i, day in enumerate(self.days)}
+        self.scale = history_days
+        self.matrix = design_matrix(self.days, self.start, self.scale)
+        penalty = np.full(FEATURES, RIDGE)
+        penalty[0] = 0.0
+        self.xtx = self.matrix.T @ self.matrix + np.diag(penalty)
+        # Ряды по ключу (тип, категория): [ключи, дни] в рублях и X^T Y в виде [ключи, FEATURES]
+        self.keys: Dict[tuple, int] = {}
+        self.series = np.zeros((0, history_days))
+        self.xty = np.zeros((0, FEATURES))
+        self._coefficients = None
+        self.add(records)
+
+    def add(self, records):
+        """Учитывает новые записи; записи вне окна истории пропускаются"""
+        rows, days, amounts = [], [], []
+        for r in records:
+            day = self.day_index.get(r.date)
+            if day is None or not r.is_valid or not r.amount_base_minor:
+                continue
+            key = (r.type, r.category)
+            if key not in self.keys:
+                self.keys[key] = len(self.keys)
+            rows.append(self.keys[key])
+            days.append(day)
+            amounts.append(r.amount_base_minor / 100)
+        if not rows:
+            return
+        missing = len(self.keys) - self.series.shape[0]
+        if missing:
+            self.series = np.vstack([self.series, np.zeros((missing, self.series.shape[1]))])
+            self.xty = np.vstack([self.xty, np.zeros((missing, FEATURES))])
+        rows, days, amounts = np.array(rows), np.array(days), np.array(amounts)
+        np.add.at(self.series, (rows, days), amounts)
+        np.add.at(self.xty, rows, self.matrix[days] * amounts[:, None])
+        self._coefficients = None
+
+    def predict(self, days: int) -> np.ndarray:
+        """Прогноз дневных сумм на days дней после end: [ключи, дни], без отрицательных значений"""
+        if self._coefficients is None:
+            self._coefficients = np.linalg.solve(self.xtx, self.xty.T)
+        future = [self.end + timedelta(days=i + 1) for i in range(days)]
+        return np.clip(design_matrix(future, self.start, self.scale) @ self._coefficients, 0, None).T
+
+    def _rows(self, kind: str, category: str = None) -> List[int]:
+        return [row for (type_, name), row in self.keys.items() if type_ == kind and category in (None, name)]
+
+    def daily(self, kind: str, category: str = None, days: int = BUDGET_WINDOW_DAYS) -> np.ndarray:
+        """Фактические суммы за последние days дней: по категории или по всем категориям типа"""
+        rows = self._rows(kind, category)
+        return self.series[rows, -days:].sum(axis=0) if rows else np.zeros(min(days, len(self.days)))
+
+    def projected(self, kind: str, category: str = None, days: int = BUDGET_WINDOW_DAYS) -> np.ndarray:
+        """Прогноз сумм на days дней вперед: по категории или по всем категориям типа"""
+        rows = self._rows(kind, category)
+        return self.predict(days)[rows].sum(axis=0) if rows else np.zeros(days)
+
+    def _total(self, values: np.ndarray, kind: str) -> float:
+        rows = self._rows(kind)
+        return float(values[rows].sum()) if rows else 0.0
+
+    def month_end(self) -> MonthForecast:
+        days_left = calendar.monthrange(self.end.year, self.end.month)[1] - self.end.day
+        month_from = self.day_index.get(self.end.replace(day=1).isoformat(), 0)
+        actual = self.series[:, month_from:]
+        projected = self.predict(days_left)
+        return MonthForecast(
+            month=self.end.strftime('%Y-%m'),
+            income=self._total(actual, 'income'),
+            expense=self._total(actual, 'expense'),
+            projected_income=self._total(projected, 'income'),
+            projected_expense=self._total(projected, 'expense'),
+            days_left=days_left
+        )
+
+    def exhaustion_date(self, category: str, limit: float, horizon: int) -> Optional[date]:
+        """Первый день, когда расход категории за окно бюджета превысит limit, или None
+
+        Для уже превышенного бюджета и бюджета, которого хватит на horizon дней, возвращается None.
+        """
+        row = self.keys.get(('expense', category))
+        if row is None:
+            return None
+        window = BUDGET_WINDOW_DAYS
+        spent = self.series[row, -window:]
+        if spent.sum() > limit:
+            return None
+        # Скользящая сумма по окну бюджета: фактические дни постепенно сменяются прогнозом
+        combined = np.concatenate([spent[1:], self.predict(horizon)[row]])
+        cumulative = np.concatenate([[0.0], np.cumsum(combined)])
+        rolling = cumulative[window:] - cumulative[:-window]
+        exceeded = np.flatnonzero(rolling > limit)
+        return self.end + timedelta(days=int(exceeded[0]) + 1) if exceeded.size else None
+
+
+class CashFlowForecaster:
+    """Прогноз денежного потока для отчетов и статуса бюджетов
+
+    Модель строится по транзакциям за FORECAST_HISTORY_DAYS дней и дальше обновляется
+    добавленными записями (append_listeners сервиса таблиц) без перечитывания истории.
+    Полный пересчет - при смене дня, после правок и удалений или по TTL кэша листов.
+    """
+
+    def __init__(self, history_days: int = None, horizon_days: int = None):
+        self.history_days = max(history_days or config.FORECAST_HISTORY_DAYS, 2 * BUDGET_WINDOW_DAYS)
+        self.horizon_days = horizon_days or config.FORECAST_HORIZON_DAYS
+        self._model: Optional[CashFlowModel] = None
+        self._fitted_at = 0.0
+        self._subscribed = None
+
+    def on_append(self, records):
+        if self._model is None:
+            return
+        if records is None:
+            self._model = None
+        else:
+            self._model.add(records)
+
+    def _subscribe(self, sheets):
+        if self._subscribed is not sheets:
+            sheets.append_listeners.append(self.on_append)
+            self._subscribed = sheets
+            self._model = None
+
+    async def model(self, sheets) -> CashFlowModel:
+        self._subscribe(sheets)
+        today = datetime.now().date()
+        model = self._model
+        if model is not None and model.end == today and time.monotonic() - self._fitted_at < config.SHEETS_CACHE_TTL:
+            return model
+        start = today - timedelta(days=self.history_days - 1)
+        records = await sheets.get_transactions(start.isoformat(), today.isoformat())
+        started = time.perf_counter()
+        model = self._model = CashFlowModel(records, today, self.history_days)
+        self._fitted_at = time.monotonic()
+        logger.info(f"Forecast fitted: {len(model.keys)} series from {len(records)} rows, "
+                    f"{(time.perf_counter() - started) * 1000:.1f} ms")
+        return model
+
+    async def month_end(self, sheets) -> Optional[MonthForecast]:
+        """Прогноз доходов, расходов и баланса к концу текущего месяца (None при ошибке)"""
+        try:
+            return (await self.model(sheets)).month_end()
+        except Exception as e:
+            logger.error(f"Forecast failed: {e}")
+            return None
+
+    async def exhaustion_dates(self, sheets, status: list) -> Dict[str, Optional[date]]:
+        """Даты исчерпания бюджетов из get_budget_status по категориям"""
+        try:
+            model = await self.model(sheets)
+        except Exception as e:
+            logger.error(f"Forecast failed: {e}")
+            return {}
+        return {
+            item['category']: model.exhaustion_date(item['category'], item['budget'], self.horizon_days)
+            for item in status
+        }
+
+
+forecaster = CashFlowForecaster()
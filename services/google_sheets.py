@@ -1,18 +1,84 @@
-import gspread
-from google.oauth2.service_account import Credentials
 from config import config
-from models.transaction import Transaction
+from models.transaction import (
+    Transaction, TransactionRecord, TRANSACTION_FIELDS, decode_date, from_minor_units, to_minor_units
+)
 from models.budget import Budget
+from services.metrics import instrument, metrics, estimate_size
+from services.quota import BACKGROUND, http_client, quota, scheduled, side_effect
+from services.currency import get_rate_table
+from services.archive import TransactionArchive
+from services import cluster
+from services.cluster import serialized
+from services.partitions import (
+    CATALOG_HEADERS, CATALOG_SHEET, LEGACY_SHEET, PARTITION_ROWS,
+    STATUS_ARCHIVED, STATUS_LIVE, STATUS_REOPENED, SUMMARY_HEADERS, SUMMARY_SHEET,
+    month_offset, overlaps, partition_month, partition_title, range_name, title_month
+)
+from services.transaction_table import TransactionTable, merge_aggregates, merge_between
 import os
 from datetime import datetime, timedelta
+import asyncio
 import logging
+import time
 import uuid
 
 logger = logging.getLogger(__name__)
 
+# Чтение без форматирования: числа приходят числами, даты - серийными номерами
+VALUE_RENDER_UNFORMATTED = "UNFORMATTED_VALUE"
+
+
+def period_bounds(period: str):
+    """Границы периода week/month (последние 7/30 дней) или всей истории для других значений"""
+    now = datetime.now()
+    if period == "month":
+        start_date = (now - timedelta(days=30)).strftime('%Y-%m-%d')
+    elif period == "week":
+        start_date = (now - timedelta(days=7)).strftime('%Y-%m-%d')
+    else:
+        start_date = "2000-01-01"
+    return start_date, now.strftime('%Y-%m-%d')
+
+
+def previous_bounds(start_date: str, end_date: str):
+    """Предыдущий период той же длины, заканчивающийся накануне start_date"""
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    days = (datetime.strptime(end_date, '%Y-%m-%d') - start).days + 1
+    return (start - timedelta(days=days)).strftime('%Y-%m-%d'), (start - timedelta(days=1)).strftime('%Y-%m-%d')
+
+@instrument("sheets")
+@scheduled(reads=(
+    "get_partitions", "get_transactions", "get_transactions_by_period", "get_financial_stats",
+    "get_monthly_stats", "search_transactions", "get_budgets", "get_budget_status"
+))
 class GoogleSheetsService:
-    def __init__(self):
+    def __init__(self, sheet=None):
         self.scope = ['https://www.googleapis.com/auth/spreadsheets']
+        self._worksheets = {}
+        # Каталог партиций: (время загрузки, {месяц: лист}) и статусы {месяц: статус}
+        self._catalog = None
+        self._status = {}
+        self.archive = TransactionArchive()
+        # Есть ли неразбитый лист Transactions (None - еще не проверяли)
+        self._legacy = None
+        # Разобранные транзакции по листам: {лист: (время загрузки, TransactionTable)}
+        self._tables = {}
+        self._checked_headers = set()
+        self.invalid_rows = 0
+        # Вызываются после каждой записи транзакций (например, сброс предрассчитанных отчетов)
+        self.listeners = []
+        # Получают добавленные записи TransactionRecord (None - данные изменились иначе, нужен пересчет)
+        self.append_listeners = []
+        # Поколение транзакций в общем хранилище процессов (services.cluster), которое видел этот процесс
+        self._generation = 0
+        if sheet is not None:
+            # Уже открытая таблица (например, локальная заглушка для бенчмарков)
+            self.sheet = sheet
+            return
+        # gspread и google-auth импортируются только при реальном подключении
+        import gspread
+        from google.oauth2.service_account import Credentials
+        
         creds_path = config.GOOGLE_SHEETS_CREDENTIALS
         if not creds_path:
             raise RuntimeError(
@@ -21,32 +87,57 @@ class GoogleSheetsService:
         if not os.path.exists(creds_path):
             raise RuntimeError(f"Файл учетных данных Google не найден: {creds_path}")
         self.creds = Credentials.from_service_account_file(creds_path, scopes=self.scope)
-        self.client = gspread.authorize(self.creds)
+        # Все запросы идут через очередь квоты (services.quota)
+        self.client = gspread.authorize(self.creds, http_client=http_client())
         self.sheet = self.client.open_by_key(config.SPREADSHEET_ID)
     
-    async def add_transaction(self, transaction: Transaction):
-        """Добавляет транзакцию в Google Sheets с правильной структурой"""
-        worksheet = self.sheet.worksheet("Transactions")
-        
-        # Проверяем и создаем заголовки если нужно
+    def _worksheet(self, title: str):
+        """Лист по названию; объекты листов кэшируются, чтобы не запрашивать метаданные таблицы на каждый вызов"""
+        worksheet = self._worksheets.get(title)
+        if worksheet is None:
+            worksheet = self._worksheets[title] = self.sheet.worksheet(title)
+        return worksheet
+    
+    async def warm_up(self):
+        """Открывает основные листы заранее, чтобы первый запрос не платил за метаданные"""
         try:
-            current_headers = worksheet.row_values(1)
-            expected_headers = [
-                "uuid", "date", "type", "category", "subcategory", 
-                "amount", "currency", "description", "source", "created_at"
-            ]
-            
-            if not current_headers or current_headers != expected_headers:
-                worksheet.clear()
-                worksheet.append_row(expected_headers)
+            self._worksheet("Budgets")
         except Exception as e:
-            logger.error(f"Error checking headers: {e}")
-            # Создаем новую таблицу с заголовками
-            worksheet.clear()
+            logger.warning(f"Warm-up: worksheet Budgets unavailable: {e}")
+        # Каталог и партиции, которые читают недельные и месячные отчеты
+        start_date = (datetime.now() - timedelta(days=31)).strftime('%Y-%m-%d')
+        await self._load_tables(start_date, None)
+    
+    def _ensure_headers(self, worksheet):
+        """Проверяет заголовки листа транзакций один раз за время жизни сервиса
+        
+        Недостающие колонки в конце (например, amount_base) дописываются без очистки листа.
+        """
+        if worksheet.title in self._checked_headers:
+            return
+        expected_headers = list(TRANSACTION_FIELDS)
+        current_headers = worksheet.row_values(1)
+        
+        if not current_headers:
             worksheet.append_row(expected_headers)
+        elif current_headers == expected_headers[:len(current_headers)]:
+            for col in range(len(current_headers) + 1, len(expected_headers) + 1):
+                worksheet.update_cell(1, col, expected_headers[col - 1])
+        elif current_headers[:len(expected_headers)] != expected_headers:
+            logger.error(f"Unexpected headers in {worksheet.title}: {current_headers}")
         
-        # Данные в ТОЧНОМ порядке заголовков
-        row = [
+        self._checked_headers.add(worksheet.title)
+    
+    def _to_row(self, transaction: Transaction) -> list:
+        """Строка листа в порядке заголовков; сумма в базовой валюте считается здесь, при записи"""
+        if transaction.amount_base is None:
+            amount_base_minor = get_rate_table().convert_minor(
+                to_minor_units(transaction.amount), transaction.currency, transaction.date
+            )
+            if amount_base_minor is not None:
+                transaction.amount_base = from_minor_units(amount_base_minor)
+        
+        return [
             transaction.uuid,
             transaction.date,
             transaction.type,
@@ -56,32 +147,67 @@ class GoogleSheetsService:
             transaction.currency,
             transaction.description,
             transaction.source,
-            transaction.created_at
+            transaction.created_at,
+            transaction.amount_base if transaction.amount_base is not None else ""
         ]
+    
+    @serialized("sheets")
+    async def add_transaction(self, transaction: Transaction):
+        """Добавляет транзакцию в лист партиции ее месяца"""
+        title = await self._partition_for(transaction.date)
+        worksheet = self._worksheet(title)
+        self._ensure_headers(worksheet)
         
+        row = self._to_row(transaction)
         worksheet.append_row(row)
+        metrics.add_bytes(estimate_size([row]))
+        record = self._cache_append(title, row)
+        self._notify_change([record])
+    
+    @serialized("sheets")
+    async def add_transactions(self, transactions: list, chunk_size: int = 5000) -> int:
+        """Пакетная запись: строки группируются по партициям и пишутся append_rows по chunk_size строк
+        
+        Возвращает число записанных строк.
+        """
+        by_title = {}
+        for transaction in transactions:
+            title = await self._partition_for(transaction.date)
+            by_title.setdefault(title, []).append(self._to_row(transaction))
+        
+        columns = {field: index for index, field in enumerate(TRANSACTION_FIELDS)}
+        decode = self._decoder(columns)
+        added = []
+        for title, rows in by_title.items():
+            worksheet = self._worksheet(title)
+            self._ensure_headers(worksheet)
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                worksheet.append_rows(chunk)
+                metrics.add_bytes(estimate_size(chunk))
+        
+            # Кэш партиции перестраивается один раз на пачку, а не вставкой по строке
+            records = [decode(row) for row in rows]
+            added.extend(records)
+            cached = self._tables.get(title)
+            if cached is not None:
+                self._tables[title] = (cached[0], TransactionTable(cached[1].records + records))
+        self._notify_change(added)
+        return sum(len(rows) for rows in by_title.values())
     
+    @serialized("sheets")
     async def initialize_sheet_structure(self):
         """Инициализирует правильную структуру таблицы"""
         try:
-            # Лист транзакций
-            try:
-                worksheet = self.sheet.worksheet("Transactions")
-            except:
-                worksheet = self.sheet.add_worksheet(title="Transactions", rows="1000", cols="10")
-            
-            headers = [
-                "uuid", "date", "type", "category", "subcategory",
-                "amount", "currency", "description", "source", "created_at"
-            ]
-            worksheet.clear()
-            worksheet.append_row(headers)
+            # Каталог и партиция текущего месяца; листы прошлых месяцев создаются по мере записи
+            await self._load_catalog()
+            await self._partition_for(datetime.now().strftime('%Y-%m-%d'))
             
             # Лист бюджетов
             try:
-                budget_ws = self.sheet.worksheet("Budgets")
-            except:
-                budget_ws = self.sheet.add_worksheet(title="Budgets", rows="100", cols="6")
+                budget_ws = self._worksheet("Budgets")
+            except Exception:
+                budget_ws = self._worksheets["Budgets"] = self.sheet.add_worksheet(title="Budgets", rows="100", cols="6")
             
             budget_headers = [
                 "user_id", "category", "amount", "period", "created_at", "updated_at"
@@ -95,150 +221,366 @@ class GoogleSheetsService:
             logger.error(f"Error initializing sheet: {e}")
             return False
     
+    async def _load_catalog(self) -> dict:
+        """Каталог партиций {YYYY-MM: лист}; кэшируется на SHEETS_CACHE_TTL секунд
+        
+        Если листа каталога нет, он создается по уже существующим листам Transactions_YYYY_MM.
+        """
+        if self._catalog is not None:
+            loaded_at, catalog = self._catalog
+            if time.monotonic() - loaded_at < config.SHEETS_CACHE_TTL:
+                return catalog
+        
+        from gspread.exceptions import WorksheetNotFound
+        try:
+            worksheet = self._worksheet(CATALOG_SHEET)
+            rows = worksheet.get_all_values()
+        except WorksheetNotFound:
+            now = datetime.now().isoformat()
+            rows = [CATALOG_HEADERS] + sorted(
+                [title_month(ws.title), ws.title, now]
+                for ws in self.sheet.worksheets() if title_month(ws.title)
+            )
+            worksheet = self._worksheets[CATALOG_SHEET] = self.sheet.add_worksheet(
+                title=CATALOG_SHEET, rows=len(rows) + 100, cols=len(CATALOG_HEADERS)
+            )
+            worksheet.append_rows(rows)
+            logger.info(f"Partition catalog created with {len(rows) - 1} partitions")
+        
+        if len(rows[0]) < len(CATALOG_HEADERS):
+            # Каталог, созданный до появления колонки status
+            for col in range(len(rows[0]) + 1, len(CATALOG_HEADERS) + 1):
+                worksheet.update_cell(1, col, CATALOG_HEADERS[col - 1])
+        
+        catalog, status = {}, {}
+        for row in rows[1:]:
+            if len(row) > 1 and row[0] and row[1]:
+                catalog[str(row[0])] = str(row[1])
+                status[str(row[0])] = str(row[3]) if len(row) > 3 else STATUS_LIVE
+        self._catalog = (time.monotonic(), catalog)
+        self._status = status
+        return catalog
+    
+    def _set_status(self, month: str, status: str):
+        """Обновляет статус партиции в каталоге"""
+        worksheet = self._worksheet(CATALOG_SHEET)
+        cell = worksheet.find(month, in_column=1)
+        if cell is not None:
+            worksheet.update_cell(cell.row, CATALOG_HEADERS.index("status") + 1, status)
+        self._status[month] = status
+    
+    def _has_sheet(self, month: str) -> bool:
+        return self._status.get(month, STATUS_LIVE) != STATUS_ARCHIVED
+    
+    def _has_archive(self, month: str) -> bool:
+        return self._status.get(month, STATUS_LIVE) in (STATUS_ARCHIVED, STATUS_REOPENED)
+    
+    async def get_partitions(self) -> dict:
+        """Партиции транзакций {YYYY-MM: лист} по возрастанию месяца"""
+        return dict(sorted((await self._load_catalog()).items()))
+    
+    async def _partition_for(self, date: str) -> str:
+        """Лист партиции для даты; при первой записи в месяц лист создается и вносится в каталог"""
+        month = partition_month(date)
+        catalog = await self._load_catalog()
+        title = catalog.get(month)
+        if title is not None and self._has_sheet(month):
+            return title
+        if cluster.enabled():
+            # Партицию мог создать другой воркер: каталог перечитывается перед созданием
+            self._catalog = None
+            catalog = await self._load_catalog()
+            title = catalog.get(month)
+            if title is not None and self._has_sheet(month):
+                return title
+        
+        # Новый месяц или запись задним числом в заархивированный: лист создается заново
+        reopened = title is not None
+        title = partition_title(month)
+        try:
+            worksheet = self.sheet.add_worksheet(title=title, rows=PARTITION_ROWS, cols=len(TRANSACTION_FIELDS))
+            worksheet.append_row(list(TRANSACTION_FIELDS))
+        except Exception:
+            # Лист мог создать другой процесс - тогда он уже существует
+            worksheet = self.sheet.worksheet(title)
+        self._worksheets[title] = worksheet
+        self._checked_headers.add(title)
+        if reopened:
+            self._set_status(month, STATUS_REOPENED)
+        else:
+            self._worksheet(CATALOG_SHEET).append_row([month, title, datetime.now().isoformat(), STATUS_LIVE])
+            catalog[month] = title
+            self._status[month] = STATUS_LIVE
+        # Пустая партиция известна целиком - читать ее не нужно
+        self._tables[title] = (time.monotonic(), TransactionTable([]))
+        logger.info(f"Created partition {title}")
+        return title
+    
+    def _has_legacy(self) -> bool:
+        """Есть ли лист Transactions с историей до разбиения на партиции"""
+        if self._legacy is None:
+            try:
+                self._worksheet(LEGACY_SHEET)
+                self._legacy = True
+            except Exception:
+                self._legacy = False
+        return self._legacy
+    
+    def _decoder(self, columns: dict):
+        rates = get_rate_table()
+        return TransactionRecord.row_decoder(columns, rates.convert_minor)
+    
+    def _cache_append(self, title: str, row: list):
+        """Добавляет записанную строку в кэш партиции, не перечитывая лист; возвращает разобранную запись"""
+        columns = {field: index for index, field in enumerate(TRANSACTION_FIELDS)}
+        record = self._decoder(columns)(row)
+        cached = self._tables.get(title)
+        if cached is not None:
+            cached[1].insert(record)
+        return record
+    
+    def _notify_change(self, added: list = None, remote: bool = False):
+        """Оповещает подписчиков о записи; added - новые записи, если транзакции только добавлялись
+        
+        Запись этого процесса увеличивает поколение в общем хранилище, чтобы остальные воркеры
+        сбросили кэши (remote - изменение пришло от другого воркера, поколение уже учтено).
+        """
+        if cluster.enabled() and not remote:
+            generation = cluster.store.bump("transactions")
+            if generation != self._generation + 1:
+                # Пропущена запись другого воркера: добавленных строк недостаточно, нужен пересчет
+                self._catalog = None
+                self._invalidate_transactions()
+                added = None
+            self._generation = generation
+        for listener in self.listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.error(f"Change listener failed: {e}")
+        for listener in self.append_listeners:
+            try:
+                listener(added)
+            except Exception as e:
+                logger.error(f"Append listener failed: {e}")
+    
+    def _sync_cluster(self):
+        """Сбрасывает кэши, если транзакции с прошлого чтения менял другой воркер"""
+        if not cluster.enabled():
+            return
+        generation = cluster.store.generation("transactions")
+        if generation != self._generation:
+            self._generation = generation
+            self._catalog = None
+            if self._legacy:
+                # Лист Transactions мог перенести другой воркер
+                self._legacy = None
+            self._invalidate_transactions()
+            self._notify_change(remote=True)
+    
+    def _invalidate_transactions(self, *titles: str):
+        """Сбрасывает кэш указанных листов (без аргументов - всех)"""
+        if not titles:
+            self._tables.clear()
+        for title in titles:
+            self._tables.pop(title, None)
+    
+    def _build_table(self, title: str, data: list) -> TransactionTable:
+        """Разбирает значения листа, каждую колонку один раз"""
+        records = []
+        if len(data) > 1:
+            # Индекс колонки по заголовку (при дублях берется первая колонка)
+            columns = {}
+            for index, header in enumerate(data[0]):
+                columns.setdefault(str(header), index)
+            decode = self._decoder(columns)
+            records = [decode(row) for row in data[1:]]
+        table = TransactionTable(records)
+        
+        # Некорректные строки считаем один раз на чтение, а не предупреждением на каждую
+        invalid = table.invalid_count
+        if invalid:
+            metrics.increment("sheets_invalid_rows", invalid)
+            logger.warning(f"{title}: {invalid} rows with invalid amount, type or currency")
+        return table
+    
+    def _source_keys(self, catalog: dict, months: list) -> list:
+        """Источники строк месяцев по порядку: файл архива и/или лист партиции"""
+        keys = []
+        for month in months:
+            if self._has_archive(month):
+                keys.append(self.archive.path(catalog[month]))
+            if self._has_sheet(month):
+                keys.append(catalog[month])
+        return keys
+    
+    async def _fetch_tables(self, keys: list) -> dict:
+        """Читает источники без кэширования: архивы из файлов в потоке, листы одним запросом batch_get"""
+        tables = {}
+        titles = []
+        for key in keys:
+            if self.archive.is_archive_file(key):
+                data = await asyncio.to_thread(self.archive.read_file, key)
+                tables[key] = self._build_table(key, data)
+            else:
+                titles.append(key)
+        if titles:
+            response = self.sheet.values_batch_get(
+                [range_name(title) for title in titles],
+                params={"valueRenderOption": VALUE_RENDER_UNFORMATTED}
+            )
+            for title, value_range in zip(titles, response.get("valueRanges", [])):
+                data = value_range.get("values", [])
+                metrics.add_bytes(estimate_size(data))
+                tables[title] = self._build_table(title, data)
+        return tables
+    
+    def _is_fresh(self, key: str, now: float) -> bool:
+        # Файлы архива неизменяемы - их кэш не устаревает
+        cached = self._tables.get(key)
+        return cached is not None and (
+            self.archive.is_archive_file(key) or now - cached[0] < config.SHEETS_CACHE_TTL
+        )
+    
+    async def _period_keys(self, start_date: str = None, end_date: str = None) -> list:
+        """Источники строк периода: партиции пересекающихся месяцев и лист Transactions, пока он не перенесен"""
+        self._sync_cluster()
+        catalog = await self._load_catalog()
+        months = [month for month in sorted(catalog) if overlaps(month, start_date, end_date)]
+        keys = self._source_keys(catalog, months)
+        if self._has_legacy():
+            keys.insert(0, LEGACY_SHEET)
+        return keys
+    
+    async def _load_tables(self, start_date: str = None, end_date: str = None) -> list:
+        """Таблицы источников периода, с кэшем
+        
+        Устаревшие или еще не прочитанные листы скачиваются одним запросом batch_get;
+        кэш каждого листа живет SHEETS_CACHE_TTL секунд, записи этого процесса обновляют его сами.
+        Заархивированные месяцы читаются из локальных файлов и кэшируются без срока жизни.
+        """
+        keys = await self._period_keys(start_date, end_date)
+        now = time.monotonic()
+        stale = [key for key in keys if not self._is_fresh(key, now)]
+        if stale:
+            for key, table in (await self._fetch_tables(stale)).items():
+                self._tables[key] = (now, table)
+            self.invalid_rows = sum(table.invalid_count for _, table in self._tables.values())
+        return [self._tables[key][1] for key in keys if key in self._tables]
+    
+    async def iter_transactions(self, start_date: str = None, end_date: str = None, batch: int = 3):
+        """Транзакции периода пачками по batch месяцев, без загрузки всей истории в память
+        
+        Свежие таблицы берутся из кэша, остальные читаются и не кэшируются -
+        выгрузка за годы не раздувает память процесса. Генератор не проходит через
+        декоратор scheduled, поэтому каждое чтение - отдельная фоновая операция очереди квоты.
+        """
+        keys = await quota.run(lambda: self._period_keys(start_date, end_date), priority=BACKGROUND)
+        groups = [keys[i:i + batch] for i in range(0, len(keys), batch)]
+        for group in groups:
+            now = time.monotonic()
+            tables = {key: self._tables[key][1] for key in group if self._is_fresh(key, now)}
+            missing = [key for key in group if key not in tables]
+            if missing:
+                tables.update(await quota.run(lambda: self._fetch_tables(missing), priority=BACKGROUND))
+            chunk = merge_between([tables[key] for key in group if key in tables], start_date, end_date)
+            if chunk:
+                yield chunk
+    
     async def get_transactions(self, start_date: str = None, end_date: str = None):
-        """Получает транзакции за период"""
-        worksheet = self.sheet.worksheet("Transactions")
+        """Получает транзакции за период (по возрастанию даты)
         
+        Читаются только партиции месяцев, пересекающихся с периодом.
+        """
         try:
-            # Получаем все данные
-            data = worksheet.get_all_values()
-            
-            if len(data) <= 1:  # Только заголовки или пусто
-                return []
-            
-            # Извлекаем заголовки и делаем их уникальными
-            headers = data[0]
-            unique_headers = []
-            header_count = {}
-            
-            for header in headers:
-                if header in header_count:
-                    header_count[header] += 1
-                    unique_headers.append(f"{header}_{header_count[header]}")
-                else:
-                    header_count[header] = 1
-                    unique_headers.append(header)
-            
-            # Создаем записи
-            records = []
-            for row in data[1:]:
-                if len(row) < len(unique_headers):
-                    # Дополняем строку пустыми значениями
-                    row.extend([''] * (len(unique_headers) - len(row)))
-                
-                record = dict(zip(unique_headers, row[:len(unique_headers)]))
-                records.append(record)
-            
-            # Фильтруем по дате если нужно
-            if start_date and end_date:
-                filtered_records = []
-                for record in records:
-                    record_date = record.get('date', '')
-                    if start_date <= record_date <= end_date:
-                        filtered_records.append(record)
-                return filtered_records
-            
-            return records
-            
+            tables = await self._load_tables(start_date, end_date)
         except Exception as e:
             logger.error(f"Error reading transactions: {e}")
-            # Fallback: пытаемся прочитать без обработки заголовков
-            try:
-                return worksheet.get_all_records()
-            except:
-                return []
+            return []
+        
+        # Внутри таблицы записи отсортированы по дате - диапазон находится бинарным поиском
+        return merge_between(tables, start_date, end_date)
     
-    async def get_financial_stats(self, period: str, start_date: str = None, end_date: str = None):
-        """Получает финансовую статистику за период"""
+    async def get_financial_stats(self, period: str, start_date: str = None, end_date: str = None,
+                                  include_rows: bool = False):
+        """Получает финансовую статистику за период
+        
+        По умолчанию возвращает только агрегаты; include_rows=True добавляет списки
+        записей доходов и расходов (incomes/expenses).
+        """
         try:
             # Определяем период
-            if period == "custom" and start_date and end_date:
-                # Используем переданные даты
-                pass
-            else:
-                end_date = datetime.now().strftime('%Y-%m-%d')
-                if period == "month":
-                    start_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-                elif period == "week":
-                    start_date = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-                else:
-                    start_date = "2000-01-01"
-            
-            transactions = await self.get_transactions(start_date, end_date)
+            if not (period == "custom" and start_date and end_date):
+                start_date, end_date = period_bounds(period)
             
-            if not transactions:
-                return self._get_empty_stats()
+            tables = await self._load_tables(start_date, end_date)
             
-            # Обрабатываем транзакции
-            incomes = []
-            expenses = []
+            # Суммы в базовой валюте считаются по колонкам таблиц, в целых минорных единицах
+            totals = merge_aggregates(table.aggregate(start_date, end_date) for table in tables)
+            if not totals['transactions_count']:
+                return self._get_empty_stats(include_rows)
             
-            for t in transactions:
-                try:
-                    trans_type = str(t.get('type', '')).strip().lower()
-                    amount_str = t.get('amount', '0')
-                    
-                    # Преобразуем сумму в число
-                    try:
-                        amount = float(str(amount_str).replace(',', '.'))
-                    except (ValueError, TypeError):
-                        continue
-                    
-                    # Расширенная проверка типа транзакции
-                    if any(income_word in trans_type for income_word in ['income', 'доход', 'приход']):
-                        incomes.append({'amount': amount, 'category': t.get('category', 'прочее')})
-                    elif any(expense_word in trans_type for expense_word in ['expense', 'расход', 'трата', 'затрата']):
-                        expenses.append({'amount': amount, 'category': t.get('category', 'прочее')})
-                    else:
-                        # Если тип не распознан, логируем для отладки
-                        logger.warning(f"Unknown transaction type: '{trans_type}' in transaction: {t}")
-                        
-                except Exception as e:
-                    logger.warning(f"Error processing transaction: {e}, transaction: {t}")
-                    continue
-            
-            # Группируем по категориям
-            income_by_category = {}
-            expense_by_category = {}
-            
-            for t in incomes:
-                category = t.get('category', 'прочее')
-                income_by_category[category] = income_by_category.get(category, 0) + t.get('amount', 0)
-            
-            for t in expenses:
-                category = t.get('category', 'прочее')
-                expense_by_category[category] = expense_by_category.get(category, 0) + t.get('amount', 0)
-            
-            total_income = sum(t.get('amount', 0) for t in incomes)
-            total_expense = sum(t.get('amount', 0) for t in expenses)
-            
-            return {
-                'total_income': total_income,
-                'total_expense': total_expense,
-                'profit': total_income - total_expense,
-                'transactions_count': len(incomes) + len(expenses),
-                'income_by_category': income_by_category,
-                'expense_by_category': expense_by_category,
-                'incomes': incomes,
-                'expenses': expenses
-            }
+            stats = self._stats_from_totals(totals)
+            if include_rows:
+                rows = [t for t in merge_between(tables, start_date, end_date) if t.is_valid]
+                stats['incomes'] = [t for t in rows if t.type == 'income']
+                stats['expenses'] = [t for t in rows if t.type == 'expense']
+            return stats
             
         except Exception as e:
             logger.error(f"Error in get_financial_stats: {e}")
-            return self._get_empty_stats()
+            return self._get_empty_stats(include_rows)
     
-    def _get_empty_stats(self):
-        """Возвращает пустую статистику"""
+    async def get_monthly_stats(self, start_date: str = None, end_date: str = None) -> list:
+        """Статистика по месяцам периода (по умолчанию вся история), по возрастанию месяца
+        
+        Каждый элемент - словарь как у get_financial_stats с дополнительным ключом month.
+        """
+        try:
+            tables = await self._load_tables(start_date, end_date)
+        except Exception as e:
+            logger.error(f"Error in get_monthly_stats: {e}")
+            return []
+        
+        parts = {}
+        for table in tables:
+            for month, part in table.aggregate_by_month(start_date, end_date).items():
+                parts.setdefault(month, []).append(part)
+        return [
+            dict(self._stats_from_totals(merge_aggregates(parts[month])), month=month)
+            for month in sorted(parts)
+        ]
+    
+    @staticmethod
+    def _stats_from_totals(totals: dict) -> dict:
+        """Статистика в рублях из агрегатов в минорных единицах"""
         return {
+            'total_income': from_minor_units(totals['total_income']),
+            'total_expense': from_minor_units(totals['total_expense']),
+            'profit': from_minor_units(totals['total_income'] - totals['total_expense']),
+            'transactions_count': totals['transactions_count'],
+            'income_by_category': {
+                category: from_minor_units(amount) for category, amount in totals['income_by_category'].items()
+            },
+            'expense_by_category': {
+                category: from_minor_units(amount) for category, amount in totals['expense_by_category'].items()
+            }
+        }
+    
+    def _get_empty_stats(self, include_rows: bool = False):
+        """Возвращает пустую статистику"""
+        stats = {
             'total_income': 0,
             'total_expense': 0,
             'profit': 0,
             'transactions_count': 0,
             'income_by_category': {},
-            'expense_by_category': {},
-            'incomes': [],
-            'expenses': []
+            'expense_by_category': {}
         }
+        if include_rows:
+            stats['incomes'] = []
+            stats['expenses'] = []
+        return stats
     
     async def search_transactions(self, query: str, user_id: int = None):
         """Поиск транзакций по описанию и категории"""
@@ -247,12 +589,9 @@ class GoogleSheetsService:
         
         query_lower = query.lower()
         for t in transactions:
-            description = t.get('description', '').lower()
-            category = t.get('category', '').lower()
-            
-            if (query_lower in description or 
-                query_lower in category or 
-                query_lower in str(t.get('amount', '')).lower()):
+            if (query_lower in t.description.lower() or 
+                query_lower in t.category.lower() or 
+                (t.amount is not None and query_lower in str(t.amount))):
                 results.append(t)
         
         return results
@@ -261,9 +600,10 @@ class GoogleSheetsService:
         """Получает транзакции за произвольный период"""
         return await self.get_transactions(start_date, end_date)
     
+    @serialized("sheets")
     async def set_budget(self, budget: Budget):
         """Устанавливает бюджет для категории"""
-        worksheet = self.sheet.worksheet("Budgets")
+        worksheet = self._worksheet("Budgets")
         
         # Проверяем существующий бюджет
         try:
@@ -276,7 +616,7 @@ class GoogleSheetsService:
                     worksheet.update_cell(i, 3, budget.amount)  # amount
                     worksheet.update_cell(i, 6, budget.updated_at)  # updated_at
                     return True
-        except:
+        except Exception:
             pass
         
         # Создаем новый
@@ -294,10 +634,10 @@ class GoogleSheetsService:
     async def get_budgets(self, user_id: int):
         """Получает бюджеты пользователя"""
         try:
-            worksheet = self.sheet.worksheet("Budgets")
+            worksheet = self._worksheet("Budgets")
             records = worksheet.get_all_records()
             return [r for r in records if r['user_id'] == user_id]
-        except:
+        except Exception:
             return []
     
     async def get_budget_status(self, user_id: int, period: str = "month"):
@@ -323,14 +663,37 @@ class GoogleSheetsService:
         
         return status
     
-    async def edit_transaction(self, transaction_uuid: str, updates: dict):
-        """Редактирует транзакцию"""
-        worksheet = self.sheet.worksheet("Transactions")
+    async def _locate(self, transaction_uuid: str):
+        """Лист и номер строки транзакции или (None, None)
         
+        Сначала проверяются листы, уже прочитанные в кэш; остальные партиции
+        просматриваются от новых к старым поиском по колонке uuid.
+        """
+        self._sync_cluster()
+        catalog = await self._load_catalog()
+        # Заархивированные строки только для чтения
+        titles = sorted((title for month, title in catalog.items() if self._has_sheet(month)), reverse=True)
+        if self._has_legacy():
+            titles.append(LEGACY_SHEET)
+        cached = [
+            title for title in titles
+            if title in self._tables and any(t.uuid == transaction_uuid for t in self._tables[title][1].records)
+        ]
+        for title in cached + [title for title in titles if title not in cached]:
+            worksheet = self._worksheet(title)
+            cell = worksheet.find(transaction_uuid, in_column=1)
+            if cell is not None:
+                return worksheet, cell.row
+        return None, None
+    
+    @serialized("sheets")
+    async def edit_transaction(self, transaction_uuid: str, updates: dict):
+        """Редактирует транзакцию; при смене месяца даты строка переносится в другую партицию"""
         try:
             # Находим транзакцию
-            cell = worksheet.find(transaction_uuid)
-            row = cell.row
+            worksheet, row = await self._locate(transaction_uuid)
+            if worksheet is None:
+                raise ValueError(f"transaction {transaction_uuid} not found")
             headers = worksheet.row_values(1)
             
             for key, value in updates.items():
@@ -338,19 +701,174 @@ class GoogleSheetsService:
                     col_idx = headers.index(key) + 1
                     worksheet.update_cell(row, col_idx, value)
             
+            # Сумма в базовой валюте зависит от суммы, валюты и даты - пересчитываем ее
+            if 'amount_base' in headers and {'amount', 'currency', 'date'} & set(updates):
+                values = dict(zip(headers, worksheet.row_values(row)))
+                amount_base_minor = get_rate_table().convert_minor(
+                    to_minor_units(values.get('amount') or 0), values.get('currency'), values.get('date', '')
+                )
+                worksheet.update_cell(
+                    row, headers.index('amount_base') + 1,
+                    from_minor_units(amount_base_minor) if amount_base_minor is not None else ""
+                )
+            
+            self._invalidate_transactions(worksheet.title)
+            
+            if 'date' in updates:
+                target = await self._partition_for(str(updates['date']))
+                if target != worksheet.title:
+                    values = dict(zip(headers, worksheet.row_values(row, value_render_option=VALUE_RENDER_UNFORMATTED)))
+                    moved = [values.get(field, "") for field in TRANSACTION_FIELDS]
+                    target_ws = self._worksheet(target)
+                    self._ensure_headers(target_ws)
+                    target_ws.append_row(moved)
+                    worksheet.delete_rows(row)
+                    self._invalidate_transactions(target)
+            self._notify_change()
             return True
         except Exception as e:
             logger.error(f"Error editing transaction: {e}")
             return False
     
+    @serialized("sheets")
     async def delete_transaction(self, transaction_uuid: str):
         """Удаляет транзакцию"""
-        worksheet = self.sheet.worksheet("Transactions")
-        
         try:
-            cell = worksheet.find(transaction_uuid)
-            worksheet.delete_rows(cell.row)
+            worksheet, row = await self._locate(transaction_uuid)
+            if worksheet is None:
+                raise ValueError(f"transaction {transaction_uuid} not found")
+            worksheet.delete_rows(row)
+            self._invalidate_transactions(worksheet.title)
+            self._notify_change()
             return True
         except Exception as e:
             logger.error(f"Error deleting transaction: {e}")
-            return False
\ No newline at end of file
+            return False
+    
+    @serialized("sheets")
+    async def migrate_legacy_transactions(self) -> int:
+        """Переносит строки листа Transactions в помесячные партиции
+        
+        Строки дописываются в партиции пачками (append_rows), после чего старый лист
+        переименовывается в Transactions_migrated и больше не читается. Возвращает число перенесенных строк.
+        """
+        if not self._has_legacy():
+            return 0
+        legacy = self._worksheet(LEGACY_SHEET)
+        data = legacy.get_all_values(value_render_option=VALUE_RENDER_UNFORMATTED)
+        
+        by_month = {}
+        if len(data) > 1:
+            columns = {}
+            for index, header in enumerate(data[0]):
+                columns.setdefault(str(header), index)
+            for row in data[1:]:
+                values = [
+                    row[columns[field]] if field in columns and columns[field] < len(row) else ""
+                    for field in TRANSACTION_FIELDS
+                ]
+                # Даты пишутся строками ISO, как при add_transaction
+                values[1] = decode_date(values[1])
+                by_month.setdefault(partition_month(values[1]), []).append(values)
+        
+        for month, rows in sorted(by_month.items()):
+            title = await self._partition_for(f"{month}-01")
+            worksheet = self._worksheet(title)
+            self._ensure_headers(worksheet)
+            worksheet.append_rows(rows)
+            self._invalidate_transactions(title)
+            logger.info(f"Migrated {len(rows)} rows to {title}")
+        
+        legacy.update_title(f"{LEGACY_SHEET}_migrated")
+        self._worksheets.pop(LEGACY_SHEET, None)
+        self._invalidate_transactions(LEGACY_SHEET)
+        self._legacy = False
+        self._notify_change()
+        return sum(len(rows) for rows in by_month.values())
+    
+    @serialized("sheets")
+    async def compact_transactions(self, keep_months: int = 3) -> list:
+        """Переносит закрытые месяцы старше keep_months в локальный архив
+        
+        Для каждой партиции: строки (вместе с уже заархивированными, если в месяц были поздние
+        записи) пишутся в сжатый CSV, итоги месяца - в лист Summary, после чего лист партиции удаляется.
+        Чтение через get_transactions/get_financial_stats продолжает видеть эти данные.
+        Возвращает названия заархивированных партиций.
+        """
+        # Текущий месяц не архивируется никогда
+        keep_months = max(keep_months, 1)
+        cutoff = month_offset(datetime.now().strftime('%Y-%m'), -(keep_months - 1))
+        catalog = await self._load_catalog()
+        months = [month for month in sorted(catalog) if month < cutoff and self._has_sheet(month)]
+        if not months:
+            return []
+        
+        # Листы читаются один раз и для архива, и для итогов
+        titles = [catalog[month] for month in months]
+        response = self.sheet.values_batch_get(
+            [range_name(title) for title in titles],
+            params={"valueRenderOption": VALUE_RENDER_UNFORMATTED}
+        )
+        summary_ws = self._summary_worksheet()
+        
+        archived = []
+        for month, title, value_range in zip(months, titles, response.get("valueRanges", [])):
+            data = value_range.get("values", [])
+            columns = {}
+            for index, header in enumerate(data[0] if data else []):
+                columns.setdefault(str(header), index)
+            rows = [
+                [row[columns[field]] if field in columns and columns[field] < len(row) else "" for field in TRANSACTION_FIELDS]
+                for row in data[1:]
+            ]
+            for row in rows:
+                row[1] = decode_date(row[1])
+            if self._has_archive(month):
+                rows = self.archive.read(title)[1:] + rows
+            
+            # После записи архива повтор операции очередью квоты задвоил бы строки
+            side_effect()
+            await asyncio.to_thread(self.archive.write, title, [list(TRANSACTION_FIELDS)] + rows)
+            # Лист удаляется только если архив читается обратно целиком
+            table = self._build_table(title, await asyncio.to_thread(self.archive.read, title))
+            if len(table) != len(rows):
+                logger.error(f"Archive of {title} is incomplete ({len(table)} of {len(rows)} rows), sheet kept")
+                continue
+            
+            totals = table.aggregate()
+            existing = summary_ws.find(month, in_column=1)
+            if existing is not None:
+                summary_ws.delete_rows(existing.row)
+            summary_ws.append_row([
+                month,
+                from_minor_units(totals['total_income']),
+                from_minor_units(totals['total_expense']),
+                from_minor_units(totals['total_income'] - totals['total_expense']),
+                totals['transactions_count'],
+                os.path.basename(self.archive.path(title)),
+                datetime.now().isoformat()
+            ])
+            
+            self.sheet.del_worksheet(self._worksheet(title))
+            self._worksheets.pop(title, None)
+            self._checked_headers.discard(title)
+            self._set_status(month, STATUS_ARCHIVED)
+            self._invalidate_transactions(title)
+            self._tables[self.archive.path(title)] = (time.monotonic(), table)
+            archived.append(title)
+            logger.info(f"Archived {title}: {len(rows)} rows, {self.archive.size(title)} bytes")
+        if archived:
+            # Остальные воркеры сбрасывают каталог и кэш удаленных листов
+            self._notify_change()
+        return archived
+    
+    def _summary_worksheet(self):
+        """Лист Summary с итогами заархивированных месяцев (создается при первой архивации)"""
+        try:
+            return self._worksheet(SUMMARY_SHEET)
+        except Exception:
+            worksheet = self._worksheets[SUMMARY_SHEET] = self.sheet.add_worksheet(
+                title=SUMMARY_SHEET, rows=100, cols=len(SUMMARY_HEADERS)
+            )
+            worksheet.append_row(SUMMARY_HEADERS)
+            return worksheet
@@ -0,0 +1,202 @@
+import asyncio
+import csv
+import hashlib
+import logging
+import re
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import islice
+from typing import Iterator, List, Optional
+
+from config import config
+from models.transaction import Transaction, from_minor_units, normalize_type, to_minor_units
+from services.parser import categorize
+from services.partitions import partition_month
+
+logger = logging.getLogger(__name__)
+
+# Названия колонок выписок разных банков (в нижнем регистре) -> поле
+COLUMN_ALIASES = {
+    "date": ("дата операции", "дата", "date", "transaction date", "дата платежа"),
+    "amount": ("сумма операции", "сумма", "amount", "сумма платежа"),
+    "debit": ("расход", "списание", "дебет", "debit", "withdrawal"),
+    "credit": ("приход", "зачисление", "кредит", "credit", "deposit"),
+    "currency": ("валюта операции", "валюта", "currency"),
+    "description": ("описание", "назначение платежа", "description", "details", "комментарий"),
+    "type": ("тип", "type"),
+    "category": ("категория", "category"),
+    "uuid": ("id", "uuid"),
+}
+DATE_FORMATS = ("%d.%m.%Y", "%Y-%m-%d", "%d.%m.%Y %H:%M:%S", "%Y-%m-%d %H:%M:%S", "%d/%m/%Y", "%d.%m.%y")
+_SPACES = re.compile(r"\s+")
+IMPORT_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_DNS, "import.fincopilot")
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    added: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    months: set = field(default_factory=set)
+
+
+def _parse_date(value: str) -> Optional[str]:
+    value = value.strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return None
+
+
+def _parse_amount(value: str) -> Optional[int]:
+    """Сумма в минорных единицах из "1 234,56", "-1234.56" и т.п."""
+    value = value.replace("\xa0", "").replace(" ", "").replace("−", "-")
+    return to_minor_units(value) if value else None
+
+
+def fingerprint(date: str, type: str, amount_minor: int, currency: str, description: str) -> str:
+    """Отпечаток операции для поиска дублей, когда у строки нет uuid"""
+    text = _SPACES.sub(" ", description.strip().lower())
+    return hashlib.sha1(f"{date}|{type}|{amount_minor}|{currency}|{text}".encode()).hexdigest()
+
+
+def _detect_columns(header: List[str]) -> dict:
+    names = [h.strip().lower().lstrip("﻿") for h in header]
+    columns = {}
+    for name, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in names:
+                columns[name] = names.index(alias)
+                break
+    if "date" not in columns or not ({"amount", "debit", "credit"} & set(columns)):
+        raise ValueError("Не найдены колонки даты и суммы")
+    return columns
+
+
+def read_statement(path: str, result: ImportResult) -> Iterator[Transaction]:
+    """Построчно читает CSV-выписку и превращает строки в транзакции
+
+    Разделитель определяется по началу файла; отрицательные суммы (или колонка расхода) - расходы.
+    Некорректные строки пропускаются и считаются в result.invalid.
+    """
+    with open(path, encoding="utf-8-sig", errors="replace", newline="") as f:
+        sample = f.read(64 * 1024)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=";,\t|")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(f, dialect)
+        columns = _detect_columns(next(reader, []))
+        created_at = datetime.now().isoformat()
+
+        def cell(row, name):
+            index = columns.get(name)
+            return row[index].strip() if index is not None and index < len(row) else ""
+
+        for row in reader:
+            if not any(row):
+                continue
+            result.rows += 1
+            date = _parse_date(cell(row, "date"))
+            amount_minor = _parse_amount(cell(row, "amount"))
+            if amount_minor is None:
+                debit, credit = _parse_amount(cell(row, "debit")), _parse_amount(cell(row, "credit"))
+                amount_minor = -abs(debit) if debit else (abs(credit) if credit else None)
+            if date is None or not amount_minor:
+                result.invalid += 1
+                continue
+
+            description = cell(row, "description")
+            # Явная колонка типа (например, в выгрузке /export) важнее знака суммы
+            trans_type = normalize_type(cell(row, "type")) or ("income" if amount_minor > 0 else "expense")
+            yield Transaction(
+                uuid=cell(row, "uuid"),
+                date=date,
+                type=trans_type,
+                category=categorize(f"{description} {cell(row, 'category')}"),
+                subcategory=None,
+                amount=from_minor_units(abs(amount_minor)),
+                currency=(cell(row, "currency") or "RUB").upper(),
+                description=description,
+                source="import",
+                created_at=created_at
+            )
+
+
+class StatementImporter:
+    """Импорт выписки пачками: разбор в рабочем потоке, отсев дублей, запись append_rows
+
+    Дубли ищутся по uuid и по отпечатку (дата, тип, сумма, валюта, описание) как мультимножество:
+    две одинаковые покупки за день в выписке останутся двумя, но повторный импорт их не задвоит.
+    """
+
+    def __init__(self, sheets, chunk_size: int = None):
+        self.sheets = sheets
+        self.chunk_size = chunk_size or config.IMPORT_CHUNK_ROWS
+        self._existing = Counter()
+        self._existing_uuids = set()
+        self._seen = Counter()
+        self._loaded_months = set()
+
+    async def _load_existing(self, months: set):
+        """Отпечатки уже записанных операций за новые месяцы выписки"""
+        for month in sorted(months - self._loaded_months):
+            for t in await self.sheets.get_transactions(f"{month}-01", f"{month}-31"):
+                self._existing_uuids.add(t.uuid)
+                if t.amount_minor is not None:
+                    self._existing[fingerprint(t.date, t.type, t.amount_minor, t.currency, t.description)] += 1
+            self._loaded_months.add(month)
+
+    def _import_key(self, transaction: Transaction) -> Optional[str]:
+        """Ключ операции (отпечаток и номер повтора в выписке) или None, если это дубль"""
+        if transaction.uuid and transaction.uuid in self._existing_uuids:
+            return None
+        key = fingerprint(
+            transaction.date, transaction.type, to_minor_units(transaction.amount),
+            transaction.currency, transaction.description
+        )
+        self._seen[key] += 1
+        if self._seen[key] <= self._existing[key]:
+            return None
+        return f"{key}:{self._seen[key]}"
+
+    async def run(self, path: str, progress=None) -> ImportResult:
+        """Импортирует файл; progress(result) вызывается после записи каждой пачки"""
+        result = ImportResult()
+        rows = read_statement(path, result)
+        while True:
+            # Следующая пачка разбирается в рабочем потоке, чтобы не блокировать цикл событий
+            chunk = await asyncio.to_thread(lambda: list(islice(rows, self.chunk_size)))
+            if not chunk:
+                break
+            months = {partition_month(t.date) for t in chunk}
+            result.months |= months
+            await self._load_existing(months)
+
+            fresh = []
+            for transaction in chunk:
+                key = self._import_key(transaction)
+                if key is None:
+                    result.duplicates += 1
+                    continue
+                # Стабильный uuid: повторный импорт той же строки даст тот же идентификатор
+                transaction.uuid = transaction.uuid or str(uuid.uuid5(IMPORT_NAMESPACE, key))
+                self._existing_uuids.add(transaction.uuid)
+                fresh.append(transaction)
+
+            if fresh:
+                result.added += await self.sheets.add_transactions(fresh, self.chunk_size)
+            if progress is not None:
+                await progress(result)
+
+        logger.info(
+            f"Statement import: {result.rows} rows, {result.added} added, "
+            f"{result.duplicates} duplicates, {result.invalid} invalid"
+        )
+        return result
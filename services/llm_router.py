@@ -0,0 +1,146 @@
+import logging
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from config import config
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Задачи LLM и их таймауты (с): разбор сообщений ждет пользователь, отчеты могут подождать
+TASK_TIMEOUTS = {"parse": 10.0, "report": 30.0, "insights": 30.0, "fix": 30.0}
+DEFAULT_TIMEOUT = 30.0
+# Задачи, где при LLM_HEDGE запрос дублируется другой модели, и сколько ответов нужно для оценки p90
+HEDGE_TASKS = ("parse",)
+HEDGE_MIN_SAMPLES = 5
+# Запас кредита дублей: после простоя можно продублировать не больше стольких запросов подряд
+HEDGE_CREDIT_MAX = 3.0
+
+
+def _quantile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ModelHealth:
+    """Скользящие задержки успешных ответов и исходы последних вызовов модели"""
+
+    __slots__ = ("latencies", "outcomes", "cooldown_until")
+
+    def __init__(self, window: int = 50, errors_window: int = 20):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=errors_window)
+        self.cooldown_until = 0.0
+
+    def observe(self, seconds: float, ok: bool):
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(seconds)
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def latency(self, q: float = 0.5) -> float:
+        """Квантиль задержки; 0 если данных нет (новая модель пробуется первой)"""
+        return _quantile(self.latencies, q) if self.latencies else 0.0
+
+
+class ModelRouter:
+    """Выбор модели OpenRouter для задачи по цепочке с учетом задержки и ошибок
+
+    Для каждой задачи задана упорядоченная цепочка моделей. Здоровые модели пробуются
+    по возрастанию медианной задержки (часто ошибающиеся - после остальных). Модели с долей
+    ошибок выше max_error_rate или с min_samples ошибками подряд уходят в конец цепочки
+    на cooldown секунд - к ним обращаются, только если остальные не ответили.
+    """
+
+    def __init__(self, chains: Dict[str, Tuple[str, ...]] = None, max_error_rate: float = 0.5,
+                 min_samples: int = 3, cooldown: float = 60.0):
+        self.chains = chains or {
+            "parse": config.PARSE_MODELS,
+            "report": config.REPORT_MODELS,
+            "insights": config.REPORT_MODELS,
+            "fix": config.REPORT_MODELS,
+        }
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.health: Dict[str, ModelHealth] = {}
+        # Кредит дублей: каждый запрос добавляет LLM_HEDGE_BUDGET, дубль тратит единицу
+        self.hedge_budget = config.LLM_HEDGE_BUDGET
+        self._hedge_credit = 1.0
+
+    def _health(self, model: str) -> ModelHealth:
+        health = self.health.get(model)
+        if health is None:
+            health = self.health[model] = ModelHealth()
+        return health
+
+    def models(self, task: str) -> List[str]:
+        """Цепочка задачи; основная модель OPENROUTER_MODEL всегда замыкает ее"""
+        chain = list(dict.fromkeys(self.chains.get(task) or ()))
+        if config.OPENROUTER_MODEL not in chain:
+            chain.append(config.OPENROUTER_MODEL)
+        return chain
+
+    def is_healthy(self, model: str, now: float = None) -> bool:
+        return self._health(model).cooldown_until <= (now or time.monotonic())
+
+    def chain(self, task: str) -> List[str]:
+        """Модели в порядке попыток: здоровые по задержке (при равенстве - по конфигурации), затем остальные"""
+        now = time.monotonic()
+        models = self.models(task)
+        order = {model: i for i, model in enumerate(models)}
+        healthy = [model for model in models if self.is_healthy(model, now)]
+        sick = [model for model in models if model not in healthy]
+        healthy.sort(key=lambda model: (
+            self._health(model).error_rate > self.max_error_rate / 2, self._health(model).latency(), order[model]
+        ))
+        sick.sort(key=lambda model: self._health(model).cooldown_until)
+        return healthy + sick
+
+    def observe(self, model: str, seconds: float, ok: bool):
+        health = self._health(model)
+        health.observe(seconds, ok)
+        metrics.observe_backend("llm", model, seconds, error=not ok)
+        recent = list(health.outcomes)[-self.min_samples:]
+        if not ok and len(recent) == self.min_samples and (
+                health.error_rate > self.max_error_rate or not any(recent)):
+            health.cooldown_until = time.monotonic() + self.cooldown
+            health.outcomes.clear()
+            logger.warning(f"Model {model} is unhealthy, skipped for {self.cooldown:.0f}s")
+
+    def should_hedge(self, task: str) -> bool:
+        return config.LLM_HEDGE and task in HEDGE_TASKS
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """Через сколько продублировать запрос к модели: ее скользящий p90 (None - мало данных)"""
+        health = self._health(model)
+        if len(health.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return health.latency(0.9)
+
+    def note_request(self):
+        self._hedge_credit = min(HEDGE_CREDIT_MAX, self._hedge_credit + self.hedge_budget)
+
+    def take_hedge(self) -> bool:
+        """Разрешение на дубль: доля лишних запросов не превышает LLM_HEDGE_BUDGET"""
+        if self._hedge_credit < 1:
+            return False
+        self._hedge_credit -= 1
+        return True
+
+    def timeout(self, task: str) -> float:
+        return TASK_TIMEOUTS.get(task, DEFAULT_TIMEOUT)
+
+    def summary(self) -> str:
+        if not self.health:
+            return "нет вызовов"
+        now = time.monotonic()
+        return ", ".join(
+            f"{model.split('/')[-1]}: p50 {health.latency() * 1000:.0f} мс, ошибок {health.error_rate:.0%}"
+            f"{'' if self.is_healthy(model, now) else ' (пауза)'}"
+            for model, health in self.health.items()
+        )
@@ -0,0 +1,260 @@
+import contextvars
+import functools
+import inspect
+import logging
+import threading
+import time
+from typing import Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержки (секунды), как в Prometheus по умолчанию
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Текущая операция бэкенда, к которой относятся учтенные байты
+_current_operation: contextvars.ContextVar = contextvars.ContextVar("metrics_operation", default=None)
+
+
+class Histogram:
+    """Кумулятивная гистограмма с фиксированными границами"""
+
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.total += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по верхней границе корзины"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class BackendStats:
+    """Счетчики одной операции бэкенда"""
+
+    __slots__ = ("calls", "errors", "bytes", "latency")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.bytes = 0
+        self.latency = Histogram()
+
+
+class MetricsRegistry:
+    """Хранилище метрик обработчиков и внешних сервисов"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.handlers: Dict[str, Histogram] = {}
+        self.handler_errors: Dict[str, int] = {}
+        self.backends: Dict[Tuple[str, str], BackendStats] = {}
+        self.counters: Dict[str, float] = {}
+        self.started_at = time.time()
+
+    def observe_handler(self, name: str, seconds: float, error: bool = False):
+        with self._lock:
+            histogram = self.handlers.get(name)
+            if histogram is None:
+                histogram = self.handlers[name] = Histogram()
+            histogram.observe(seconds)
+            if error:
+                self.handler_errors[name] = self.handler_errors.get(name, 0) + 1
+
+    def _backend(self, backend: str, operation: str) -> BackendStats:
+        stats = self.backends.get((backend, operation))
+        if stats is None:
+            stats = self.backends[(backend, operation)] = BackendStats()
+        return stats
+
+    def observe_backend(self, backend: str, operation: str, seconds: float, error: bool = False):
+        with self._lock:
+            stats = self._backend(backend, operation)
+            stats.calls += 1
+            stats.latency.observe(seconds)
+            if error:
+                stats.errors += 1
+
+    def increment(self, name: str, value: float = 1):
+        """Увеличивает произвольный счетчик (экспортируется как fincopilot_<name>_total)"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_bytes(self, size: int, backend: str = None, operation: str = None):
+        """Учитывает объем данных текущей (или явно указанной) операции"""
+        if backend is None:
+            current = _current_operation.get()
+            if current is None:
+                return
+            backend, operation = current
+        with self._lock:
+            self._backend(backend, operation).bytes += size
+
+    def render_prometheus(self) -> str:
+        """Текстовый формат экспозиции Prometheus"""
+        lines = []
+        with self._lock:
+            lines.append("# HELP fincopilot_handler_seconds Latency of bot handlers")
+            lines.append("# TYPE fincopilot_handler_seconds histogram")
+            for name, histogram in sorted(self.handlers.items()):
+                lines.extend(_render_histogram("fincopilot_handler_seconds", {"handler": name}, histogram))
+
+            lines.append("# HELP fincopilot_handler_errors_total Failed handler invocations")
+            lines.append("# TYPE fincopilot_handler_errors_total counter")
+            for name, errors in sorted(self.handler_errors.items()):
+                lines.append(f'fincopilot_handler_errors_total{{handler="{name}"}} {errors}')
+
+            lines.append("# HELP fincopilot_backend_calls_total Backend operation calls")
+            lines.append("# TYPE fincopilot_backend_calls_total counter")
+            lines.append("# HELP fincopilot_backend_errors_total Failed backend operation calls")
+            lines.append("# TYPE fincopilot_backend_errors_total counter")
+            lines.append("# HELP fincopilot_backend_bytes_total Bytes transferred by backend operations")
+            lines.append("# TYPE fincopilot_backend_bytes_total counter")
+            for (backend, operation), stats in sorted(self.backends.items()):
+                labels = f'backend="{backend}",operation="{operation}"'
+                lines.append(f"fincopilot_backend_calls_total{{{labels}}} {stats.calls}")
+                lines.append(f"fincopilot_backend_errors_total{{{labels}}} {stats.errors}")
+                lines.append(f"fincopilot_backend_bytes_total{{{labels}}} {stats.bytes}")
+
+            lines.append("# HELP fincopilot_backend_seconds Latency of backend operations")
+            lines.append("# TYPE fincopilot_backend_seconds histogram")
+            for (backend, operation), stats in sorted(self.backends.items()):
+                lines.extend(_render_histogram(
+                    "fincopilot_backend_seconds",
+                    {"backend": backend, "operation": operation},
+                    stats.latency
+                ))
+
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE fincopilot_{name}_total counter")
+                lines.append(f"fincopilot_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, limit: int = 10) -> str:
+        """Краткая сводка для команды /stats"""
+        with self._lock:
+            uptime = time.time() - self.started_at
+            text = f"📈 Метрики (аптайм {uptime / 60:.0f} мин):\n\n"
+
+            handlers = sorted(self.handlers.items(), key=lambda x: x[1].total, reverse=True)[:limit]
+            if handlers:
+                text += "🤖 Обработчики (вызовы, p50/p95, ошибки):\n"
+                for name, h in handlers:
+                    text += (
+                        f"• {name}: {h.count}, {h.quantile(0.5) * 1000:.0f}/"
+                        f"{h.quantile(0.95) * 1000:.0f} мс, {self.handler_errors.get(name, 0)}\n"
+                    )
+                text += "\n"
+
+            backends = sorted(self.backends.items(), key=lambda x: x[1].latency.total, reverse=True)[:limit]
+            if backends:
+                text += "🔌 Бэкенды (вызовы, p50/p95, ошибки, КБ):\n"
+                for (backend, operation), s in backends:
+                    text += (
+                        f"• {backend}.{operation}: {s.calls}, {s.latency.quantile(0.5) * 1000:.0f}/"
+                        f"{s.latency.quantile(0.95) * 1000:.0f} мс, {s.errors}, {s.bytes / 1024:.1f}\n"
+                    )
+
+            if self.counters:
+                text += "\n🔢 Счетчики:\n"
+                for name, value in sorted(self.counters.items()):
+                    text += f"• {name}: {value:g}\n"
+
+            if not handlers and not backends:
+                text += "Данных пока нет"
+        return text
+
+
+def _render_histogram(name: str, labels: dict, histogram: Histogram):
+    base = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        yield f'{name}_bucket{{{base},le="{bound}"}} {cumulative}'
+    yield f'{name}_bucket{{{base},le="+Inf"}} {histogram.count}'
+    yield f"{name}_sum{{{base}}} {histogram.total:.6f}"
+    yield f"{name}_count{{{base}}} {histogram.count}"
+
+
+metrics = MetricsRegistry()
+
+
+def estimate_size(values) -> int:
+    """Приблизительный объем табличных данных в байтах"""
+    if not values:
+        return 0
+    return sum(len(str(cell)) for row in values for cell in row)
+
+
+def _wrap_operation(backend: str, operation: str, func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = _current_operation.set((backend, operation))
+        start = time.perf_counter()
+        error = False
+        try:
+            return await func(*args, **kwargs)
+        except BaseException:
+            error = True
+            raise
+        finally:
+            metrics.observe_backend(backend, operation, time.perf_counter() - start, error)
+            _current_operation.reset(token)
+    return wrapper
+
+
+def instrument(backend: str):
+    """Декоратор класса: учитывает вызовы, ошибки и задержку публичных async-методов"""
+    def decorator(cls):
+        for name, attr in list(vars(cls).items()):
+            if name.startswith("_") or not inspect.iscoroutinefunction(attr):
+                continue
+            setattr(cls, name, _wrap_operation(backend, name, attr))
+        return cls
+    return decorator
+
+
+async def start_metrics_server(host: str, port: int):
+    """Поднимает HTTP-эндпоинты /metrics (Prometheus), /health и /ready"""
+    from aiohttp import web
+    from services.startup import startup
+
+    async def handle_metrics(request):
+        return web.Response(text=metrics.render_prometheus(), content_type="text/plain")
+
+    async def handle_health(request):
+        return web.Response(text="ok")
+
+    async def handle_ready(request):
+        if startup.ready:
+            return web.Response(text=f"ready: {startup.summary()}")
+        return web.Response(status=503, text="starting")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/ready", handle_ready)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return runner
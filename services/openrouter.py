@@ -1,76 +1,210 @@
 import aiohttp
+import asyncio
 import json
 import logging
-import re
+import time
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 from config import config
+from services.credits import LIMIT_RATE, credits
+from services.llm_router import ModelRouter
+from services.metrics import instrument, metrics
+from services.parser import needs_llm, simple_parse
+from services.prompts import PARSE_INSTRUCTION, estimate_tokens, fix_prompt, insights_prompt, report_prompt
 
 logger = logging.getLogger(__name__)
 
+# Ошибки ключа (неверный, нет кредитов, запрещено): смена модели не поможет
+KEY_ERRORS = (401, 402, 403)
+
+
+class OpenRouterError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+@instrument("openrouter")
 class OpenRouterService:
     def __init__(self):
-        self.base_url = "https://openrouter.ai/api/v1"
+        self.base_url = config.OPENROUTER_BASE_URL
         self.headers = {
             "Authorization": f"Bearer {config.OPENROUTER_API_KEY}",
             "HTTP-Referer": config.OPENROUTER_REFERER,
             "X-Title": config.OPENROUTER_TITLE,
             "Content-Type": "application/json"
         }
+        self._session = None
+        self.router = ModelRouter()
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Общая HTTP-сессия: соединения с OpenRouter переиспользуются между запросами"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        return self._session
+    
+    async def warm_up(self):
+        """Заранее устанавливает соединение с OpenRouter (TLS-рукопожатие вне пути запроса)"""
+        try:
+            async with self._get_session().head(self.base_url) as response:
+                await response.read()
+        except Exception as e:
+            logger.warning(f"OpenRouter warm-up failed: {e}")
+    
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
     
-    async def _make_request(self, payload: dict) -> dict:
-        """Выполняет запрос к OpenRouter API"""
+    async def _post(self, payload: dict, timeout: float) -> dict:
+        """Один запрос к OpenRouter API"""
+        async with self._get_session().post(
+            f"{self.base_url}/chat/completions",
+            headers=self.headers,
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            body = await response.read()
+            metrics.add_bytes(len(body))
+            if response.status != 200:
+                error_text = body.decode(errors="replace")
+                logger.error(f"OpenRouter API error {response.status} ({payload['model']}): {error_text}")
+                raise OpenRouterError(response.status, f"Ошибка API: {response.status}")
+            result = json.loads(body)
+            # Ошибка провайдера может прийти и с кодом 200
+            if not result.get('choices'):
+                raise OpenRouterError(response.status, f"Пустой ответ: {result.get('error')}")
+            return result
+    
+    async def _attempt(self, payload: dict, task: str, model: str) -> Optional[dict]:
+        """Запрос к одной модели; None при ошибке модели (учитывается в ее здоровье)"""
+        start = time.perf_counter()
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.base_url}/chat/completions",
-                    headers=self.headers,
-                    json=payload,
-                    timeout=30
-                ) as response:
-                    if response.status == 200:
-                        return await response.json()
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"OpenRouter API error {response.status}: {error_text}")
-                        raise Exception(f"Ошибка API: {response.status}")
+            result = await self._post(dict(payload, model=model), self.router.timeout(task))
+        except OpenRouterError as e:
+            if e.status in KEY_ERRORS:
+                # Проблема ключа, а не модели: другие модели ответят так же
+                raise Exception("Сервис временно недоступен")
+            self.router.observe(model, time.perf_counter() - start, ok=False)
+            return None
         except Exception as e:
-            logger.error(f"Request error: {e}")
-            raise Exception("Сервис временно недоступен")
+            logger.error(f"Request error ({model}): {e!r}")
+            self.router.observe(model, time.perf_counter() - start, ok=False)
+            return None
+        self.router.observe(model, time.perf_counter() - start, ok=True)
+        return result
+    
+    async def _hedged(self, payload: dict, task: str, model: str, chain: list,
+                      delay: float) -> Tuple[Optional[dict], int]:
+        """Запрос с дублем: если модель не ответила за delay, тот же запрос уходит следующей модели цепочки
+        
+        Побеждает первый успешный ответ, второй запрос отменяется. Возвращает ответ и число
+        проигравших запросов, которые не завершились ошибкой: провайдер их уже тарифицировал.
+        """
+        primary = asyncio.ensure_future(self._attempt(payload, task, model))
+        attempts = {primary}
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=delay)
+            if done or not self.router.take_hedge():
+                return await primary, 0
+            backup_model = chain.pop(0)
+            attempts.add(asyncio.ensure_future(self._attempt(payload, task, backup_model)))
+            metrics.increment("llm_hedged_requests")
+            logger.info(f"Hedging {task}: {model} is slower than {delay:.2f}s, also asking {backup_model}")
+            
+            pending = attempts
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    result = attempt.result()
+                    if result is not None:
+                        if attempt is not primary:
+                            metrics.increment("llm_hedge_wins")
+                        losers = sum(
+                            1 for other in attempts if other is not attempt and (
+                                not other.done() or (other.exception() is None and other.result() is not None)
+                            )
+                        )
+                        return result, losers
+            return None, 0
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
     
-    async def parse_transaction(self, text: str) -> Dict[str, Any]:
-        """Парсит текст транзакции"""
+    async def _make_request(self, payload: dict, task: str = "chat", user_id: int = None) -> dict:
+        """Выполняет запрос к OpenRouter API моделями цепочки задачи по очереди, до первого ответа
+        
+        При LLM_HEDGE медленный ответ интерактивной задачи дублируется следующей модели.
+        """
+        chain = self.router.chain(task)
+        self.router.note_request()
+        hedge = self.router.should_hedge(task)
+        while chain:
+            model = chain.pop(0)
+            delay = self.router.hedge_delay(model) if hedge and chain else None
+            losers = 0
+            if delay is None:
+                result = await self._attempt(payload, task, model)
+            else:
+                result, losers = await self._hedged(payload, task, model, chain, delay)
+            if result is not None:
+                prompt_tokens, completion_tokens = self._record_usage(task, payload, result)
+                # Отмененный дубль оценивается как победивший запрос: тот же промпт, похожий ответ
+                credits.charge(user_id, prompt_tokens * (1 + losers), completion_tokens * (1 + losers))
+                if losers:
+                    metrics.increment("llm_hedge_charged", losers)
+                return result
+        raise Exception("Сервис временно недоступен")
+    
+    def _record_usage(self, task: str, payload: dict, response: dict):
+        """Токены вызова: из поля usage ответа, а если его нет - оценка локальным токенизатором"""
+        usage = response.get('usage') or {}
+        prompt_tokens = usage.get('prompt_tokens') or sum(
+            estimate_tokens(message['content']) for message in payload['messages']
+        )
+        completion_tokens = usage.get('completion_tokens')
+        if completion_tokens is None:
+            choices = response.get('choices') or [{}]
+            completion_tokens = estimate_tokens(choices[0].get('message', {}).get('content') or "")
+        metrics.increment(f"llm_{task}_prompt_tokens", prompt_tokens)
+        metrics.increment(f"llm_{task}_completion_tokens", completion_tokens)
+        logger.info(f"LLM {task}: {prompt_tokens} prompt + {completion_tokens} completion tokens")
+        return prompt_tokens, completion_tokens
+    
+    async def parse_transaction(self, text: str, user_id: int = None) -> Dict[str, Any]:
+        """Парсит текст транзакции
+        
+        Если сумма найдена, в тексте нет дат и валют, а категоризатор уверен не меньше
+        CATEGORIZER_CONFIDENCE, сообщение разбирается локально без запроса к API.
+        """
+        local = self._simple_parse(text, user_id)
+        if local['amount'] and local['category_confidence'] >= config.CATEGORIZER_CONFIDENCE and not needs_llm(text):
+            metrics.increment("parse_local")
+            return local
+        refused = await credits.acquire(user_id)
+        if refused:
+            # Лимит пользователя исчерпан - сразу разбираем локально, без запроса к API
+            logger.info(f"LLM limit ({refused}) for user {user_id}, using simple parse")
+            return local
         try:
             # Сначала пробуем AI парсинг
-            return await self._parse_with_ai(text)
+            return await self._parse_with_ai(text, user_id)
         except Exception as e:
             logger.warning(f"AI parsing failed, using fallback: {e}")
             # Fallback на простой парсинг
-            return self._simple_parse(text)
+            return local
     
-    async def _parse_with_ai(self, text: str) -> Dict[str, Any]:
+    async def _parse_with_ai(self, text: str, user_id: int = None) -> Dict[str, Any]:
         """Парсинг с помощью AI"""
-        prompt = f"""Проанализируй текст транзакции и верни JSON. Текст: "{text}"
-        
-        Поля: 
-        - type: "income" или "expense"
-        - amount: число
-        - currency: "RUB", "USD", "EUR" (по умолчанию "RUB")
-        - category: маркетинг, зарплата, аренда, продукты, транспорт, оборудование, услуги, развлечения, налоги, прочее
-        - subcategory: строка или null
-        - date: YYYY-MM-DD (сегодня если не указано)
-        - description: краткое описание
-        
-        Верни ТОЛЬКО JSON без других текстов."""
+        prompt = PARSE_INSTRUCTION.format(text=text, today=datetime.now().strftime('%Y-%m-%d'))
         
         payload = {
-            "model": config.OPENROUTER_MODEL,
             "messages": [{"role": "user", "content": prompt}],
             "temperature": 0.1,
             "max_tokens": 300
         }
         
-        response = await self._make_request(payload)
+        response = await self._make_request(payload, "parse", user_id)
         content = response['choices'][0]['message']['content'].strip()
         
         # Очистка ответа
@@ -89,106 +223,30 @@ class OpenRouterService:
         
         return parsed_data
     
-    def _simple_parse(self, text: str) -> Dict[str, Any]:
+    def _simple_parse(self, text: str, user_id: int = None) -> Dict[str, Any]:
         """Простой парсинг без AI"""
-        text_lower = text.lower()
-        
-        # Тип транзакции
-        if any(word in text_lower for word in ['доход', 'приход']):
-            trans_type = 'income'
-        else:
-            trans_type = 'expense'
-        
-        # Сумма
-        amount = 0
-        amount_match = re.search(r'(\d+[.,]?\d*)', text)
-        if amount_match:
-            try:
-                amount = float(amount_match.group(1).replace(',', '.'))
-            except:
-                pass
-        
-        # Категория
-        category_keywords = {
-            'маркетинг': ['реклама', 'маркетинг', 'продвижение'],
-            'зарплата': ['зарплата', 'оклад'],
-            'аренда': ['аренда', 'аренд', 'съем'],
-            'продукты': ['продукты', 'еда', 'супермаркет', 'магазин'],
-            'транспорт': ['транспорт', 'бензин', 'такси', 'метро'],
-            'оборудование': ['оборудование', 'техника', 'компьютер'],
-            'услуги': ['услуги', 'сервис', 'подписка'],
-            'развлечения': ['развлечения', 'кино', 'ресторан', 'кафе'],
-            'налоги': ['налоги', 'налог']
-        }
-        
-        category = 'прочее'
-        for cat, keywords in category_keywords.items():
-            if any(keyword in text_lower for keyword in keywords):
-                category = cat
-                break
-        
-        return {
-            'type': trans_type,
-            'amount': amount,
-            'currency': 'RUB',
-            'category': category,
-            'subcategory': None,
-            'date': datetime.now().strftime('%Y-%m-%d'),
-            'description': text[:50]
-        }
+        return simple_parse(text, user_id)
     
-    async def generate_report(self, data: dict, period: str) -> str:
-        """Генерирует аналитический отчет на основе данных"""
+    async def generate_report(self, data: dict, period: str, previous: dict = None, user_id: int = None,
+                              forecast=None) -> str:
+        """Генерирует аналитический отчет на основе данных
+        
+        previous - статистика предыдущего такого же периода для сравнения,
+        forecast - прогноз конца месяца (MonthForecast) для отчета и промпта.
+        """
+        if await credits.acquire(user_id):
+            return self._generate_basic_report(data, period, limited=True, forecast=forecast)
         try:
-            # Форматируем данные для промпта
-            incomes_summary = ""
-            expenses_summary = ""
-            
-            if data.get('income_by_category'):
-                incomes_summary = "Доходы по категориям:\n" + "\n".join([
-                    f"- {cat}: {amount:.2f} руб" 
-                    for cat, amount in data.get('income_by_category', {}).items()
-                ])
-            
-            if data.get('expense_by_category'):
-                expenses_summary = "Расходы по категориям:\n" + "\n".join([
-                    f"- {cat}: {amount:.2f} руб" 
-                    for cat, amount in data.get('expense_by_category', {}).items()
-                ])
-            
-            prompt = f"""
-            Ты финансовый аналитик. На основе данных сгенерируй краткий, но информативный отчет на русском.
-            
-            Период: {period}
-            
-            Основные показатели:
-            - Общий доход: {data.get('total_income', 0):.2f} руб
-            - Общий расход: {data.get('total_expense', 0):.2f} руб  
-            - Прибыль: {data.get('profit', 0):.2f} руб
-            - Количество операций: {data.get('transactions_count', 0)}
-            
-            {incomes_summary}
-            
-            {expenses_summary}
-            
-            Проанализируй и предоставь:
-            1. Общую финансовую картину (положительная/отрицательная динамика)
-            2. Основные статьи доходов и расходов
-            3. 1-2 конкретные рекомендации по оптимизации
-            4. Выдели важные тенденции или аномалии если есть
-
-            Будь профессиональным, но дружелюбным. Используй смайлики где уместно.
-            Максимум 250 слов. Структурируй ответ с помощью эмодзи.
-            """
+            # Все числа сведены заранее; промпт умещается в PROMPT_TOKEN_BUDGET
+            prompt = report_prompt(data, period, previous, forecast=forecast).build()
             
             payload = {
-                "model": config.OPENROUTER_MODEL,
                 "messages": [{"role": "user", "content": prompt}],
                 "temperature": 0.7,
                 "max_tokens": 800
             }
             
-            response = await self._make_request(payload)
+            response = await self._make_request(payload, "report", user_id)
             report = response['choices'][0]['message']['content']
             
             # Добавляем базовую статистику в начало отчета
@@ -199,18 +257,24 @@ class OpenRouterService:
                 f"• 📈 Прибыль: {data.get('profit', 0):.2f} руб\n"
                 f"• 🔢 Операций: {data.get('transactions_count', 0)}\n\n"
             )
+            if forecast is not None:
+                basic_stats += f"{forecast.text}\n\n"
             
             return basic_stats + report
             
         except Exception as e:
             logger.error(f"Error generating report: {e}")
             # Fallback отчет без AI
-            return self._generate_basic_report(data, period)
+            return self._generate_basic_report(data, period, forecast=forecast)
     
-    def _generate_basic_report(self, data: dict, period: str) -> str:
+    def _generate_basic_report(self, data: dict, period: str, limited: bool = False, forecast=None) -> str:
         """Генерирует базовый отчет без AI"""
         profit = data.get('profit', 0)
         profit_emoji = "📈" if profit > 0 else "📉" if profit < 0 else "➡️"
+        note = (
+            "💳 Лимит AI-запросов исчерпан - показан отчет без AI-рекомендаций" if limited
+            else "💡 Для детального анализа с AI-рекомендациями проверьте настройки API"
+        )
         
         return (
             f"📊 Базовый отчет за {period}:\n\n"
@@ -218,65 +282,48 @@ class OpenRouterService:
             f"• 💸 Расходы: {data.get('total_expense', 0):.2f} руб\n"
             f"• {profit_emoji} Прибыль: {profit:.2f} руб\n"
             f"• 🔢 Операций: {data.get('transactions_count', 0)}\n\n"
-            f"💡 Для детального анализа с AI-рекомендациями проверьте настройки API"
+            + (f"{forecast.text}\n\n" if forecast is not None else "")
+            + note
         )
     
-    async def generate_insights(self, transactions: list) -> str:
-        """Генерирует инсайты и рекомендации на основе транзакций"""
-        if not transactions:
+    async def generate_fix_advice(self, findings: list, overspent: list, user_id: int = None) -> Optional[str]:
+        """Советы по найденным аномалиям и перерасходам; None, если AI недоступен или лимит исчерпан"""
+        if (not findings and not overspent) or await credits.acquire(user_id):
+            return None
+        try:
+            payload = {
+                "messages": [{"role": "user", "content": fix_prompt(findings, overspent).build()}],
+                "temperature": 0.3,
+                "max_tokens": 400
+            }
+            response = await self._make_request(payload, "fix", user_id)
+            return response['choices'][0]['message']['content']
+        except Exception as e:
+            logger.error(f"Error generating fix advice: {e}")
+            return None
+    
+    async def generate_insights(self, history: list, user_id: int = None) -> str:
+        """Генерирует инсайты и рекомендации по помесячной статистике (get_monthly_stats)"""
+        if not history:
             return "📝 Пока недостаточно данных для анализа. Продолжайте записывать транзакции!"
         
+        refused = await credits.acquire(user_id)
+        if refused == LIMIT_RATE:
+            return "⏳ Слишком много запросов к AI. Попробуйте через минуту."
+        if refused:
+            return "💳 Лимит AI-запросов на этот месяц исчерпан."
+        
         try:
-            # Группируем транзакции по категориям
-            expenses_by_category = {}
-            incomes_by_category = {}
-            
-            for t in transactions[-20:]:  # Берем последние 20 транзакций
-                category = t.get('category', 'прочее')
-                amount = t.get('amount', 0)
-                
-                if t.get('type') == 'expense':
-                    expenses_by_category[category] = expenses_by_category.get(category, 0) + amount
-                else:
-                    incomes_by_category[category] = incomes_by_category.get(category, 0) + amount
-            
-            # Форматируем для промпта
-            expenses_summary = "\n".join([
-                f"- {cat}: {amount:.2f} руб" 
-                for cat, amount in sorted(expenses_by_category.items(), key=lambda x: x[1], reverse=True)[:5]
-            ]) if expenses_by_category else "Нет данных о расходах"
-            
-            incomes_summary = "\n".join([
-                f"- {cat}: {amount:.2f} руб" 
-                for cat, amount in sorted(incomes_by_category.items(), key=lambda x: x[1], reverse=True)[:5]
-            ]) if incomes_by_category else "Нет данных о доходах"
-            
-            prompt = f"""
-            Проанализируй финансовые данные и дай 3 кратких, практичных совета для предпринимателя:
-            
-            Основные статьи доходов:
-            {incomes_summary}
-            
-            Основные статьи расходов:
-            {expenses_summary}
-            
-            Дай конкретные рекомендации:
-            1. По оптимизации расходов (какую категорию стоит сократить и почему)
-            2. По увеличению доходов (на основе текущей структуры)
-            3. Общий финансовый совет для улучшения ситуации
-            
-            Будь конкретным, практичным и кратким. Ответь на русском, используй деловой стиль со смайликами.
-            Максимум 150 слов.
-            """
+            # Тренды и топ категорий по всей истории считаются здесь, в промпт идут только итоги
+            prompt = insights_prompt(history).build()
             
             payload = {
-                "model": config.OPENROUTER_MODEL,
                 "messages": [{"role": "user", "content": prompt}],
                 "temperature": 0.5,
                 "max_tokens": 500
             }
             
-            response = await self._make_request(payload)
+            response = await self._make_request(payload, "insights", user_id)
             return response['choices'][0]['message']['content']
         except Exception as e:
             logger.error(f"Error generating insights: {e}")
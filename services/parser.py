@@ -0,0 +1,74 @@
+import re
+from datetime import datetime
+from typing import Any, Dict
+
+from services.categorizer import Categorizer
+
+# Начальные ключевые слова категорий: ими засевается общая модель категоризатора
+CATEGORY_KEYWORDS = {
+    'маркетинг': ['реклама', 'маркетинг', 'продвижение'],
+    'зарплата': ['зарплата', 'оклад'],
+    'аренда': ['аренда', 'аренд', 'съем'],
+    'продукты': ['продукты', 'еда', 'супермаркет', 'магазин'],
+    'транспорт': ['транспорт', 'бензин', 'такси', 'метро'],
+    'оборудование': ['оборудование', 'техника', 'компьютер'],
+    'услуги': ['услуги', 'сервис', 'подписка'],
+    'развлечения': ['развлечения', 'кино', 'ресторан', 'кафе'],
+    'налоги': ['налоги', 'налог']
+}
+DEFAULT_CATEGORY = 'прочее'
+INCOME_KEYWORDS = ('доход', 'приход')
+# Ниже этой уверенности модели категория считается нераспознанной
+MIN_CONFIDENCE = 0.9
+
+# Разбор без LLM не понимает дат и валют в тексте - такие сообщения отправляются модели
+_NEEDS_LLM_RE = re.compile(
+    r'вчера|позавчера|\d{1,2}[./]\d{1,2}|[$€£¥]|usd|eur|долл|евро|юан|тенге|вчерашн', re.IGNORECASE
+)
+_AMOUNT_RE = re.compile(r'(\d+[.,]?\d*)')
+
+# Общая модель и личные модели пользователей
+categorizer = Categorizer(seed=CATEGORY_KEYWORDS)
+
+
+def categorize(text: str, user_id: int = None) -> str:
+    """Категория по модели категоризатора; при низкой уверенности - DEFAULT_CATEGORY"""
+    category, confidence = categorizer.predict(text, user_id)
+    return category if category is not None and confidence >= MIN_CONFIDENCE else DEFAULT_CATEGORY
+
+
+def needs_llm(text: str) -> bool:
+    """В тексте есть дата или валюта, которые локальный разбор не распознает"""
+    return _NEEDS_LLM_RE.search(text) is not None
+
+
+def simple_parse(text: str, user_id: int = None) -> Dict[str, Any]:
+    """Простой парсинг без AI; category_confidence - уверенность категоризатора"""
+    text_lower = text.lower()
+
+    # Тип транзакции
+    trans_type = 'income' if any(word in text_lower for word in INCOME_KEYWORDS) else 'expense'
+
+    # Сумма
+    amount = 0
+    amount_match = _AMOUNT_RE.search(text)
+    if amount_match:
+        try:
+            amount = float(amount_match.group(1).replace(',', '.'))
+        except ValueError:
+            pass
+
+    category, confidence = categorizer.predict(text, user_id)
+    if category is None or confidence < MIN_CONFIDENCE:
+        category = DEFAULT_CATEGORY
+
+    return {
+        'type': trans_type,
+        'amount': amount,
+        'currency': 'RUB',
+        'category': category,
+        'category_confidence': confidence,
+        'subcategory': None,
+        'date': datetime.now().strftime('%Y-%m-%d'),
+        'description': text[:50]
+    }
@@ -0,0 +1,62 @@
+import re
+from datetime import datetime
+from typing import Optional
+
+# Лист со всей историей до разбиения на партиции
+LEGACY_SHEET = "Transactions"
+# Каталог партиций: месяц -> лист
+CATALOG_SHEET = "Partitions"
+CATALOG_HEADERS = ["month", "worksheet", "created_at", "status"]
+# Статусы партиции: лист, только архив, архив и лист с поздними записями
+STATUS_LIVE = ""
+STATUS_ARCHIVED = "archived"
+STATUS_REOPENED = "reopened"
+# Итоги заархивированных месяцев
+SUMMARY_SHEET = "Summary"
+SUMMARY_HEADERS = [
+    "month", "total_income", "total_expense", "profit", "transactions_count", "archive_file", "archived_at"
+]
+# Новая партиция создается небольшой: append_row сам расширяет лист
+PARTITION_ROWS = 100
+
+_PARTITION_TITLE = re.compile(r"^Transactions_(\d{4})_(\d{2})$")
+_MONTH = re.compile(r"^(\d{4})-(\d{2})")
+
+
+def partition_month(date: str) -> str:
+    """Месяц YYYY-MM по дате транзакции; строки без корректной даты попадают в текущий месяц"""
+    match = _MONTH.match(date or "")
+    if match:
+        return f"{match[1]}-{match[2]}"
+    return datetime.now().strftime('%Y-%m')
+
+
+def partition_title(month: str) -> str:
+    """Название листа партиции: 2024-05 -> Transactions_2024_05"""
+    return f"{LEGACY_SHEET}_{month.replace('-', '_')}"
+
+
+def title_month(title: str) -> Optional[str]:
+    """Месяц партиции по названию листа или None для других листов"""
+    match = _PARTITION_TITLE.match(title)
+    return f"{match[1]}-{match[2]}" if match else None
+
+
+def overlaps(month: str, start_date: str = None, end_date: str = None) -> bool:
+    """Пересекается ли месяц YYYY-MM с периодом [start_date, end_date]"""
+    if start_date and month < start_date[:7]:
+        return False
+    if end_date and month > end_date[:7]:
+        return False
+    return True
+
+
+def month_offset(month: str, months: int) -> str:
+    """Месяц YYYY-MM, сдвинутый на months (отрицательное - назад)"""
+    index = int(month[:4]) * 12 + int(month[5:7]) - 1 + months
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def range_name(title: str) -> str:
+    """Диапазон всего листа в A1-нотации для batch_get"""
+    return "'{}'".format(title.replace("'", "''"))
@@ -0,0 +1,181 @@
+import asyncio
+import cProfile
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import List, Optional
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """Измеряет, насколько позже запланированного выполняются колбэки цикла событий"""
+
+    def __init__(self, interval: float = 0.5, window: int = 600):
+        self.interval = interval
+        self.samples = deque(maxlen=window)
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag > 1.0:
+                logger.warning(f"Event loop lag {lag:.2f}s")
+
+    def summary(self) -> str:
+        if not self.samples:
+            return "нет данных"
+        ordered = sorted(self.samples)
+        p50 = ordered[len(ordered) // 2]
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+        return (
+            f"p50 {p50 * 1000:.1f} мс, p99 {p99 * 1000:.1f} мс, "
+            f"max {self.max_lag * 1000:.1f} мс ({len(ordered)} замеров)"
+        )
+
+
+class SamplingProfiler:
+    """Сэмплирующий профайлер потока: периодически снимает стек и копит свернутые стеки"""
+
+    def __init__(self, interval: float = 0.005, thread_id: int = None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write_collapsed(self, path: str):
+        """Формат свернутых стеков (flamegraph.pl, speedscope)"""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def top_functions(self, limit: int = 5) -> List[tuple]:
+        """Функции, чаще всего находившиеся на вершине стека"""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(limit)
+
+
+class ProfilerManager:
+    """Профилирование по требованию: временное окно или выбранные обработчики"""
+
+    def __init__(self):
+        self.loop_lag = LoopLagMonitor()
+        self.handlers = set(config.PROFILE_HANDLERS)
+        self.results = deque(maxlen=5)
+        self._window: Optional[SamplingProfiler] = None
+        self._handler_lock = threading.Lock()
+
+    def _path(self, name: str, extension: str) -> str:
+        os.makedirs(config.PROFILE_DIR, exist_ok=True)
+        return os.path.join(config.PROFILE_DIR, f"{name}-{datetime.now():%Y%m%d-%H%M%S-%f}.{extension}")
+
+    @property
+    def window_active(self) -> bool:
+        return self._window is not None
+
+    async def profile_window(self, seconds: float) -> str:
+        """Сэмплирует главный поток заданное время и сохраняет свернутые стеки"""
+        if self._window is not None:
+            raise RuntimeError("Профилирование уже запущено")
+        self._window = SamplingProfiler()
+        self._window.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            sampler, self._window = self._window, None
+            await asyncio.to_thread(sampler.stop)
+
+        path = self._path("window", "collapsed")
+        sampler.write_collapsed(path)
+        top = ", ".join(
+            f"{name} {count * 100 / max(sampler.samples, 1):.0f}%"
+            for name, count in sampler.top_functions()
+        )
+        summary = f"{path}: {sampler.samples} сэмплов за {seconds:.0f} с; топ: {top or 'нет'}"
+        self.results.append(summary)
+        logger.info(f"Profile written: {summary}")
+        return summary
+
+    def should_profile(self, handler_name: str) -> bool:
+        return handler_name in self.handlers
+
+    async def profile_handler(self, handler_name: str, call):
+        """Выполняет обработчик под cProfile и сохраняет pstats"""
+        # cProfile не поддерживает вложенные сессии - параллельные вызовы идут без профиля
+        if not self._handler_lock.acquire(blocking=False):
+            return await call()
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            profile.enable()
+            try:
+                return await call()
+            finally:
+                profile.disable()
+        finally:
+            self._handler_lock.release()
+            path = self._path(handler_name, "pstats")
+            profile.dump_stats(path)
+            summary = f"{path}: {handler_name} {(time.perf_counter() - start) * 1000:.0f} мс"
+            self.results.append(summary)
+
+    def summary(self) -> str:
+        text = f"⏱ Лаг цикла событий: {self.loop_lag.summary()}\n"
+        if self.handlers:
+            text += f"🔬 Профилируемые обработчики: {', '.join(sorted(self.handlers))}\n"
+        if self.window_active:
+            text += "🔬 Идет профилирование окна\n"
+        if self.results:
+            text += "📁 Последние профили:\n" + "\n".join(f"• {r}" for r in self.results) + "\n"
+        return text
+
+
+profiler = ProfilerManager()
@@ -0,0 +1,235 @@
+import re
+from datetime import datetime
+from typing import List, Optional
+
+from config import config
+
+# Слова, числа, переводы строк и знаки - примерно так их режут BPE-токенизаторы
+_TOKEN_RE = re.compile(r"[^\W\d_]+|\d+|\n|[^\w\s]")
+
+REPORT_INSTRUCTION = (
+    "Ты финансовый аналитик. По данным ниже напиши краткий отчет на русском: "
+    "1) общая картина и динамика; 2) основные статьи доходов и расходов; "
+    "3) 1-2 конкретные рекомендации по оптимизации; 4) тенденции и аномалии, если есть. "
+    "Профессионально, но дружелюбно, структурируй эмодзи, максимум 250 слов. Суммы в рублях."
+)
+INSIGHTS_INSTRUCTION = (
+    "Дай предпринимателю 3 кратких практичных совета на русском: "
+    "1) какую категорию расходов сократить и почему; 2) как увеличить доходы при текущей структуре; "
+    "3) общий совет для улучшения ситуации. Деловой стиль со смайликами, максимум 150 слов. Суммы в рублях."
+)
+FIX_INSTRUCTION = (
+    "Ниже - найденные автоматически проблемы в расходах. Для каждой кратко объясни возможную причину "
+    "и дай конкретное действие на русском (проверить дубль, сократить категорию, пересмотреть бюджет). "
+    "Не придумывай других проблем. Деловой стиль со смайликами, максимум 120 слов."
+)
+PARSE_INSTRUCTION = (
+    'Верни ТОЛЬКО JSON транзакции из текста: "{text}"\n'
+    'Поля: type ("income"/"expense"), amount (число), currency ("RUB"/"USD"/"EUR", по умолчанию "RUB"), '
+    'category (маркетинг, зарплата, аренда, продукты, транспорт, оборудование, услуги, развлечения, налоги, прочее), '
+    'subcategory (строка или null), date (YYYY-MM-DD, сегодня {today} если не указано), description (кратко).'
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Приблизительное число токенов без словаря модели
+
+    Латиница - около 4 символов на токен, кириллица - около 2.5, числа - по 3 цифры,
+    знаки препинания и переводы строк - по токену.
+    """
+    tokens = 0
+    for match in _TOKEN_RE.finditer(text):
+        part = match.group(0)
+        if part.isdigit():
+            tokens += (len(part) + 2) // 3
+        elif part.isascii():
+            tokens += (len(part) + 3) // 4 if part.isalpha() else 1
+        else:
+            tokens += (2 * len(part) + 4) // 5
+    return tokens
+
+
+class PromptBuilder:
+    """Промпт из секций, умещаемый в бюджет токенов
+
+    Строки секции идут по убыванию важности. Пока промпт больше бюджета, у секции
+    с наименьшим приоритетом отбрасываются последние строки; секции с priority=None
+    (инструкция, итоги) не урезаются.
+    """
+
+    def __init__(self, budget: int = None):
+        self.budget = budget or config.PROMPT_TOKEN_BUDGET
+        self.tokens = 0
+        self._sections = []
+
+    def add(self, title: Optional[str], lines: List[str], priority: int = None) -> "PromptBuilder":
+        lines = [line for line in lines if line]
+        if lines:
+            self._sections.append((title, lines, priority))
+        return self
+
+    def build(self) -> str:
+        sections = [(title, list(lines), priority) for title, lines, priority in self._sections]
+        costs = [[estimate_tokens(line) + 1 for line in lines] for _, lines, _ in sections]
+        headers = [estimate_tokens(title) + 2 if title else 2 for title, _, _ in sections]
+        total = sum(headers) + sum(map(sum, costs))
+
+        trimmable = sorted(
+            (i for i, (_, _, priority) in enumerate(sections) if priority is not None),
+            key=lambda i: sections[i][2]
+        )
+        for i in trimmable:
+            lines = sections[i][1]
+            while total > self.budget and lines:
+                lines.pop()
+                total -= costs[i].pop()
+            if not lines:
+                total -= headers[i]
+
+        text = "\n\n".join(
+            "\n".join(([title] if title else []) + lines) for title, lines, _ in sections if lines
+        )
+        self.tokens = estimate_tokens(text)
+        return text
+
+
+def _money(amount: float) -> str:
+    return f"{amount:.0f}"
+
+
+def _change(current: float, previous: Optional[float]) -> str:
+    """Изменение к прошлому значению: +12%, -30%, "новое" или пустая строка"""
+    if not previous:
+        return " новое" if current and previous is not None else ""
+    return f" {(current - previous) / abs(previous) * 100:+.0f}%"
+
+
+def _category_lines(current: dict, previous: dict = None, top_k: int = None) -> List[str]:
+    """Топ категорий: сумма, доля и изменение к прошлому периоду; хвост одной строкой"""
+    top_k = top_k or config.PROMPT_TOP_K
+    total = sum(current.values()) or 1
+    ranked = sorted(current.items(), key=lambda x: x[1], reverse=True)
+    lines = [
+        f"{category} {_money(amount)} {amount / total * 100:.0f}%"
+        f"{_change(amount, previous.get(category, 0)) if previous is not None else ''}"
+        for category, amount in ranked[:top_k]
+    ]
+    rest = ranked[top_k:]
+    if rest:
+        lines.append(f"прочие {len(rest)} кат. {_money(sum(amount for _, amount in rest))}")
+    return lines
+
+
+def _movers(current: dict, previous: dict, limit: int = 3) -> List[str]:
+    """Категории с наибольшим изменением суммы, включая исчезнувшие"""
+    changes = {
+        category: current.get(category, 0) - previous.get(category, 0)
+        for category in set(current) | set(previous)
+    }
+    ranked = sorted(changes.items(), key=lambda x: abs(x[1]), reverse=True)
+    return [f"{category} {amount:+.0f}" for category, amount in ranked[:limit] if amount]
+
+
+def report_prompt(stats: dict, period: str, previous: dict = None, budget: int = None,
+                  forecast=None) -> PromptBuilder:
+    """Промпт отчета за период: итоги, топ категорий, изменения к предыдущему периоду и прогноз месяца"""
+    if previous is not None and not previous.get('transactions_count'):
+        previous = None
+
+    def total(key):
+        value = stats.get(key, 0)
+        return f"{_money(value)}{_change(value, previous.get(key, 0)) if previous else ''}"
+
+    builder = PromptBuilder(budget)
+    builder.add(None, [REPORT_INSTRUCTION])
+    builder.add(f"Период: {period}" + (" (изменения к предыдущему такому же периоду)" if previous else ""), [
+        f"доход {total('total_income')}",
+        f"расход {total('total_expense')}",
+        f"прибыль {total('profit')}",
+        f"операций {stats.get('transactions_count', 0)}",
+    ])
+    prev_expense = previous.get('expense_by_category', {}) if previous else None
+    prev_income = previous.get('income_by_category', {}) if previous else None
+    columns = "(сумма, доля, изменение):" if previous else "(сумма, доля):"
+    builder.add(f"Расходы {columns}",
+                _category_lines(stats.get('expense_by_category', {}), prev_expense), priority=3)
+    builder.add(f"Доходы {columns}",
+                _category_lines(stats.get('income_by_category', {}), prev_income), priority=2)
+    if previous:
+        builder.add("Сильнее всего изменились расходы:",
+                    _movers(stats.get('expense_by_category', {}), prev_expense), priority=1)
+    if forecast is not None:
+        builder.add(f"Прогноз модели на конец месяца (осталось {forecast.days_left} дн.):", [
+            f"доход {_money(forecast.income + forecast.projected_income)}",
+            f"расход {_money(forecast.expense + forecast.projected_expense)}",
+            f"баланс {_money(forecast.balance)}",
+        ], priority=2)
+    return builder
+
+
+def _sum_categories(history: List[dict], key: str) -> dict:
+    result = {}
+    for stats in history:
+        for category, amount in stats.get(key, {}).items():
+            result[category] = result.get(category, 0) + amount
+    return result
+
+
+def insights_prompt(history: List[dict], budget: int = None, window: int = 3) -> PromptBuilder:
+    """Промпт инсайтов по всей истории: помесячные итоги из get_monthly_stats сведены в тренды
+
+    Тренд категории - последние window месяцев к предыдущим window месяцам.
+    """
+    months = len(history)
+    income = sum(stats['total_income'] for stats in history)
+    expense = sum(stats['total_expense'] for stats in history)
+    recent, earlier = history[-window:], history[-2 * window:-window]
+
+    summary = [
+        f"доход {_money(income)}, расход {_money(expense)}, прибыль {_money(income - expense)}",
+        f"в среднем за месяц: доход {_money(income / months)}, расход {_money(expense / months)}",
+        f"убыточных месяцев {sum(1 for stats in history if stats['profit'] < 0)} из {months}",
+    ]
+    if earlier:
+        last, before = history[-1], history[-window - 1:-1]
+        avg_income = sum(stats['total_income'] for stats in before) / len(before)
+        avg_expense = sum(stats['total_expense'] for stats in before) / len(before)
+        summary.append(
+            f"последний месяц {last['month']}"
+            f"{' (текущий, неполный)' if last['month'] == datetime.now().strftime('%Y-%m') else ''}"
+            f" к среднему за {window} предыдущих: "
+            f"доход{_change(last['total_income'], avg_income) or ' 0%'}, "
+            f"расход{_change(last['total_expense'], avg_expense) or ' 0%'}"
+        )
+
+    expense_recent = _sum_categories(recent, 'expense_by_category')
+    expense_earlier = _sum_categories(earlier, 'expense_by_category') if earlier else None
+    builder = PromptBuilder(budget)
+    builder.add(None, [INSIGHTS_INSTRUCTION])
+    builder.add(f"Итоги за {months} мес. ({history[0]['month']} - {history[-1]['month']}):", summary)
+    builder.add(
+        f"Расходы за {len(recent)} посл. мес. (сумма, доля"
+        f"{f', к предыдущим {window} мес.' if earlier else ''}):",
+        _category_lines(expense_recent, expense_earlier), priority=4
+    )
+    builder.add("Доходы за всю историю (сумма, доля):",
+                _category_lines(_sum_categories(history, 'income_by_category')), priority=3)
+    builder.add("Расходы за всю историю (сумма, доля):",
+                _category_lines(_sum_categories(history, 'expense_by_category')), priority=2)
+    builder.add("По месяцам, новые сверху (доход/расход/прибыль):", [
+        f"{stats['month']} {_money(stats['total_income'])}/{_money(stats['total_expense'])}/{_money(stats['profit'])}"
+        for stats in reversed(history)
+    ], priority=1)
+    return builder
+
+
+def fix_prompt(findings: list, overspent: List[dict], budget: int = None) -> PromptBuilder:
+    """Промпт /fix: только найденные локально аномалии и перерасходы бюджетов"""
+    builder = PromptBuilder(budget)
+    builder.add(None, [FIX_INSTRUCTION])
+    builder.add("Перерасход бюджетов:", [
+        f"{item['category']} потрачено {_money(item['spent'])} при бюджете {_money(item['budget'])}"
+        for item in overspent
+    ], priority=2)
+    builder.add("Аномалии (от самых значимых):", [finding.text for finding in findings], priority=1)
+    return builder
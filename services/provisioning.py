@@ -1,32 +1,70 @@
 import aiohttp
 import json
+import re
 from typing import List, Optional, Dict, Any
 from config import config
+from services.metrics import instrument, metrics
 
+# Имя личного ключа: "FinCopilot User <user_id>: <имя>"
+_KEY_NAME = re.compile(r"^FinCopilot User (\d+):")
+
+
+def key_user_id(name: str) -> Optional[int]:
+    """Telegram ID владельца по имени ключа или None для чужих ключей"""
+    match = _KEY_NAME.match(name or "")
+    return int(match[1]) if match else None
+
+
+def usage_fields(key_info: Dict[str, Any]) -> Dict[str, float]:
+    """Поля использования из описания ключа"""
+    return {
+        "usage": key_info.get("usage", 0),
+        "usage_daily": key_info.get("usage_daily", 0),
+        "usage_weekly": key_info.get("usage_weekly", 0),
+        "usage_monthly": key_info.get("usage_monthly", 0),
+        "limit_remaining": key_info.get("limit_remaining", 0),
+        "limit": key_info.get("limit", 0)
+    }
+
+
+@instrument("provisioning")
 class OpenRouterProvisioningService:
     def __init__(self):
         self.provisioning_key = config.OPENROUTER_PROVISIONING_KEY
-        self.base_url = "https://openrouter.ai/api/v1/keys"
+        self.base_url = f"{config.OPENROUTER_BASE_URL}/keys"
+        self._session = None
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Общая HTTP-сессия для Provisioning API"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        return self._session
+    
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
     
     async def _make_request(self, method: str, endpoint: str = "", data: Optional[Dict] = None) -> Dict:
         """Базовый метод для запросов к Provisioning API"""
         url = f"{self.base_url}/{endpoint}" if endpoint else self.base_url
         
-        async with aiohttp.ClientSession() as session:
-            async with session.request(
-                method=method,
-                url=url,
-                headers={
-                    "Authorization": f"Bearer {self.provisioning_key}",
-                    "Content-Type": "application/json"
-                },
-                json=data
-            ) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    error_text = await response.text()
-                    raise Exception(f"Provisioning API error: {response.status} - {error_text}")
+        async with self._get_session().request(
+            method=method,
+            url=url,
+            headers={
+                "Authorization": f"Bearer {self.provisioning_key}",
+                "Content-Type": "application/json"
+            },
+            json=data
+        ) as response:
+            body = await response.read()
+            metrics.add_bytes(len(body))
+            if response.status == 200:
+                return json.loads(body)
+            else:
+                error_text = body.decode(errors="replace")
+                raise Exception(f"Provisioning API error: {response.status} - {error_text}")
     
     async def create_user_key(self, user_id: int, user_name: str, credit_limit: float = 100) -> Dict[str, Any]:
         """Создает новый API ключ для пользователя"""
@@ -78,12 +116,5 @@ class OpenRouterProvisioningService:
         """Получает информацию об использовании ключа"""
         key_info = await self.get_user_key(key_hash)
         if key_info:
-            return {
-                "usage": key_info.get("usage", 0),
-                "usage_daily": key_info.get("usage_daily", 0),
-                "usage_weekly": key_info.get("usage_weekly", 0),
-                "usage_monthly": key_info.get("usage_monthly", 0),
-                "limit_remaining": key_info.get("limit_remaining", 0),
-                "limit": key_info.get("limit", 0)
-            }
+            return usage_fields(key_info)
         return {}
\ No newline at end of file
@@ -0,0 +1,328 @@
+import asyncio
+import contextvars
+import copy
+import functools
+import heapq
+import inspect
+import itertools
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from config import config
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+READ, WRITE = "read", "write"
+# Приоритеты очереди квоты: меньше - раньше
+INTERACTIVE, BACKGROUND = 0, 1
+# Доля минутной квоты, доступная сразу; остальное пополняется равномерно, так что
+# за любые 60 секунд уходит не больше квоты
+BURST_SHARE = 0.2
+# Фоновые запросы без очереди не берут последние токены запаса: они остаются обработчикам
+BACKGROUND_RESERVE = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_priority: contextvars.ContextVar = contextvars.ContextVar("quota_priority", default=INTERACTIVE)
+_operation: contextvars.ContextVar = contextvars.ContextVar("quota_operation", default=None)
+
+
+class TokenBucket:
+    """Токены запросов в минуту; charge уводит баланс в минус - долг отрабатывается ожиданием"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = max(1.0, per_minute * BURST_SHARE)
+        self.rate = max(per_minute - self.capacity, 1.0) / 60
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self, reserve: float = 0.0) -> bool:
+        self._refill()
+        if self.tokens >= 1 + reserve:
+            self.tokens -= 1
+            return True
+        return False
+
+    def charge(self, count: float = 1):
+        self._refill()
+        self.tokens -= count
+
+    def drain(self):
+        """После 429 новые запросы ждут пополнения, а не добивают исчерпанную квоту"""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+    def delay(self) -> float:
+        """Сколько секунд ждать до целого токена"""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class Deferred(BaseException):
+    """Квоты на запрос нет, а операция еще ничего не записала: ее можно повторить после ожидания
+
+    BaseException - чтобы не перехватывался блоками except Exception внутри методов сервисов.
+    """
+
+    def __init__(self, kind: str):
+        super().__init__(kind)
+        self.kind = kind
+
+
+class Throttled(BaseException):
+    """Таблица ответила 429 или 5xx на запрос, который можно безопасно повторить"""
+
+    def __init__(self, error: Exception, retry_after: float = 0.0):
+        super().__init__(str(error))
+        self.error = error
+        self.retry_after = retry_after
+
+
+@dataclass
+class _Operation:
+    priority: int
+    prepaid: Dict[str, int] = field(default_factory=dict)
+    # После ожидания в очереди операция уже не откладывается: лишние запросы уходят в долг
+    deferrable: bool = True
+    writes: int = 0
+
+    @property
+    def repeatable(self) -> bool:
+        return self.writes == 0
+
+
+def _status(error: Exception) -> Optional[int]:
+    return getattr(getattr(error, "response", None), "status_code", None)
+
+
+def _retry_after(error: Exception) -> float:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class QuotaScheduler:
+    """Очередь запросов к Google Sheets в пределах минутных квот чтения и записи
+
+    Операции сервисов (публичные методы GoogleSheetsService и UserManager) выполняются
+    сразу, пока в корзине есть токены; каждый HTTP-запрос gspread списывает токен своего
+    вида (GET - чтение, остальное - запись). Если токенов нет, а операция еще ничего не
+    записала, она прерывается до отправки запроса, ждет в очереди по приоритету
+    (обработчики раньше фоновых пересчетов) и выполняется заново. Так же повторяются
+    операции после 429 и 5xx - с экспоненциальной задержкой со случайной добавкой.
+    Одинаковые чтения, пока первое не завершилось, выполняются один раз.
+    """
+
+    def __init__(self, reads_per_minute: float = None, writes_per_minute: float = None):
+        # Квота общая для сервисного аккаунта: воркеры делят ее поровну
+        workers = max(1, config.WORKERS)
+        self.buckets = {
+            READ: TokenBucket((reads_per_minute or config.SHEETS_READS_PER_MINUTE) / workers),
+            WRITE: TokenBucket((writes_per_minute or config.SHEETS_WRITES_PER_MINUTE) / workers),
+        }
+        self._waiters: Dict[str, list] = {READ: [], WRITE: []}
+        self._granters: Dict[str, Optional[asyncio.Task]] = {READ: None, WRITE: None}
+        self._sequence = itertools.count()
+        self._pending: Dict[tuple, asyncio.Future] = {}
+
+    # Вызывается из HTTP-клиента gspread (синхронно, внутри операции)
+
+    def before_request(self, kind: str):
+        state = _operation.get()
+        if state is not None and state.prepaid.get(kind):
+            state.prepaid[kind] -= 1
+            return
+        priority = state.priority if state is not None else INTERACTIVE
+        if self._try_take(kind, priority):
+            return
+        if state is not None and state.deferrable and state.repeatable:
+            raise Deferred(kind)
+        # Часть операции уже записана (или запрос вне операции): запрос уходит в долг
+        self.buckets[kind].charge()
+        metrics.increment("sheets_quota_debt")
+
+    def after_request(self, kind: str):
+        state = _operation.get()
+        if state is not None and kind == WRITE:
+            state.writes += 1
+
+    def after_error(self, kind: str, error: Exception):
+        """Повторяемая ошибка превращается в Throttled; остальные пробрасываются как есть"""
+        status = _status(error)
+        if status not in RETRY_STATUSES:
+            return
+        if status == 429:
+            self.buckets[kind].drain()
+            metrics.increment("sheets_throttled")
+        state = _operation.get()
+        # Запись после 5xx могла примениться - ее не повторяем, чтобы не задвоить строки
+        if state is not None and state.repeatable and (status == 429 or kind == READ):
+            raise Throttled(error, _retry_after(error))
+
+    # Очередь
+
+    def _try_take(self, kind: str, priority: int) -> bool:
+        if self._waiters[kind]:
+            return False
+        reserve = self.buckets[kind].capacity * BACKGROUND_RESERVE if priority == BACKGROUND else 0.0
+        return self.buckets[kind].try_take(reserve)
+
+    async def acquire(self, kind: str, priority: int = None):
+        """Ждет токен вида kind в очереди по приоритету"""
+        priority = _priority.get() if priority is None else priority
+        if self._try_take(kind, priority):
+            return
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters[kind], (priority, next(self._sequence), future))
+        granter = self._granters[kind]
+        if granter is None or granter.done():
+            self._granters[kind] = asyncio.create_task(self._grant(kind))
+        await future
+        metrics.observe_backend("sheets_quota", kind, time.perf_counter() - started)
+
+    async def _grant(self, kind: str):
+        bucket, waiters = self.buckets[kind], self._waiters[kind]
+        while waiters:
+            delay = bucket.delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(waiters)
+            if future.done():
+                # Ожидавший обработчик отменен - токен достается следующему
+                continue
+            bucket.charge()
+            future.set_result(None)
+
+    @staticmethod
+    def backoff(attempt: int, retry_after: float = 0.0) -> float:
+        """Экспоненциальная задержка: половина фиксирована, половина случайна"""
+        delay = min(config.SHEETS_BACKOFF_MAX, config.SHEETS_BACKOFF_BASE * 2 ** attempt)
+        return max(retry_after, delay / 2 + random.uniform(0, delay / 2))
+
+    async def _execute(self, call, priority: int = None):
+        priority = _priority.get() if priority is None else priority
+        prepaid, deferrable, attempt = {}, True, 0
+        while True:
+            token = _operation.set(_Operation(priority, prepaid, deferrable))
+            try:
+                return await call()
+            except Deferred as e:
+                metrics.increment("sheets_quota_deferred")
+                await self.acquire(e.kind, priority)
+                prepaid, deferrable = {e.kind: 1}, False
+            except Throttled as e:
+                if attempt >= config.SHEETS_MAX_RETRIES:
+                    raise e.error
+                delay = self.backoff(attempt, e.retry_after)
+                attempt += 1
+                logger.warning(f"Sheets request throttled ({e.error}), retry {attempt} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                prepaid, deferrable = {}, True
+            finally:
+                _operation.reset(token)
+
+    async def run(self, call, merge_key: tuple = None, priority: int = None):
+        """Выполняет операцию call() в пределах квоты
+
+        merge_key - ключ чтения для склейки дублей, priority - приоритет вместо приоритета задачи.
+        """
+        if _operation.get() is not None:
+            # Вложенный вызов (get_budget_status -> get_budgets): квота учитывается внешней операцией
+            return await call()
+        if merge_key is None:
+            return await self._execute(call, priority)
+        pending = self._pending.get(merge_key)
+        if pending is not None:
+            metrics.increment("sheets_reads_merged")
+            result = await asyncio.shield(pending)
+            # Списки и словари у каждого вызова свои, как без склейки
+            return copy.copy(result) if isinstance(result, (list, dict)) else result
+        pending = self._pending[merge_key] = asyncio.ensure_future(self._execute(call, priority))
+        pending.add_done_callback(lambda _: self._pending.pop(merge_key, None))
+        return await asyncio.shield(pending)
+
+
+def background():
+    """Помечает текущую задачу фоновой: ее запросы к таблице уступают обработчикам"""
+    _priority.set(BACKGROUND)
+
+
+def side_effect():
+    """Операция изменила что-то вне таблицы (например, файл архива): повторять ее целиком нельзя"""
+    state = _operation.get()
+    if state is not None:
+        state.writes += 1
+
+
+def spawn(coro) -> asyncio.Task:
+    """Фоновая задача вне текущей операции: ее запросы учитываются и повторяются отдельно"""
+    context = contextvars.copy_context()
+    context.run(_operation.set, None)
+    context.run(_priority.set, BACKGROUND)
+    return asyncio.get_running_loop().create_task(coro, context=context)
+
+
+def _merge_key(instance, name: str, args: tuple, kwargs: dict) -> Optional[tuple]:
+    key = (id(instance), name, args, tuple(sorted(kwargs.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _wrap_call(name: str, func, mergeable: bool):
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        key = _merge_key(self, name, args, kwargs) if mergeable else None
+        return await quota.run(lambda: func(self, *args, **kwargs), key)
+    return wrapper
+
+
+def scheduled(reads: tuple = ()):
+    """Декоратор класса: публичные async-методы выполняются через очередь квоты
+
+    Одинаковые одновременные вызовы методов из reads (только чтение) выполняются один раз.
+    """
+    def decorator(cls):
+        for name, attr in list(vars(cls).items()):
+            if name.startswith("_") or not inspect.iscoroutinefunction(attr):
+                continue
+            setattr(cls, name, _wrap_call(name, attr, name in reads))
+        return cls
+    return decorator
+
+
+def http_client():
+    """HTTP-клиент gspread, который сообщает планировщику о каждом запросе"""
+    from gspread.exceptions import APIError
+    from gspread.http_client import HTTPClient
+
+    class QuotaHTTPClient(HTTPClient):
+        def request(self, method: str, endpoint: str, *args, **kwargs):
+            kind = READ if method.upper() == "GET" else WRITE
+            quota.before_request(kind)
+            try:
+                response = super().request(method, endpoint, *args, **kwargs)
+            except APIError as e:
+                quota.after_error(kind, e)
+                raise
+            quota.after_request(kind)
+            return response
+
+    return QuotaHTTPClient
+
+
+quota = QuotaScheduler()
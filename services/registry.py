@@ -0,0 +1,74 @@
+"""Общие экземпляры сервисов процесса
+
+Сервисы создаются лениво при первом обращении и переиспользуются всеми обработчиками,
+чтобы не авторизоваться в Google и не открывать таблицу на каждое сообщение.
+"""
+import logging
+from typing import Any, Dict
+
+from services.startup import startup
+
+logger = logging.getLogger(__name__)
+
+_instances: Dict[str, Any] = {}
+
+
+def get_sheets_service():
+    """Общий GoogleSheetsService"""
+    if "sheets" not in _instances:
+        from services.google_sheets import GoogleSheetsService
+        _instances["sheets"] = GoogleSheetsService()
+    return _instances["sheets"]
+
+
+def get_openrouter_service():
+    """Общий OpenRouterService"""
+    if "openrouter" not in _instances:
+        from services.openrouter import OpenRouterService
+        _instances["openrouter"] = OpenRouterService()
+    return _instances["openrouter"]
+
+
+def get_user_manager():
+    """Общий UserManager"""
+    if "users" not in _instances:
+        from services.user_manager import UserManager
+        # Пользователи лежат в той же таблице - переиспользуем открытое подключение
+        _instances["users"] = UserManager(sheet=get_sheets_service().sheet)
+    return _instances["users"]
+
+
+def override(sheets=None, openrouter=None, users=None):
+    """Подменяет сервисы готовыми экземплярами (заглушки для нагрузочных прогонов)"""
+    for name, instance in (("sheets", sheets), ("openrouter", openrouter), ("users", users)):
+        if instance is not None:
+            _instances[name] = instance
+
+
+async def warm_up():
+    """Создает сервисы, открывает листы и HTTP-соединения до первого запроса"""
+    steps = (
+        ("sheets", get_sheets_service),
+        ("users", get_user_manager),
+        ("openrouter", get_openrouter_service),
+    )
+    for name, factory in steps:
+        try:
+            with startup.phase(f"warm-up {name}"):
+                await factory().warm_up()
+        except Exception as e:
+            logger.warning(f"Warm-up of {name} failed: {e}")
+
+
+async def close():
+    """Закрывает HTTP-сессии созданных сервисов"""
+    for instance in list(_instances.values()):
+        for target in (instance, getattr(instance, "provisioning", None)):
+            close_method = getattr(target, "close", None)
+            if close_method is not None:
+                await close_method()
+
+
+def reset():
+    """Сбрасывает созданные экземпляры"""
+    _instances.clear()
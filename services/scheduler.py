@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional
+
+from config import config
+from services.credits import BACKGROUND_ACCOUNT, credits
+from services.forecast import forecaster
+from services.google_sheets import period_bounds, previous_bounds
+from services.quota import background
+from services.registry import get_openrouter_service, get_sheets_service
+
+logger = logging.getLogger(__name__)
+
+# Предрассчитываемые периоды и их подписи в отчете
+REPORT_PERIODS = {"week": "последнюю неделю", "month": "последний месяц"}
+
+
+@dataclass
+class PrecomputedReport:
+    period: str
+    stats: dict
+    text: str
+    generation: int
+    computed_at: float
+    created_at: datetime
+
+
+class ReportScheduler:
+    """Фоновый пересчет недельного и месячного отчета (статистика и текст LLM)
+
+    Результат хранится в памяти и отдается командам сразу. Любая запись транзакций
+    увеличивает поколение данных - отчеты прошлых поколений не отдаются и пересчитываются
+    в фоне после паузы (пачка записей, например импорт, дает один пересчет).
+    Пока нет активных пользователей, LLM в фоне не вызывается.
+    """
+
+    def __init__(self, max_age: float = None, debounce: float = 30, tick: float = 300,
+                 active_window: float = 7 * 24 * 3600):
+        self.max_age = max_age or config.REPORTS_MAX_AGE
+        self.debounce = debounce
+        self.tick = tick
+        self.active_window = active_window
+        self.active_users: Dict[int, float] = {}
+        self._reports: Dict[str, PrecomputedReport] = {}
+        self._generation = 0
+        self._dirty = asyncio.Event()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._last_push = None
+        self._bot = None
+        self._task: Optional[asyncio.Task] = None
+
+    def touch(self, user_id: int):
+        """Отмечает активность пользователя"""
+        self.active_users[user_id] = time.monotonic()
+
+    def active(self) -> list:
+        horizon = time.monotonic() - self.active_window
+        return [user_id for user_id, seen in self.active_users.items() if seen >= horizon]
+
+    def invalidate(self):
+        """Данные изменились: предрассчитанные отчеты устарели"""
+        self._generation += 1
+        self._dirty.set()
+
+    def get(self, period: str) -> Optional[PrecomputedReport]:
+        """Готовый отчет, если он посчитан по текущим данным и не старше max_age"""
+        report = self._reports.get(period)
+        if report is None or report.generation != self._generation:
+            return None
+        if time.monotonic() - report.computed_at >= self.max_age:
+            return None
+        return report
+
+    async def report(self, period: str, user_id: int = BACKGROUND_ACCOUNT) -> PrecomputedReport:
+        """Готовый отчет или расчет сейчас; параллельные запросы одного периода ждут один расчет
+
+        Вызов LLM при расчете учитывается в лимитах user_id (запросившего отчет пользователя).
+        """
+        self._subscribe()
+        report = self.get(period)
+        if report is not None:
+            return report
+        lock = self._locks.setdefault(period, asyncio.Lock())
+        async with lock:
+            report = self.get(period)
+            if report is None:
+                report = await self._compute(period, user_id)
+        return report
+
+    async def _compute(self, period: str, user_id: int = BACKGROUND_ACCOUNT) -> PrecomputedReport:
+        generation = self._generation
+        # Отчет без AI из-за лимитов одного пользователя не отдается остальным
+        limited = await credits.check(user_id) is not None
+        start = time.perf_counter()
+        sheets = get_sheets_service()
+        stats = await sheets.get_financial_stats(period)
+        previous = await sheets.get_financial_stats("custom", *previous_bounds(*period_bounds(period)))
+        forecast = await forecaster.month_end(sheets)
+        text = await get_openrouter_service().generate_report(
+            stats, REPORT_PERIODS[period], previous, user_id=user_id, forecast=forecast
+        )
+        report = PrecomputedReport(
+            period=period,
+            stats=stats,
+            text=text,
+            generation=generation,
+            computed_at=time.monotonic(),
+            created_at=datetime.now()
+        )
+        if not limited:
+            self._reports[period] = report
+        logger.info(f"Report '{period}' computed in {time.perf_counter() - start:.2f}s")
+        return report
+
+    def _subscribe(self):
+        """Подписывается на записи транзакций (один раз на экземпляр сервиса таблиц)"""
+        sheets = get_sheets_service()
+        if self.invalidate not in sheets.listeners:
+            sheets.listeners.append(self.invalidate)
+
+    def start(self, bot=None):
+        """Запускает фоновый цикл; bot нужен для рассылки отчетов (REPORTS_PUSH_HOUR)"""
+        self._bot = bot
+        self._subscribe()
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        # Пересчет уступает квоту таблицы запросам обработчиков
+        background()
+        while True:
+            try:
+                await asyncio.wait_for(self._dirty.wait(), timeout=self.tick)
+            except asyncio.TimeoutError:
+                pass
+            if self._dirty.is_set():
+                await asyncio.sleep(self.debounce)
+                self._dirty.clear()
+
+            if self.active():
+                for period in REPORT_PERIODS:
+                    try:
+                        await self.report(period)
+                    except Exception as e:
+                        logger.error(f"Background report '{period}' failed: {e}")
+            await self._push_weekly()
+
+    async def _push_weekly(self):
+        """По понедельникам в REPORTS_PUSH_HOUR рассылает недельный отчет активным пользователям"""
+        now = datetime.now()
+        if (self._bot is None or config.REPORTS_PUSH_HOUR < 0 or now.weekday() != 0
+                or now.hour != config.REPORTS_PUSH_HOUR or self._last_push == now.date()):
+            return
+        self._last_push = now.date()
+        report = await self.report("week")
+        for user_id in self.active():
+            try:
+                await self._bot.send_message(user_id, report.text)
+            except Exception as e:
+                logger.warning(f"Weekly report push to {user_id} failed: {e}")
+
+    def summary(self) -> str:
+        if not self._reports:
+            return "нет предрассчитанных отчетов"
+        now = time.monotonic()
+        return ", ".join(
+            f"{period}: {(now - r.computed_at) / 60:.0f} мин назад"
+            f"{'' if r.generation == self._generation else ' (устарел)'}"
+            for period, r in self._reports.items()
+        ) + f"; активных пользователей: {len(self.active())}"
+
+
+scheduler = ReportScheduler()
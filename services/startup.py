@@ -0,0 +1,44 @@
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTracker:
+    """Замеры фаз запуска и признак готовности процесса"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases = []
+        self.ready = False
+        self.ready_after = None
+
+    def mark(self, name: str):
+        """Фиксирует фазу, длившуюся с предыдущей отметки"""
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._last = time.perf_counter()
+            self.phases.append((name, self._last - start))
+
+    def mark_ready(self):
+        self.ready = True
+        self.ready_after = time.perf_counter() - self.started
+        logger.info(f"Startup complete: {self.summary()}")
+
+    def summary(self) -> str:
+        phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases)
+        total = self.ready_after if self.ready_after is not None else time.perf_counter() - self.started
+        return f"{phases}; ready in {total:.2f}s" if phases else f"ready in {total:.2f}s"
+
+
+startup = StartupTracker()
@@ -0,0 +1,132 @@
+import re
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from models.transaction import TransactionRecord
+
+# Коды типов в колонке types
+TYPE_CODES = {'income': 1, 'expense': 2}
+_MONTH = re.compile(r"^\d{4}-\d{2}$")
+
+
+class TransactionTable:
+    """Разобранные транзакции по возрастанию даты с колоночным представлением для агрегатов
+
+    Записи хранятся объектами (для поиска и вывода), а суммы в базовой валюте, типы
+    и категории - массивами NumPy, так что статистика за период считается без цикла по строкам.
+    """
+
+    def __init__(self, records: List[TransactionRecord]):
+        records.sort(key=lambda r: r.date)
+        self.records = records
+        self.dates = [r.date for r in records]
+        self.categories: List[str] = []
+        self._category_index: Dict[str, int] = {}
+        self.amounts = np.fromiter(
+            (r.amount_base_minor if r.is_valid else 0 for r in records), dtype=np.int64, count=len(records)
+        )
+        self.types = np.fromiter(
+            (TYPE_CODES.get(r.type, 0) if r.is_valid else 0 for r in records), dtype=np.int8, count=len(records)
+        )
+        self.category_codes = np.fromiter(
+            (self._category_code(r.category) for r in records), dtype=np.int32, count=len(records)
+        )
+
+    def __len__(self):
+        return len(self.records)
+
+    def _category_code(self, category: str) -> int:
+        code = self._category_index.get(category)
+        if code is None:
+            code = self._category_index[category] = len(self.categories)
+            self.categories.append(category)
+        return code
+
+    @property
+    def invalid_count(self) -> int:
+        return int(np.count_nonzero(self.types == 0))
+
+    def insert(self, record: TransactionRecord):
+        """Вставляет запись с сохранением порядка по дате"""
+        position = bisect_right(self.dates, record.date)
+        self.dates.insert(position, record.date)
+        self.records.insert(position, record)
+        valid = record.is_valid
+        self.amounts = np.insert(self.amounts, position, record.amount_base_minor if valid else 0)
+        self.types = np.insert(self.types, position, TYPE_CODES.get(record.type, 0) if valid else 0)
+        self.category_codes = np.insert(self.category_codes, position, self._category_code(record.category))
+
+    def bounds(self, start_date: str = None, end_date: str = None):
+        """Срез [lo, hi) записей с датой в диапазоне (границы включительно)"""
+        lo = bisect_left(self.dates, start_date) if start_date else 0
+        hi = bisect_right(self.dates, end_date) if end_date else len(self.dates)
+        return lo, hi
+
+    def between(self, start_date: str = None, end_date: str = None) -> List[TransactionRecord]:
+        lo, hi = self.bounds(start_date, end_date)
+        return self.records[lo:hi]
+
+    def aggregate(self, start_date: str = None, end_date: str = None) -> dict:
+        """Суммы доходов и расходов по категориям в базовой валюте (целые минорные единицы)"""
+        return self._aggregate(*self.bounds(start_date, end_date))
+
+    def aggregate_by_month(self, start_date: str = None, end_date: str = None) -> Dict[str, dict]:
+        """Результаты aggregate по месяцам YYYY-MM; границы месяцев находятся бинарным поиском"""
+        lo, hi = self.bounds(start_date, end_date)
+        result = {}
+        while lo < hi:
+            month = self.dates[lo][:7]
+            # "YYYY-MM\uffff" больше любой даты этого месяца и меньше дат следующего
+            next_lo = bisect_right(self.dates, month + "\uffff", lo, hi)
+            if _MONTH.match(month):
+                result[month] = self._aggregate(lo, next_lo)
+            lo = next_lo
+        return result
+
+    def _aggregate(self, lo: int, hi: int) -> dict:
+        amounts = self.amounts[lo:hi]
+        types = self.types[lo:hi]
+        codes = self.category_codes[lo:hi]
+
+        result = {'transactions_count': int(np.count_nonzero(types))}
+        for name, code in TYPE_CODES.items():
+            mask = types == code
+            # bincount суммирует во float64: целые минорные единицы точны до 2**53
+            sums = np.bincount(codes[mask], weights=amounts[mask], minlength=len(self.categories))
+            sums = np.rint(sums).astype(np.int64)
+            result[f'total_{name}'] = int(sums.sum())
+            result[f'{name}_by_category'] = {
+                self.categories[i]: int(sums[i]) for i in np.flatnonzero(sums)
+            }
+        return result
+
+
+def merge_aggregates(parts: Iterable[dict]) -> dict:
+    """Складывает результаты aggregate нескольких таблиц (например, месячных партиций)"""
+    result = {'transactions_count': 0}
+    for name in TYPE_CODES:
+        result[f'total_{name}'] = 0
+        result[f'{name}_by_category'] = {}
+    for part in parts:
+        result['transactions_count'] += part['transactions_count']
+        for name in TYPE_CODES:
+            result[f'total_{name}'] += part[f'total_{name}']
+            merged = result[f'{name}_by_category']
+            for category, amount in part[f'{name}_by_category'].items():
+                merged[category] = merged.get(category, 0) + amount
+    return result
+
+
+def merge_between(tables: List[TransactionTable], start_date: str = None, end_date: str = None) -> List[TransactionRecord]:
+    """Записи периода из нескольких таблиц по возрастанию даты
+    
+    Месячные партиции не пересекаются, и их срезы просто склеиваются; слияние нужно
+    только когда таблицы перекрываются по датам (архив и поздние записи, старый лист).
+    """
+    parts = [part for part in (table.between(start_date, end_date) for table in tables) if part]
+    if all(prev[-1].date <= part[0].date for prev, part in zip(parts, parts[1:])):
+        return [record for part in parts for record in part]
+    return list(merge(*parts, key=lambda r: r.date))
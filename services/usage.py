@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from config import config
+from services.credits import credits
+from services.provisioning import key_user_id, usage_fields
+
+logger = logging.getLogger(__name__)
+
+# Предохранитель обхода: больше страниц list_user_keys за один проход не читается
+MAX_PAGES = 1000
+
+
+class KeyUsageCache:
+    """Использование личных ключей в памяти, обновляемое одним обходом list_user_keys
+
+    Вместо GET на каждый запрос /usage все ключи читаются постранично раз в
+    USAGE_REFRESH_INTERVAL секунд. Данные старше USAGE_MAX_AGE считаются устаревшими:
+    первый же запрос запускает новый обход, параллельные запросы ждут его же.
+    """
+
+    def __init__(self, provisioning, max_age: float = None):
+        self.provisioning = provisioning
+        self.max_age = max_age or config.USAGE_MAX_AGE
+        self.by_hash: Dict[str, dict] = {}
+        self.by_user: Dict[int, str] = {}
+        self.refreshed_at = None
+        self._lock = asyncio.Lock()
+
+    def is_fresh(self) -> bool:
+        return self.refreshed_at is not None and time.monotonic() - self.refreshed_at < self.max_age
+
+    async def refresh(self) -> int:
+        """Обходит все ключи постранично и заменяет кэш целиком; возвращает число ключей"""
+        by_hash, by_user = {}, {}
+        offset = 0
+        for _ in range(MAX_PAGES):
+            page = await self.provisioning.list_user_keys(offset)
+            if not page:
+                break
+            for key_info in page:
+                key_hash = key_info.get("hash")
+                if not key_hash:
+                    continue
+                by_hash[key_hash] = usage_fields(key_info)
+                user_id = key_user_id(key_info.get("name"))
+                if user_id is not None:
+                    by_user[user_id] = key_hash
+            offset += len(page)
+        self.by_hash, self.by_user = by_hash, by_user
+        self.refreshed_at = time.monotonic()
+        # Локальная оценка расхода кредитов сверяется с фактическим использованием ключей
+        credits.reconcile({user_id: by_hash[key_hash] for user_id, key_hash in by_user.items()})
+        return len(by_hash)
+
+    async def _ensure_fresh(self):
+        if self.is_fresh():
+            return
+        async with self._lock:
+            if self.is_fresh():
+                return
+            try:
+                await self.refresh()
+            except Exception as e:
+                if self.refreshed_at is None:
+                    raise
+                logger.warning(f"Key usage refresh failed, serving stale data: {e}")
+
+    def remember(self, user_id: int, key_hash: str, key_info: dict = None):
+        """Добавляет только что созданный ключ, не дожидаясь следующего обхода"""
+        self.by_user[user_id] = key_hash
+        self.by_hash[key_hash] = usage_fields(key_info or {})
+
+    async def get(self, key_hash: str) -> Optional[dict]:
+        await self._ensure_fresh()
+        return self.by_hash.get(key_hash)
+
+    async def get_for_user(self, user_id: int) -> Optional[dict]:
+        """Использование личного ключа пользователя или None, если ключа нет"""
+        await self._ensure_fresh()
+        key_hash = self.by_user.get(user_id)
+        return self.by_hash.get(key_hash) if key_hash else None
+
+    def summary(self, limit: int = 10) -> str:
+        """Пользователи с наибольшим расходом за месяц для администратора"""
+        if self.refreshed_at is None:
+            return "Данные об использовании еще не загружены"
+        age = time.monotonic() - self.refreshed_at
+        text = f"🔑 Личных ключей: {len(self.by_hash)}, обновлено {age / 60:.0f} мин назад\n\n"
+        users = sorted(
+            self.by_user.items(), key=lambda x: self.by_hash.get(x[1], {}).get("usage_monthly") or 0, reverse=True
+        )[:limit]
+        for user_id, key_hash in users:
+            usage = self.by_hash.get(key_hash, {})
+            text += (
+                f"• {user_id}: ${usage.get('usage_monthly') or 0:.2f} за месяц, "
+                f"осталось ${usage.get('limit_remaining') or 0:.2f} из ${usage.get('limit') or 0:.2f}\n"
+            )
+        return text
+
+
+async def usage_refresh_loop(interval: float = None):
+    """Периодически обновляет кэш использования ключей (для main)"""
+    from services.registry import get_user_manager
+
+    interval = interval or config.USAGE_REFRESH_INTERVAL
+    while True:
+        try:
+            count = await get_user_manager().usage.refresh()
+            logger.info(f"Key usage refreshed: {count} keys")
+        except Exception as e:
+            logger.error(f"Key usage refresh failed: {e}")
+        await asyncio.sleep(interval)
@@ -1,31 +1,77 @@
-import gspread
-from google.oauth2.service_account import Credentials
 from typing import Optional, Dict, Any
 from config import config
 from models.user import User
+from services import cluster
+from services.cluster import write_lock
+from services.credits import credits
 from services.provisioning import OpenRouterProvisioningService
-import datetime
+from services.usage import KeyUsageCache
+from services.metrics import instrument, metrics, estimate_size
+from services.quota import http_client, quota, scheduled, spawn
+from datetime import datetime
+import asyncio
+import logging
 
+logger = logging.getLogger(__name__)
+
+# Колонки листа Users с личным ключом OpenRouter (нумерация с 1)
+KEY_COLUMN = 5
+KEY_HASH_COLUMN = 6
+
+
+def _is_premium(value) -> bool:
+    """Флаг is_premium из листа: отформатированные значения приходят строками TRUE/FALSE"""
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1", "да")
+    return bool(value)
+
+@instrument("users")
+@scheduled(reads=("get_user_usage", "premium_statuses"))
 class UserManager:
-    def __init__(self):
+    def __init__(self, sheet=None):
         self.scope = ['https://www.googleapis.com/auth/spreadsheets']
+        self.provisioning = OpenRouterProvisioningService()
+        self.usage = KeyUsageCache(self.provisioning)
+        self._users_worksheet = None
+        # Фоновое создание личных ключей: {user_id: задача}, не больше одной попытки одновременно
+        self._key_tasks: Dict[int, asyncio.Task] = {}
+        # Созданные, но еще не записанные в лист ключи {user_id: ответ API}: повторяется только запись
+        self._unsaved_keys: Dict[int, Dict[str, Any]] = {}
+        if sheet is not None:
+            # Уже открытая таблица (общая с GoogleSheetsService или локальная заглушка)
+            self.sheet = sheet
+            return
+        # gspread и google-auth импортируются только при реальном подключении
+        import gspread
+        from google.oauth2.service_account import Credentials
+        
         self.creds = Credentials.from_service_account_file(
             config.GOOGLE_SHEETS_CREDENTIALS, scopes=self.scope
         )
-        self.client = gspread.authorize(self.creds)
+        self.client = gspread.authorize(self.creds, http_client=http_client())
         self.sheet = self.client.open_by_key(config.SPREADSHEET_ID)
-        self.provisioning = OpenRouterProvisioningService()
+    
+    def _worksheet(self):
+        """Лист пользователей (объект кэшируется)"""
+        if self._users_worksheet is None:
+            self._users_worksheet = self.sheet.worksheet("Users")
+        return self._users_worksheet
+    
+    async def warm_up(self):
+        """Открывает лист пользователей заранее"""
+        self._worksheet()
     
     async def get_or_create_user(self, user_id: int, username: str, first_name: str, last_name: str = None) -> User:
         """Получает или создает пользователя"""
-        worksheet = self.sheet.worksheet("Users")
+        worksheet = self._worksheet()
         
         # Ищем существующего пользователя
         try:
             records = worksheet.get_all_records()
+            metrics.add_bytes(estimate_size(r.values() for r in records))
             for record in records:
                 if record['user_id'] == user_id:
-                    return User(
+                    user = User(
                         user_id=user_id,
                         username=record.get('username'),
                         first_name=record['first_name'],
@@ -33,10 +79,15 @@ class UserManager:
                         openrouter_key=record.get('openrouter_key'),
                         key_hash=record.get('key_hash'),
                         credit_limit=float(record.get('credit_limit', 100)),
-                        is_premium=bool(record.get('is_premium', False)),
+                        is_premium=_is_premium(record.get('is_premium', False)),
                         created_at=record.get('created_at'),
                         last_activity=record.get('last_activity')
                     )
+                    credits.set_premium(user_id, user.is_premium)
+                    if not user.key_hash:
+                        # Ключ не успели создать раньше - пробуем снова, не задерживая ответ
+                        self._schedule_key(user)
+                    return user
         except Exception:
             pass
         
@@ -48,20 +99,8 @@ class UserManager:
             last_name=last_name
         )
         
-        # Создаем API ключ для пользователя
-        try:
-            key_response = await self.provisioning.create_user_key(
-                user_id=user_id,
-                user_name=user.display_name,
-                credit_limit=user.credit_limit
-            )
-            
-            user.openrouter_key = key_response['key']
-            user.key_hash = key_response['hash']
-            
-        except Exception as e:
-            # Если не удалось создать ключ, используем общий
-            user.openrouter_key = config.OPENROUTER_API_KEY
+        # Сначала общий ключ: личный создается в фоне и подменяет его, когда готов
+        user.openrouter_key = config.OPENROUTER_API_KEY
         
         # Сохраняем пользователя в Google Sheets
         row = [
@@ -77,12 +116,80 @@ class UserManager:
             datetime.now().isoformat()
         ]
         
-        worksheet.append_row(row)
+        async with write_lock("users"):
+            # Пользователя мог создать воркер другого чата (личного или группы), пока ждали блокировку
+            if cluster.enabled() and worksheet.find(str(user_id), in_column=1) is not None:
+                return await self.get_or_create_user(user_id, username, first_name, last_name)
+            worksheet.append_row(row)
+        metrics.add_bytes(estimate_size([row]))
+        self._schedule_key(user)
         return user
     
+    async def premium_statuses(self) -> Dict[int, bool]:
+        """Статусы премиум всех пользователей {user_id: is_premium} одним чтением листа"""
+        records = self._worksheet().get_all_records()
+        metrics.add_bytes(estimate_size(r.values() for r in records))
+        return {
+            int(record['user_id']): _is_premium(record.get('is_premium', False))
+            for record in records if str(record.get('user_id', '')).strip().isdigit()
+        }
+    
+    def _schedule_key(self, user: User):
+        """Запускает создание личного ключа в фоне, если Provisioning API настроен"""
+        if not config.OPENROUTER_PROVISIONING_KEY or user.user_id in self._key_tasks:
+            return
+        task = self._key_tasks[user.user_id] = spawn(self._provision_key(user))
+        # Завершенная попытка убирается: неудачная запись ключа повторится при следующем входе
+        task.add_done_callback(lambda _: self._key_tasks.pop(user.user_id, None))
+    
+    async def _provision_key(self, user: User):
+        """Создает личный ключ и записывает его в строку пользователя вместо общего"""
+        key_response = self._unsaved_keys.get(user.user_id)
+        if key_response is None:
+            try:
+                key_response = await self.provisioning.create_user_key(
+                    user_id=user.user_id,
+                    user_name=user.display_name,
+                    credit_limit=user.credit_limit
+                )
+            except Exception as e:
+                # Пользователь остается на общем ключе; следующая попытка - при следующем входе
+                logger.warning(f"Key provisioning for user {user.user_id} failed: {e}")
+                return
+            # До записи в лист ключ живет здесь: повторная попытка не создаст второй ключ
+            self._unsaved_keys[user.user_id] = key_response
+        
+        user.openrouter_key = key_response['key']
+        user.key_hash = key_response['hash']
+        self.usage.remember(user.user_id, user.key_hash, key_response.get('data'))
+        try:
+            saved = await quota.run(lambda: self._save_key(user))
+        except Exception as e:
+            logger.error(f"Saving key of user {user.user_id} failed: {e}")
+            return
+        if saved:
+            self._unsaved_keys.pop(user.user_id, None)
+    
+    async def _save_key(self, user: User) -> bool:
+        """Записывает ключ в строку пользователя (отдельная операция очереди квоты)"""
+        worksheet = self._worksheet()
+        cell = worksheet.find(str(user.user_id), in_column=1)
+        if cell is None:
+            logger.warning(f"User {user.user_id} row not found, key {user.key_hash} is not saved")
+            return False
+        worksheet.update_cell(cell.row, KEY_COLUMN, user.openrouter_key)
+        worksheet.update_cell(cell.row, KEY_HASH_COLUMN, user.key_hash)
+        metrics.increment("user_keys_provisioned")
+        return True
+    
+    async def close(self):
+        """Отменяет незавершенное создание ключей"""
+        for task in self._key_tasks.values():
+            task.cancel()
+    
     async def update_user_activity(self, user_id: int):
         """Обновляет время последней активности"""
-        worksheet = self.sheet.worksheet("Users")
+        worksheet = self._worksheet()
         
         try:
             cell = worksheet.find(str(user_id))
@@ -91,10 +198,12 @@ class UserManager:
             pass
     
     async def get_user_usage(self, user_id: int) -> Dict[str, float]:
-        """Получает информацию об использовании API пользователем"""
-        user = await self.get_or_create_user(user_id, "", "")  # Заглушки, т.к. пользователь уже должен существовать
+        """Получает информацию об использовании API пользователем
         
-        if user.key_hash:
-            return await self.provisioning.get_key_usage(user.key_hash)
+        Данные берутся из кэша usage, без чтения листа Users и запроса к Provisioning API.
+        """
+        usage = await self.usage.get_for_user(user_id) if config.OPENROUTER_PROVISIONING_KEY else None
+        if usage is not None:
+            return usage
         
         return {"error": "No dedicated API key"}
\ No newline at end of file
@@ -0,0 +1,42 @@
+"""Создание личных ключей OpenRouter в UserManager"""
+import asyncio
+
+from benchmarks.fakes import FakeSpreadsheet
+from config import config
+from models.user import User
+from services.user_manager import UserManager
+
+
+class FakeProvisioning:
+    """Provisioning API, который только считает созданные ключи"""
+
+    def __init__(self):
+        self.created = 0
+
+    async def create_user_key(self, user_id: int, user_name: str, credit_limit: float = 100):
+        self.created += 1
+        return {"key": f"sk-{self.created}", "hash": f"hash-{self.created}", "data": {}}
+
+
+def test_failed_save_does_not_create_second_key(monkeypatch):
+    monkeypatch.setattr(config, "OPENROUTER_PROVISIONING_KEY", "test")
+    sheet = FakeSpreadsheet()
+    # Строки пользователя нет: запись ключа не удается
+    users = sheet.add_worksheet("Users")
+    users.append_row(["user_id", "username", "first_name", "last_name", "openrouter_key", "key_hash"])
+    manager = UserManager(sheet=sheet)
+    provisioning = manager.provisioning = FakeProvisioning()
+    manager.usage.remember = lambda *args: None
+    user = User(user_id=1, username="u", first_name="U", last_name=None)
+
+    asyncio.run(manager._provision_key(user))
+    asyncio.run(manager._provision_key(user))
+    assert provisioning.created == 1
+    assert manager._unsaved_keys[1]["hash"] == "hash-1"
+
+    # Строка появилась: повторяется только запись того же ключа
+    users.append_row([1, "u", "U", "", "", ""])
+    asyncio.run(manager._provision_key(user))
+    assert provisioning.created == 1
+    assert users.rows[1][5] == "hash-1"
+    assert 1 not in manager._unsaved_keys